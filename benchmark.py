@@ -0,0 +1,106 @@
+"""
+Đo hiệu năng pipeline dịch PDF không cần mạng
+extract_text_with_format -> translate_batch (OfflineBackend) -> create_translated_pdf
+
+Ví dụ:
+    python benchmark.py input.pdf --latency 0.3 --rps 20 --error-rate 0.02 --engine async
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from modules.backends import OfflineBackend
+from modules.translation_memory import TranslationMemory
+from pdf_handler import PDFHandler
+from translator import TextTranslator
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pipeline dịch PDF (offline)")
+    parser.add_argument("pdf", help="File PDF đầu vào")
+    parser.add_argument("-o", "--output", help="File PDF đầu ra (mặc định: file tạm)")
+    parser.add_argument("--engine", choices=["thread", "async"], default="thread")
+    parser.add_argument("--concurrency", type=int, default=64, help="Số request đồng thời (async)")
+    parser.add_argument("--latency", type=float, default=0.2, help="Độ trễ mỗi request (giây)")
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--rps", type=float, default=None, help="Giới hạn request/giây của backend")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--timeout-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--paragraphs", action="store_true",
+                        help="Gộp các dòng thành đoạn văn trước khi dịch")
+    parser.add_argument("--stream", action="store_true",
+                        help="Đọc / dịch / render theo từng cửa sổ trang (bộ nhớ giới hạn)")
+    parser.add_argument("--columnar", action="store_true",
+                        help="Giữ blocks trong BlockStore dạng cột (numpy) thay vì TextBlock")
+    parser.add_argument("--save-profile", choices=["fast", "balanced", "max"], default="balanced",
+                        help="Cách lưu file đầu ra (thời gian lưu <-> kích thước)")
+    parser.add_argument("--keep-cache", action="store_true",
+                        help="Dùng bộ nhớ dịch thật thay vì bộ nhớ tạm trống")
+    args = parser.parse_args()
+
+    backend = OfflineBackend(latency=args.latency, jitter=args.jitter, max_rps=args.rps,
+                             error_rate=args.error_rate, timeout_rate=args.timeout_rate,
+                             seed=args.seed)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        memory = None if args.keep_cache else TranslationMemory(
+            db_path=os.path.join(tmp_dir, "tm.db"))
+        translator = TextTranslator(memory=memory, engine=args.engine,
+                                    async_concurrency=args.concurrency, backend=backend)
+        handler = PDFHandler()
+        handler.save_profile = args.save_profile
+        output = args.output or os.path.join(tmp_dir, "out.pdf")
+
+        timings = {}
+
+        if args.stream:
+            start = time.perf_counter()
+            count = handler.translate_streaming(
+                args.pdf, output, lambda texts: translator.translate_batch(texts, delay=0.05),
+                paragraphs=args.paragraphs)
+            timings["stream"] = time.perf_counter() - start
+            translator.memory.close()
+            print("=" * 50)
+            print(f"Blocks: {count}, request tới backend: {backend.requests}")
+            print(f"{'stream':>10}: {timings['stream']:8.2f} s")
+            return
+
+        start = time.perf_counter()
+        if args.columnar:
+            blocks = handler.extract_block_store(args.pdf)
+        else:
+            blocks = handler.extract_text_with_format(args.pdf)
+        if args.paragraphs and args.columnar:
+            print("--paragraphs chưa hỗ trợ với --columnar, bỏ qua")
+        elif args.paragraphs:
+            blocks = handler.merge_paragraphs(blocks)
+        timings["extract"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        translated = translator.translate_batch([b.text for b in blocks], delay=0.05)
+        timings["translate"] = time.perf_counter() - start
+        for block, text in zip(blocks, translated):
+            block.text = text
+
+        start = time.perf_counter()
+        handler.create_translated_pdf(args.pdf, blocks, output)
+        timings["render"] = time.perf_counter() - start
+
+        translator.memory.close()
+
+        print("=" * 50)
+        print(f"Blocks: {len(blocks)}, request tới backend: {backend.requests}, "
+              f"file đầu ra: {os.path.getsize(output) / (1024 * 1024):.2f} MB")
+        for phase, seconds in timings.items():
+            print(f"{phase:>10}: {seconds:8.2f} s")
+        if timings["translate"] > 0:
+            print(f"Thông lượng dịch: {len(blocks) / timings['translate']:.1f} block/s")
+        print(f"Rate limiter: {translator.limiter.stats()}")
+        print(f"Độ trễ / hedge / circuit breaker: {translator.resilience.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,7 @@ import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import threading
 import os
+import multiprocessing
 import time
 import sys
 from pathlib import Path
@@ -22,7 +23,8 @@ except ImportError:
     print("⚠ pystray không có - không hỗ trợ system tray")
 
 from translator import TextTranslator
-from pdf_handler import PDFHandler
+from pdf_handler import PDFHandler, TextBlock
+from modules.job_journal import JobJournal, JournalState
 from ui.split_tab import SplitPDFTab
 
 
@@ -44,6 +46,11 @@ class PDFTranslatorApp:
         self.output_pdf_path = None
         self.is_processing = False
         self.translation_thread = None
+        self.journal = None  # Journal của job đang chạy (để tiếp tục nếu bị gián đoạn)
+        self.resume_state = None
+        # Bản gốc + bản dịch của phiên bản trước (dịch bản sửa đổi: chỉ dịch trang thay đổi)
+        self.previous_source_path = None
+        self.previous_output_path = None
         
         # System Tray
         self.tray_icon = None
@@ -173,6 +180,64 @@ class PDFTranslatorApp:
             row=1, column=1, sticky=tk.W, padx=10
         )
         
+        # Frame tùy chọn
+        options_frame = ttk.LabelFrame(tab, text="Tùy chọn", padding="10")
+        options_frame.grid(row=3, column=0, columnspan=3, sticky=(tk.W, tk.E), pady=5)
+        
+        self.async_engine_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            options_frame,
+            text="Engine asyncio (nhiều request song song, kết nối keep-alive)",
+            variable=self.async_engine_var
+        ).grid(row=0, column=0, sticky=tk.W)
+        
+        self.paragraph_mode_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            options_frame,
+            text="Gộp các dòng thành đoạn văn (ít request hơn, dịch trọn câu)",
+            variable=self.paragraph_mode_var
+        ).grid(row=1, column=0, sticky=tk.W)
+        
+        # Bảng thuật ngữ: giữ nguyên / dịch cố định
+        glossary_frame = ttk.Frame(options_frame)
+        glossary_frame.grid(row=2, column=0, sticky=(tk.W, tk.E), pady=(5, 0))
+        self.glossary_var = tk.StringVar(value="Bảng thuật ngữ: (không dùng)")
+        ttk.Label(glossary_frame, textvariable=self.glossary_var).pack(side=tk.LEFT)
+        ttk.Button(
+            glossary_frame,
+            text="Chọn File Thuật Ngữ",
+            command=self.select_glossary_file
+        ).pack(side=tk.LEFT, padx=5)
+        
+        # Bản sửa đổi của tài liệu đã dịch: chỉ dịch các trang thay đổi
+        previous_frame = ttk.Frame(options_frame)
+        previous_frame.grid(row=3, column=0, sticky=(tk.W, tk.E), pady=(5, 0))
+        self.previous_var = tk.StringVar(value="Bản trước: (không dùng - dịch toàn bộ)")
+        ttk.Label(previous_frame, textvariable=self.previous_var).pack(side=tk.LEFT)
+        ttk.Button(
+            previous_frame,
+            text="Chọn Bản Trước",
+            command=self.select_previous_version
+        ).pack(side=tk.LEFT, padx=5)
+        
+        # Cách lưu file đầu ra (thời gian lưu <-> kích thước file)
+        save_frame = ttk.Frame(options_frame)
+        save_frame.grid(row=4, column=0, sticky=(tk.W, tk.E), pady=(5, 0))
+        ttk.Label(save_frame, text="Lưu file:").pack(side=tk.LEFT)
+        self.save_profiles = {
+            "Nhanh (file lớn hơn)": "fast",
+            "Cân bằng (subset font)": "balanced",
+            "Nhỏ nhất (chậm hơn)": "max",
+        }
+        self.save_profile_var = tk.StringVar(value="Cân bằng (subset font)")
+        ttk.Combobox(
+            save_frame,
+            textvariable=self.save_profile_var,
+            values=list(self.save_profiles),
+            state="readonly",
+            width=24
+        ).pack(side=tk.LEFT, padx=5)
+        
         # Nút bắt đầu dịch
         self.translate_button = ttk.Button(
             tab,
@@ -180,7 +245,7 @@ class PDFTranslatorApp:
             command=self.start_translation,
             style='Accent.TButton'
         )
-        self.translate_button.grid(row=3, column=0, columnspan=3, pady=20)
+        self.translate_button.grid(row=4, column=0, columnspan=3, pady=20)
         
         # Progress bar
         self.progress_var = tk.DoubleVar()
@@ -191,7 +256,7 @@ class PDFTranslatorApp:
             mode='determinate',
             length=600
         )
-        self.progress_bar.grid(row=4, column=0, columnspan=3, sticky=(tk.W, tk.E), pady=10)
+        self.progress_bar.grid(row=5, column=0, columnspan=3, sticky=(tk.W, tk.E), pady=10)
         
         # Status label
         self.status_var = tk.StringVar(value="Sẵn sàng")
@@ -200,11 +265,11 @@ class PDFTranslatorApp:
             textvariable=self.status_var,
             font=('Arial', 10)
         )
-        self.status_label.grid(row=5, column=0, columnspan=3, pady=5)
+        self.status_label.grid(row=6, column=0, columnspan=3, pady=5)
         
         # Log text area
         log_frame = ttk.LabelFrame(tab, text="Log", padding="5")
-        log_frame.grid(row=6, column=0, columnspan=3, sticky=(tk.W, tk.E, tk.N, tk.S), pady=10)
+        log_frame.grid(row=7, column=0, columnspan=3, sticky=(tk.W, tk.E, tk.N, tk.S), pady=10)
         log_frame.columnconfigure(0, weight=1)
         log_frame.rowconfigure(0, weight=1)
         
@@ -216,7 +281,7 @@ class PDFTranslatorApp:
         self.log_text.config(yscrollcommand=scrollbar.set)
         
         # Cấu hình grid weights
-        tab.rowconfigure(6, weight=1)
+        tab.rowconfigure(7, weight=1)
     
     def select_input_file(self):
         """Chọn file PDF đầu vào"""
@@ -253,6 +318,47 @@ class PDFTranslatorApp:
             self.output_path_var.set(filename)
             self.log(f"File sẽ được lưu tại: {Path(filename).name}")
     
+    def select_glossary_file(self):
+        """Chọn file thuật ngữ (mỗi dòng: thuật ngữ<TAB>bản dịch, không có bản dịch = giữ nguyên)"""
+        filename = filedialog.askopenfilename(
+            title="Chọn file thuật ngữ",
+            filetypes=[("Glossary", "*.tsv *.txt"), ("All files", "*.*")]
+        )
+        
+        if not filename:
+            self.translator.set_glossary(None)
+            self.glossary_var.set("Bảng thuật ngữ: (không dùng)")
+            return
+        
+        try:
+            self.translator.set_glossary(filename)
+            count = len(self.translator.glossary)
+            self.glossary_var.set(f"Bảng thuật ngữ: {Path(filename).name} ({count} thuật ngữ)")
+            self.log(f"Đã nạp {count} thuật ngữ từ {Path(filename).name}")
+        except Exception as e:
+            messagebox.showerror("Lỗi", f"Không đọc được file thuật ngữ:\n{e}")
+    
+    def select_previous_version(self):
+        """Chọn bản gốc và bản dịch của phiên bản trước (hủy = dịch toàn bộ như bình thường)"""
+        source = filedialog.askopenfilename(
+            title="Chọn bản gốc của phiên bản trước",
+            filetypes=[("PDF files", "*.pdf"), ("All files", "*.*")]
+        )
+        output = source and filedialog.askopenfilename(
+            title="Chọn bản dịch của phiên bản trước",
+            filetypes=[("PDF files", "*.pdf"), ("All files", "*.*")]
+        )
+        
+        if not source or not output:
+            self.previous_source_path = self.previous_output_path = None
+            self.previous_var.set("Bản trước: (không dùng - dịch toàn bộ)")
+            return
+        
+        self.previous_source_path = source
+        self.previous_output_path = output
+        self.previous_var.set(f"Bản trước: {Path(source).name} -> {Path(output).name}")
+        self.log(f"Chỉ dịch các trang khác với {Path(source).name}")
+    
     def show_pdf_info(self, pdf_path):
         """Hiển thị thông tin về file PDF"""
         try:
@@ -280,16 +386,53 @@ class PDFTranslatorApp:
             messagebox.showerror("Lỗi", "Vui lòng chọn vị trí lưu file!")
             return
         
-        # Xác nhận
-        result = messagebox.askyesno(
-            "Xác nhận",
-            f"Bắt đầu dịch file có {self.page_count_var.get()} trang?\n"
-            f"Quá trình có thể mất nhiều thời gian."
-        )
-        
-        if not result:
+        if self.previous_source_path:
+            if not messagebox.askyesno(
+                "Xác nhận",
+                f"Dịch bản sửa đổi: chỉ các trang khác với "
+                f"{Path(self.previous_source_path).name} được dịch lại, "
+                f"các trang khác lấy từ {Path(self.previous_output_path).name}.\n\n"
+                f"Tiếp tục?"
+            ):
+                return
+            self.is_processing = True
+            self.translate_button.config(state='disabled')
+            self.log("=" * 50)
+            self.log("DỊCH BẢN SỬA ĐỔI")
+            self.log("=" * 50)
+            self.translation_thread = threading.Thread(target=self.translate_revision)
+            self.translation_thread.daemon = False
+            self.translation_thread.start()
             return
         
+        # Tìm tiến trình dang dở của cùng cặp file vào/ra
+        self.journal = JobJournal.for_job(self.input_pdf_path, self.output_pdf_path)
+        self.resume_state = None
+        state = self.journal.load()
+        
+        if state.blocks is not None:
+            result = messagebox.askyesnocancel(
+                "Tiếp tục",
+                f"Tìm thấy tiến trình dịch dang dở của file này "
+                f"({len(state.translations)}/{len(state.blocks)} khối đã dịch).\n\n"
+                f"Yes: tiếp tục từ chỗ đã dừng\n"
+                f"No: dịch lại từ đầu"
+            )
+            if result is None:
+                return
+            if result:
+                self.resume_state = state
+        else:
+            # Xác nhận
+            result = messagebox.askyesno(
+                "Xác nhận",
+                f"Bắt đầu dịch file có {self.page_count_var.get()} trang?\n"
+                f"Quá trình có thể mất nhiều thời gian."
+            )
+            
+            if not result:
+                return
+        
         # Chạy trong thread riêng
         self.is_processing = True
         self.translate_button.config(state='disabled')
@@ -305,15 +448,29 @@ class PDFTranslatorApp:
     
     def translate_pdf(self):
         """Thực hiện dịch PDF (chạy trong thread riêng)"""
+        journal = self.journal
         try:
-            # Bước 1: Đọc PDF
-            self.update_status("Đang đọc file PDF...")
-            self.log("Bước 1: Đọc file PDF và trích xuất văn bản...")
-            
-            text_blocks = self.pdf_handler.extract_text_with_format(
-                self.input_pdf_path,
-                progress_callback=self.update_read_progress
-            )
+            self.pdf_handler.save_profile = self.save_profiles[self.save_profile_var.get()]
+            state = self.resume_state
+            if state is not None:
+                # Tiếp tục job cũ: dùng lại các block đã trích xuất
+                text_blocks = [TextBlock.from_dict(d) for d in state.blocks]
+                self.log(f"Tiếp tục job cũ: {len(state.translations)}/{len(text_blocks)} "
+                         f"khối đã dịch, {len(state.parts)} đoạn trang đã render")
+            else:
+                # Bước 1: Đọc PDF
+                self.update_status("Đang đọc file PDF...")
+                self.log("Bước 1: Đọc file PDF và trích xuất văn bản...")
+                
+                text_blocks = self.pdf_handler.extract_text_with_format(
+                    self.input_pdf_path,
+                    progress_callback=self.update_read_progress
+                )
+                if self.paragraph_mode_var.get():
+                    text_blocks = self.pdf_handler.merge_paragraphs(text_blocks)
+                journal.start(self.input_pdf_path, self.output_pdf_path,
+                              [block.to_dict() for block in text_blocks])
+                state = JournalState()
             
             total_blocks = len(text_blocks)
             self.log(f"Đã trích xuất {total_blocks} khối văn bản")
@@ -325,15 +482,51 @@ class PDFTranslatorApp:
             
             start_time = time.time()
             
-            translated_texts = self.translator.translate_batch(
-                [block.text for block in text_blocks],
-                delay=0.1,  # Tăng delay lên 100ms để ổn định hơn
-                progress_callback=self.update_translate_progress
-            )
+            self.translator.set_engine("async" if self.async_engine_var.get() else "thread")
+            translations = dict(state.translations)
+            pending = [i for i in range(total_blocks) if i not in translations]
+            done_before = total_blocks - len(pending)
+            if done_before:
+                self.log(f"Bỏ qua {done_before} khối đã dịch, còn {len(pending)} khối")
+            
+            failed = 0
+            if not state.translated:
+                stream = self.translator.translate_batch_stream(
+                    [text_blocks[i].text for i in pending],
+                    delay=0.1,  # Tăng delay lên 100ms để ổn định hơn
+                    progress_callback=lambda current, total: self.update_translate_progress(
+                        done_before + current, total_blocks)
+                )
+                for pos, translated in stream:
+                    index = pending[pos]
+                    translations[index] = translated
+                    # Bản dịch trùng text gốc có thể là lỗi mạng - không ghi để lần sau dịch lại
+                    if translated != text_blocks[index].text:
+                        journal.record_translation(index, translated)
+                # Có request thất bại -> một số đoạn đang là text gốc, chưa coi là dịch xong
+                failed = self.translator.job_stats.get('failed', 0)
+                if not failed:
+                    journal.mark_translated()
+            
+            translated_texts = [translations.get(i, block.text)
+                                for i, block in enumerate(text_blocks)]
             
             elapsed_time = time.time() - start_time
             self.log(f"Thời gian dịch: {elapsed_time/60:.1f} phút")
             
+            stats = self.translator.job_stats
+            if stats:
+                self.log(f"Request đã gửi: {stats.get('api_calls', 0)} "
+                         f"(không cần dịch: {stats.get('skipped', 0)}, "
+                         f"bộ nhớ dịch: {stats.get('cached', 0)} "
+                         f"(gần đúng: {stats.get('fuzzy_reused', 0)}), "
+                         f"trùng lặp: {stats.get('duplicates', 0)}, "
+                         f"dùng chung request: {stats.get('coalesced', 0)})")
+                if stats.get('api_calls'):
+                    self.log(f"Độ trễ request: p50 {stats.get('p50', 0)}s, "
+                             f"p95 {stats.get('p95', 0)}s, p99 {stats.get('p99', 0)}s "
+                             f"(hedge: {stats.get('hedges', 0)}, quá hạn: {stats.get('timeouts', 0)})")
+            
             # Cập nhật text blocks với văn bản đã dịch (giữ nguyên original_text)
             for i, block in enumerate(text_blocks):
                 # original_text đã được lưu trong extract_text_with_format
@@ -345,12 +538,21 @@ class PDFTranslatorApp:
             self.update_status("Đang tạo file PDF mới...")
             self.log("Bước 3: Tạo file PDF với văn bản đã dịch...")
             
+            # Còn đoạn dịch lỗi thì không ghi phần đã render vào journal: lần chạy tiếp
+            # dịch lại các đoạn đó và phải render lại các trang chứa chúng
             self.pdf_handler.create_translated_pdf(
                 self.input_pdf_path,
                 text_blocks,
                 self.output_pdf_path,
-                progress_callback=self.update_create_progress
+                progress_callback=self.update_create_progress,
+                journal=None if failed else journal
             )
+            if failed:
+                journal.close()
+                self.log(f"⚠ {failed} request dịch thất bại, các đoạn liên quan đang giữ text gốc. "
+                         f"Chọn lại cùng file và bấm Yes để dịch tiếp các đoạn này.")
+            else:
+                journal.discard()
             
             # Hoàn thành
             self.progress_var.set(100)
@@ -368,24 +570,85 @@ class PDFTranslatorApp:
             self.root.lift()
             self.root.focus_force()
             
+            retry_note = (f"\n\n⚠ {failed} request thất bại, một số đoạn chưa được dịch.\n"
+                          f"Chọn lại cùng file để dịch tiếp các đoạn này." if failed else "")
             self.root.after(0, lambda: messagebox.showinfo(
                 "✅ Thành công",
                 f"Dịch hoàn tất!\n\n"
                 f"Thời gian: {elapsed_time/60:.1f} phút\n"
-                f"File đã được lưu tại:\n{self.output_pdf_path}"
+                f"File đã được lưu tại:\n{self.output_pdf_path}{retry_note}"
             ))
             
         except Exception as e:
             import traceback
             error_msg = f"Lỗi: {str(e)}\n{traceback.format_exc()}"
             self.log(error_msg)
+            journal.close()
+            self.log("Tiến trình đã được lưu, chọn lại cùng file để tiếp tục lần sau.")
             error_str = str(e)  # Lưu error thành biến local
             self.root.after(0, lambda err=error_str: messagebox.showerror("Lỗi", err))
             
         finally:
+            self.save_memory()
             self.is_processing = False
             self.root.after(0, lambda: self.translate_button.config(state='normal'))
     
+    def translate_revision(self):
+        """Dịch bản sửa đổi: chỉ các trang thay đổi so với bản trước (chạy trong thread riêng)"""
+        try:
+            self.update_status("Đang so sánh với bản trước...")
+            self.pdf_handler.save_profile = self.save_profiles[self.save_profile_var.get()]
+            self.translator.set_engine("async" if self.async_engine_var.get() else "thread")
+            start_time = time.time()
+            
+            stats = self.pdf_handler.create_incremental_pdf(
+                self.previous_source_path,
+                self.previous_output_path,
+                self.input_pdf_path,
+                self.output_pdf_path,
+                translate_fn=lambda texts: self.translator.translate_batch(
+                    texts, delay=0.1, progress_callback=self.update_translate_progress),
+                paragraphs=self.paragraph_mode_var.get(),
+                progress_callback=self.update_create_progress
+            )
+            
+            elapsed_time = time.time() - start_time
+            self.progress_var.set(100)
+            self.update_status("Hoàn thành!")
+            self.log(f"Dùng lại {stats['reused']}/{stats['pages']} trang, "
+                     f"dịch lại {stats['changed']} trang "
+                     f"({'lưu incremental' if stats['incremental'] else 'ghép lại file'})")
+            self.log(f"✅ HOÀN THÀNH sau {elapsed_time/60:.1f} phút: {self.output_pdf_path}")
+            
+            self.root.after(0, lambda: messagebox.showinfo(
+                "✅ Thành công",
+                f"Dịch bản sửa đổi hoàn tất!\n\n"
+                f"Dùng lại {stats['reused']}/{stats['pages']} trang, "
+                f"dịch lại {stats['changed']} trang\n"
+                f"File đã được lưu tại:\n{self.output_pdf_path}"
+            ))
+        
+        except Exception as e:
+            import traceback
+            self.log(f"Lỗi: {str(e)}\n{traceback.format_exc()}")
+            error_str = str(e)
+            self.root.after(0, lambda err=error_str: messagebox.showerror("Lỗi", err))
+        
+        finally:
+            self.save_memory()
+            self.is_processing = False
+            self.root.after(0, lambda: self.translate_button.config(state='normal'))
+    
+    def save_memory(self, close: bool = False):
+        """Ghi bộ nhớ dịch (last_used của các bản dịch vừa dùng lại) xuống đĩa; close khi thoát"""
+        try:
+            if close:
+                self.translator.memory.close()
+            else:
+                self.translator.memory.flush()
+        except Exception as e:
+            print(f"Không lưu được bộ nhớ dịch: {e}")
+    
     def update_read_progress(self, current, total, phase):
         """Cập nhật tiến trình đọc PDF"""
         progress = (current / total) * 33.33  # 33% cho việc đọc
@@ -426,7 +689,8 @@ class PDFTranslatorApp:
                 result = messagebox.askyesno(
                     "Xác nhận thoát",
                     "⚠️ ĐANG XỬ LÝ DỊCH!\n\n"
-                    "Nếu đóng cửa sổ bây giờ, toàn bộ tiến trình sẽ BỊ HỦY!\n\n"
+                    "Nếu đóng cửa sổ bây giờ, quá trình dịch sẽ dừng lại "
+                    "(phần đã dịch được lưu để tiếp tục lần sau).\n\n"
                     "Bạn có chắc muốn THOÁT không?"
                 )
                 if result:
@@ -459,7 +723,7 @@ class PDFTranslatorApp:
             result = messagebox.askyesno(
                 "Xác nhận thoát",
                 "⚠️ ĐANG XỬ LÝ DỊCH!\n\n"
-                "Toàn bộ tiến trình sẽ BỊ HỦY nếu thoát!\n\n"
+                "Tiến trình đã dịch được lưu lại, lần sau chọn lại cùng file để tiếp tục.\n\n"
                 "Bạn có chắc chắn muốn THOÁT?"
             )
             if not result:
@@ -467,6 +731,8 @@ class PDFTranslatorApp:
             
             self.log("❌ Người dùng hủy quá trình dịch!")
             self.is_processing = False
+            if self.journal:
+                self.journal.flush()
         
         # Dừng tray icon nếu có
         if self.tray_icon:
@@ -532,8 +798,13 @@ def main():
     """Hàm main để chạy ứng dụng"""
     root = tk.Tk()
     app = PDFTranslatorApp(root)
-    root.mainloop()
+    try:
+        root.mainloop()
+    finally:
+        app.save_memory(close=True)
 
 
 if __name__ == "__main__":
+    # Cần cho process đọc PDF song song khi đóng gói thành exe (PyInstaller)
+    multiprocessing.freeze_support()
     main()
@@ -0,0 +1,24 @@
+"""
+Đường dẫn dữ liệu của ứng dụng (cache, bộ nhớ dịch, cấu hình)
+"""
+
+import os
+import platform
+
+
+APP_DIR_NAME = "PDF_Translator"
+
+
+def get_app_data_dir() -> str:
+    """Thư mục lưu dữ liệu lâu dài của ứng dụng (tự tạo nếu chưa có)"""
+    if platform.system() == "Windows":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+        path = os.path.join(base, APP_DIR_NAME)
+    elif platform.system() == "Darwin":
+        path = os.path.join(os.path.expanduser("~/Library/Application Support"), APP_DIR_NAME)
+    else:  # Linux
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+        path = os.path.join(base, APP_DIR_NAME)
+
+    os.makedirs(path, exist_ok=True)
+    return path
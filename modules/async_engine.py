@@ -0,0 +1,269 @@
+"""
+Engine dịch asyncio - nhiều request đồng thời trên các kết nối keep-alive
+- Một phiên async của backend cho cả job (GoogleBackend: aiohttp.ClientSession,
+  kết nối TCP/TLS được tái sử dụng)
+- Số request đồng thời đặt riêng, không phụ thuộc số CPU core
+- Cùng hợp đồng translate_batch(texts, progress_callback) với TextTranslator
+"""
+
+import asyncio
+import queue
+import threading
+import time
+from typing import AsyncIterator, Iterator, List, Optional, Tuple
+
+from modules.rate_limiter import classify_error, CLIENT
+
+
+class AsyncTranslationEngine:
+    """Dịch batch bằng asyncio, dùng lại bộ nhớ dịch và cách gộp request của TextTranslator"""
+
+    def __init__(self, translator, concurrency: int = 64,
+                 connections: Optional[int] = None, timeout: float = 30):
+        """
+        Args:
+            translator: TextTranslator sở hữu engine (bộ nhớ dịch, batch, đánh dấu gộp)
+            concurrency: Số request đang bay cùng lúc
+            connections: Số kết nối keep-alive tối đa trong pool (mặc định = concurrency)
+            timeout: Timeout mỗi request (giây)
+        """
+        self.translator = translator
+        self.concurrency = concurrency
+        self.connections = connections or concurrency
+        self.timeout = timeout
+        self.max_retries = 3
+
+    def translate_batch(self, texts: List[str],
+                        progress_callback: Optional[callable] = None) -> List[str]:
+        """Dịch nhiều text, chạy event loop riêng (gọi từ thread thường)"""
+        return asyncio.run(self.translate_batch_async(texts, progress_callback))
+
+    async def translate_batch_async(self, texts: List[str],
+                                    progress_callback: Optional[callable] = None) -> List[str]:
+        """Phiên bản coroutine của translate_batch (dùng khi đã có event loop)"""
+        total = len(texts)
+        translated_texts = list(texts)
+        async for idx, translated in self.translate_stream_async(texts, progress_callback):
+            translated_texts[idx] = translated
+
+        if progress_callback:
+            progress_callback(total, total)
+        return translated_texts
+
+    def translate_stream(self, texts: List[str],
+                         progress_callback: Optional[callable] = None
+                         ) -> Iterator[Tuple[int, str]]:
+        """
+        Generator đồng bộ: event loop chạy ở thread riêng, kết quả chuyển qua queue
+        (cùng hợp đồng với TextTranslator.translate_batch_stream)
+        """
+        results: "queue.Queue" = queue.Queue()
+        done = object()
+        stop = threading.Event()
+        errors = []
+
+        def runner():
+            async def pump():
+                async for item in self.translate_stream_async(texts, progress_callback):
+                    if stop.is_set():
+                        break
+                    results.put(item)
+            try:
+                asyncio.run(pump())
+            except Exception as e:
+                errors.append(e)
+            finally:
+                results.put(done)
+
+        thread = threading.Thread(target=runner, daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = results.get()
+                if item is done:
+                    break
+                yield item
+        finally:
+            stop.set()
+        if errors:
+            raise errors[0]
+
+    async def translate_stream_async(self, texts: List[str],
+                                     progress_callback: Optional[callable] = None
+                                     ) -> AsyncIterator[Tuple[int, str]]:
+        """Async generator trả về (index, bản dịch) khi từng batch xong"""
+        tr = self.translator
+        calls_before = tr.api_calls
+        total = len(texts)
+
+        plan = tr._plan_batches(texts)
+        batches = plan.batches
+        completed = 0
+        for item in plan.ready:
+            completed += 1
+            yield item
+        if progress_callback and completed:
+            progress_callback(completed, total)
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        backend = tr.backend
+
+        async with backend.async_session(connections=self.connections, timeout=self.timeout):
+
+            async def run_batch(batch):
+                try:
+                    results = await self._translate_batch_items(backend, semaphore, batch)
+                except Exception as e:
+                    print(f"Lỗi batch async: {e}")
+                    tr._record_failure()
+                    results = list(batch)
+                return batch, results
+
+            tasks = [asyncio.ensure_future(run_batch(batch)) for batch in batches]
+            try:
+                for next_done in asyncio.as_completed(tasks):
+                    batch, results = await next_done
+
+                    originals = dict(batch)
+                    tr.memory.put_many(
+                        (tr._normalize_text(originals[idx]), translated)
+                        for idx, translated in results
+                        if translated != originals[idx]
+                        and tr.masker.is_intact(originals[idx], translated)
+                    )
+
+                    # Khôi phục placeholder, các text trùng nội dung nhận chung bản dịch.
+                    # Chạy ngoài event loop: text bị hỏng placeholder được dịch lại (chặn)
+                    finished = await asyncio.get_running_loop().run_in_executor(
+                        None, lambda: list(tr._finish_batch(plan, batch, results)))
+                    for item in finished:
+                        completed += 1
+                        yield item
+
+                    if progress_callback:
+                        progress_callback(completed, total)
+            finally:
+                # Người dùng dừng sớm -> hủy các batch còn lại
+                for task in tasks:
+                    task.cancel()
+                tr._report_stats(total, calls_before)
+
+    async def _translate_batch_items(self, backend, semaphore, batch: List[tuple]) -> List[tuple]:
+        """Dịch một batch: text rỗng giữ nguyên, phần còn lại gộp vào một request"""
+        results = [(idx, text) for idx, text in batch if not text or not text.strip()]
+        items = [(idx, text) for idx, text in batch if text and text.strip()]
+        if not items:
+            return results
+
+        if self.translator.packed_requests:
+            translated = await self._translate_packed(backend, semaphore, items)
+            # Placeholder bị mất khi dịch gộp -> dịch riêng đoạn đó một lần nữa
+            originals = dict(items)
+            broken = [(pos, idx) for pos, (idx, text) in enumerate(translated)
+                      if text != originals[idx]
+                      and not self.translator.masker.is_intact(originals[idx], text)]
+            retried = await asyncio.gather(
+                *(self._translate_single(backend, semaphore, originals[idx]) for _, idx in broken))
+            for (pos, idx), text in zip(broken, retried):
+                translated[pos] = (idx, text)
+            results.extend(translated)
+        else:
+            translated = await asyncio.gather(
+                *(self._translate_single(backend, semaphore, text) for _, text in items))
+            results.extend(zip((idx for idx, _ in items), translated))
+        return results
+
+    async def _translate_packed(self, backend, semaphore, items: List[tuple]) -> List[tuple]:
+        """Giống TextTranslator._translate_packed: chia đôi phần bị hỏng đánh dấu"""
+        tr = self.translator
+        if len(items) == 1:
+            idx, text = items[0]
+            return [(idx, await self._translate_single(backend, semaphore, text))]
+
+        if tr.backend.supports_batch:
+            texts = [text for _, text in items]
+            loop = asyncio.get_running_loop()
+            translated = await loop.run_in_executor(
+                None, tr._call_with_retry, lambda: tr.backend.translate_batch(texts), texts,
+                3, sum(len(t) for t in texts))
+            return list(zip((idx for idx, _ in items), translated))
+
+        packed = tr._pack_segments(items)
+        translated = await self._fetch(backend, semaphore, packed)
+        if translated == packed:
+            return list(items)
+
+        parts = tr._unpack_segments(translated, len(items))
+        results = []
+        broken = []
+        for (idx, text), part in zip(items, parts):
+            if part is None:
+                broken.append((idx, text))
+            else:
+                results.append((idx, part))
+        tr.autotuner.record_packing(len(packed), len(items), len(broken))
+
+        if broken:
+            mid = len(broken) // 2
+            halves = [h for h in (broken[:mid], broken[mid:]) if h]
+            for part in await asyncio.gather(
+                    *(self._translate_packed(backend, semaphore, h) for h in halves)):
+                results.extend(part)
+
+        return results
+
+    async def _translate_single(self, backend, semaphore, text: str) -> str:
+        """Dịch một text, text dài thì chia câu và dịch song song các đoạn"""
+        tr = self.translator
+        if len(text) <= tr.max_chunk_size:
+            return await self._fetch(backend, semaphore, text)
+
+        chunks = []
+        current = ""
+        for sentence in tr._split_into_sentences(text):
+            if len(current) + len(sentence) > tr.max_chunk_size and current:
+                chunks.append(current)
+                current = sentence
+            else:
+                current += sentence
+        if current:
+            chunks.append(current)
+
+        parts = await asyncio.gather(*(self._fetch(backend, semaphore, c) for c in chunks))
+        return " ".join(parts)
+
+    async def _fetch(self, backend, semaphore, text: str) -> str:
+        """Một request qua backend (backend đang mở phiên async), có retry"""
+        tr = self.translator
+
+        permanent = False
+        for attempt in range(self.max_retries):
+            if not await tr.resilience.wait_until_allowed_async():
+                print("Backend lỗi liên tục (circuit breaker đang mở), giữ text gốc")
+                break
+            try:
+                async with semaphore, tr.limiter.slot_async():
+                    with tr._stats_lock:
+                        tr.api_calls += 1
+                    start = time.perf_counter()
+                    result = await tr.resilience.call_async(lambda: backend.translate_async(text))
+                if result:
+                    tr.autotuner.record(len(text), time.perf_counter() - start, ok=True)
+                    tr.limiter.on_success()
+                    return result
+            except Exception as e:
+                kind = classify_error(e)
+                retry_after = getattr(e, "retry_after", None)
+                tr.autotuner.record(len(text), 0.0, ok=False, kind=kind)
+                tr.limiter.on_error(kind, retry_after)
+                if attempt == 0:
+                    print(f"Lỗi dịch async [{kind}] (sẽ retry): {str(e)[:100]}")
+                if kind == CLIENT:
+                    permanent = True
+                    break
+                if attempt < self.max_retries - 1:
+                    await asyncio.sleep(tr.limiter.backoff(attempt, retry_after))
+
+        if not permanent:
+            tr._record_failure()
+        return text
@@ -0,0 +1,207 @@
+"""
+Tự điều chỉnh kích thước batch và số request đồng thời theo độ trễ thực tế
+- Trong lúc dịch: ghi nhận độ trễ, số ký tự, lỗi của từng request và số đoạn bị hỏng
+  đánh dấu khi dịch gộp
+- Cuối job: ước lượng độ trễ = a + b * số ký tự, chọn batch_char_limit cho số ký tự
+  dịch được mỗi giây cao nhất; lưu tốc độ / cửa sổ mà rate limiter đã hội tụ
+- Lưu vào file JSON trong thư mục dữ liệu ứng dụng, lần chạy sau bắt đầu từ đó
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from modules.app_paths import get_app_data_dir
+from modules.rate_limiter import CLIENT
+
+
+class Autotuner:
+    """Học batch_char_limit / workers cho một backend"""
+
+    MIN_SAMPLES = 20  # Số request thành công tối thiểu để điều chỉnh
+    MAX_STEP = 1.5  # Mỗi job chỉ thay đổi batch tối đa x1.5 (hoặc /1.5)
+
+    def __init__(self, key: str, path: Optional[str] = None, default_chars: int = 3000,
+                 min_chars: int = 500, max_chars: int = 4500):
+        """
+        Args:
+            key: Tên backend (mỗi backend học riêng)
+            path: File JSON lưu kết quả (mặc định trong thư mục dữ liệu ứng dụng)
+            default_chars: batch_char_limit khi chưa học được gì
+            min_chars, max_chars: Giới hạn batch_char_limit
+        """
+        self.key = key
+        self.path = path or os.path.join(get_app_data_dir(), "autotune.json")
+        self.min_chars = min_chars
+        self.max_chars = max(min_chars, max_chars)
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=5000)  # (ký tự, độ trễ) của request thành công
+        self._errors = 0
+        self._client_error_chars: Optional[int] = None  # Payload nhỏ nhất bị từ chối
+        self._packed_segments = 0
+        self._broken_segments = 0
+        self._packed_chars = 0
+        self._packed_requests = 0
+
+        self.settings = {"batch_chars": default_chars}
+        self.settings.update(self._load().get(key, {}))
+        self.max_chars = max(min_chars, min(self.max_chars, self.settings.get("max_chars", max_chars)))
+        self.settings["batch_chars"] = self._clamp(self.settings["batch_chars"])
+
+    # ------------------------------------------------------------------ #
+    # Giá trị khởi đầu cho job
+    # ------------------------------------------------------------------ #
+    @property
+    def batch_char_limit(self) -> int:
+        return int(self.settings["batch_chars"])
+
+    def workers(self, default: int, limit: int) -> int:
+        """Số worker của engine thread: theo cửa sổ đã học (+25% để AIMD còn tăng được)"""
+        window = self.settings.get("window:thread")
+        if not window:
+            return default
+        return max(1, min(limit, math.ceil(window * 1.25)))
+
+    def start_rate(self, default: float, engine: str) -> float:
+        """Tốc độ (req/s) khởi đầu của engine: tốc độ đã học nếu có"""
+        return self.settings.get(f"rate:{engine}") or default
+
+    def start_window(self, default: float, engine: str) -> float:
+        """Số request đồng thời khởi đầu của engine"""
+        return self.settings.get(f"window:{engine}") or default
+
+    # ------------------------------------------------------------------ #
+    # Ghi nhận trong lúc dịch (thread-safe)
+    # ------------------------------------------------------------------ #
+    def record(self, chars: int, latency: float, ok: bool, kind: Optional[str] = None):
+        """Một request: số ký tự gửi đi, độ trễ (giây), thành công hay không"""
+        with self._lock:
+            if ok:
+                self._samples.append((chars, latency))
+                return
+            self._errors += 1
+            if kind == CLIENT and chars:
+                # Thường là payload quá lớn (413)
+                if self._client_error_chars is None or chars < self._client_error_chars:
+                    self._client_error_chars = chars
+
+    def record_packing(self, chars: int, segments: int, broken: int):
+        """Một request dịch gộp: bao nhiêu đoạn bị hỏng đánh dấu (phải gửi lại)"""
+        with self._lock:
+            self._packed_requests += 1
+            self._packed_chars += chars
+            self._packed_segments += segments
+            self._broken_segments += broken
+
+    def reset(self):
+        """Xóa số liệu của job trước"""
+        with self._lock:
+            self._samples.clear()
+            self._errors = 0
+            self._client_error_chars = None
+            self._packed_segments = self._broken_segments = 0
+            self._packed_chars = self._packed_requests = 0
+
+    # ------------------------------------------------------------------ #
+    # Cuối job
+    # ------------------------------------------------------------------ #
+    def finish(self, limiter_stats: Dict[str, float], engine: str) -> Dict[str, float]:
+        """Tính thông số mới từ số liệu của job, lưu file và trả về thông số"""
+        with self._lock:
+            samples = list(self._samples)
+            client_error_chars = self._client_error_chars
+            broken_rate = self._broken_segments / self._packed_segments \
+                if self._packed_segments else 0.0
+            mean_packed = self._packed_chars / self._packed_requests \
+                if self._packed_requests else 0.0
+
+        if client_error_chars:
+            self.max_chars = self._clamp(int(client_error_chars * 0.8))
+            self.settings["max_chars"] = self.max_chars
+
+        if len(samples) >= self.MIN_SAMPLES:
+            a, b = self._fit_latency(samples)
+            best = self._best_batch_chars(a, b, broken_rate, mean_packed)
+            current = self.settings["batch_chars"]
+            best = min(max(best, current / self.MAX_STEP), current * self.MAX_STEP)
+            self.settings["batch_chars"] = self._clamp(int(best))
+            self.settings["latency_base"] = round(a, 4)
+            self.settings["latency_per_kchar"] = round(b * 1000, 4)
+
+        # Tốc độ / cửa sổ rate limiter hội tụ được - trung bình với giá trị cũ cho ổn định
+        if len(samples) >= self.MIN_SAMPLES:
+            for name in ("rate", "window"):
+                old = self.settings.get(f"{name}:{engine}")
+                new = limiter_stats[name]
+                self.settings[f"{name}:{engine}"] = round((old + new) / 2 if old else new, 2)
+
+        self.settings["batch_chars"] = self._clamp(self.settings["batch_chars"])
+        self.settings["updated"] = int(time.time())
+        self._save()
+        # Chưa đủ mẫu để học tốc độ / cửa sổ thì không có giá trị
+        rate = self.settings.get(f"rate:{engine}")
+        window = self.settings.get(f"window:{engine}")
+        print(f"Autotune: batch {self.settings['batch_chars']} ký tự, "
+              f"tốc độ {f'{rate} req/s' if rate is not None else 'n/a'}, "
+              f"cửa sổ {window if window is not None else 'n/a'} "
+              f"({len(samples)} mẫu, {broken_rate:.0%} đoạn hỏng đánh dấu)")
+        return dict(self.settings)
+
+    def _clamp(self, chars: int) -> int:
+        return int(min(max(chars, self.min_chars), self.max_chars))
+
+    @staticmethod
+    def _fit_latency(samples):
+        """Hồi quy tuyến tính độ trễ = a + b * ký tự (a: chi phí cố định, b: theo ký tự)"""
+        n = len(samples)
+        mean_x = sum(c for c, _ in samples) / n
+        mean_y = sum(t for _, t in samples) / n
+        var_x = sum((c - mean_x) ** 2 for c, _ in samples)
+        if var_x <= 0:
+            return mean_y, 0.0
+        b = sum((c - mean_x) * (t - mean_y) for c, t in samples) / var_x
+        b = max(b, 0.0)
+        a = max(mean_y - b * mean_x, 0.001)
+        return a, b
+
+    def _best_batch_chars(self, a: float, b: float, broken_rate: float,
+                          mean_packed: float) -> int:
+        """
+        Chọn batch cho số ký tự dịch đúng mỗi giây cao nhất:
+        c * (1 - tỉ lệ hỏng(c)) / (a + b * c), tỉ lệ hỏng coi như tăng tuyến tính theo c
+        """
+        per_char_broken = broken_rate / mean_packed if mean_packed else 0.0
+        best, best_score = self.min_chars, 0.0
+        for c in range(self.min_chars, self.max_chars + 1, 250):
+            useful = c * max(0.0, 1.0 - per_char_broken * c)
+            score = useful / (a + b * c)
+            if score > best_score:
+                best, best_score = c, score
+        return best
+
+    # ------------------------------------------------------------------ #
+    # Lưu / đọc
+    # ------------------------------------------------------------------ #
+    def _load(self) -> Dict:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        data = self._load()
+        data[self.key] = self.settings
+        tmp_path = self.path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Không lưu được thông số autotune: {e}")
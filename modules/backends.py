@@ -0,0 +1,212 @@
+"""
+Backend dịch thuật có thể thay thế
+- TranslationBackend: giao diện chung (dịch đơn, dịch batch, async, giới hạn payload/đồng thời)
+- GoogleBackend: Google Translate qua deep_translator (và aiohttp cho engine async)
+- OfflineBackend: backend cục bộ, tất định, giả lập độ trễ / giới hạn tốc độ / lỗi
+  để đo hiệu năng cả pipeline mà không cần mạng
+"""
+
+import asyncio
+import html
+import random
+import re
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
+from deep_translator import GoogleTranslator
+
+from modules.rate_limiter import HTTPStatusError
+
+try:
+    import aiohttp
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    AIOHTTP_AVAILABLE = False
+
+
+class TranslationBackend:
+    """Giao diện chung cho mọi backend dịch"""
+
+    name = "base"
+    max_payload_chars = 4500   # Số ký tự tối đa mỗi request
+    max_concurrency = 12       # Gợi ý số request đồng thời backend chịu được
+    supports_batch = False     # True nếu translate_batch chỉ tốn MỘT request
+
+    def __init__(self, source: str = "en", target: str = "vi"):
+        self.source = source
+        self.target = target
+
+    def translate(self, text: str) -> str:
+        """Dịch một đoạn text (raise exception khi lỗi để limiter phân loại)"""
+        raise NotImplementedError
+
+    def translate_batch(self, texts: List[str]) -> List[str]:
+        """Dịch nhiều đoạn, mặc định gọi translate() lần lượt"""
+        return [self.translate(text) for text in texts]
+
+    @asynccontextmanager
+    async def async_session(self, connections: int = 64, timeout: float = 30):
+        """Tài nguyên dùng chung cho một lượt dịch async (vd. pool kết nối)"""
+        yield
+
+    async def translate_async(self, text: str) -> str:
+        """Dịch async, mặc định chạy translate() trong thread pool của event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.translate, text)
+
+
+class GoogleBackend(TranslationBackend):
+    """Google Translate (bản web miễn phí)"""
+
+    name = "google"
+    max_payload_chars = 4500
+    max_concurrency = 12
+
+    URL = "https://translate.google.com/m"
+    # Giống deep_translator: kết quả nằm trong div "result-container" (hoặc "t0")
+    RESULT_RE = re.compile(
+        r'<div[^>]*class="(?:result-container|t0)"[^>]*>(.*?)</div>', re.DOTALL)
+    USER_AGENT = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+                  "AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36")
+
+    def __init__(self, source: str = "en", target: str = "vi"):
+        super().__init__(source, target)
+        self._session = None
+        self._warned_no_aiohttp = False
+
+    def translate(self, text: str) -> str:
+        return GoogleTranslator(source=self.source, target=self.target).translate(text)
+
+    @asynccontextmanager
+    async def async_session(self, connections: int = 64, timeout: float = 30):
+        """Một aiohttp.ClientSession cho cả lượt dịch: kết nối TCP/TLS được giữ và tái sử dụng"""
+        if not AIOHTTP_AVAILABLE:
+            if not self._warned_no_aiohttp:
+                print("⚠ Chưa cài aiohttp - engine async sẽ gọi deep_translator trong thread pool")
+                self._warned_no_aiohttp = True
+            yield
+            return
+
+        connector = aiohttp.TCPConnector(
+            limit=connections, keepalive_timeout=60, ttl_dns_cache=300)
+        client_timeout = aiohttp.ClientTimeout(total=timeout)
+        async with aiohttp.ClientSession(connector=connector, timeout=client_timeout,
+                                         headers={"User-Agent": self.USER_AGENT}) as session:
+            self._session = session
+            try:
+                yield
+            finally:
+                self._session = None
+
+    async def translate_async(self, text: str) -> str:
+        if self._session is None:
+            return await super().translate_async(text)
+
+        params = {"sl": self.source, "tl": self.target, "q": text}
+        async with self._session.get(self.URL, params=params) as resp:
+            if resp.status != 200:
+                raise HTTPStatusError(resp.status, resp.headers.get("Retry-After"))
+            body = await resp.text()
+
+        match = self.RESULT_RE.search(body)
+        return html.unescape(match.group(1)).strip() if match else ""
+
+
+class OfflineBackend(TranslationBackend):
+    """
+    Backend giả lập tất định - không cần mạng
+
+    "Bản dịch" đổi nguyên âm sang chữ có dấu tiếng Việt (a->ă, e->ê, o->ô...), giữ nguyên
+    độ dài, số, dấu câu và các đánh dấu [[n]], nên kết quả lặp lại được giữa các lần chạy
+    và vẫn kiểm tra được việc render font tiếng Việt.
+    """
+
+    name = "offline"
+    VOWELS = str.maketrans("aeiouyAEIOUY", "ăêìôưýĂÊÌÔƯÝ")
+    # Không đụng vào đánh dấu gộp request và placeholder
+    PROTECTED_RE = re.compile(r"(\[\[[^\]]*\]\]|⟦[^⟧]*⟧)")
+
+    def __init__(self, source: str = "en", target: str = "vi",
+                 latency: float = 0.2, latency_per_char: float = 0.00002,
+                 jitter: float = 0.05, max_rps: Optional[float] = None,
+                 error_rate: float = 0.0, timeout_rate: float = 0.0,
+                 max_payload_chars: int = 4500, max_concurrency: int = 64,
+                 supports_batch: bool = False, seed: int = 0):
+        """
+        Args:
+            latency: Độ trễ cơ bản mỗi request (giây)
+            latency_per_char: Độ trễ thêm theo mỗi ký tự payload
+            jitter: Dao động ngẫu nhiên (giây) cộng vào độ trễ
+            max_rps: Số request/giây tối đa, vượt quá trả về 429 kèm Retry-After
+            error_rate: Tỉ lệ request lỗi 503
+            timeout_rate: Tỉ lệ request bị timeout
+            max_payload_chars: Payload lớn hơn sẽ bị từ chối (413)
+            max_concurrency: Gợi ý số request đồng thời
+            supports_batch: translate_batch tính là một request duy nhất
+            seed: Hạt giống cho các lỗi/độ trễ ngẫu nhiên
+        """
+        super().__init__(source, target)
+        self.latency = latency
+        self.latency_per_char = latency_per_char
+        self.jitter = jitter
+        self.max_rps = max_rps
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.max_payload_chars = max_payload_chars
+        self.max_concurrency = max_concurrency
+        self.supports_batch = supports_batch
+
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._window_count = 0
+        self.requests = 0
+
+    def _fake_translate(self, text: str) -> str:
+        parts = self.PROTECTED_RE.split(text)
+        return "".join(
+            part if i % 2 else part.translate(self.VOWELS)
+            for i, part in enumerate(parts)
+        )
+
+    def _admit(self, payload_chars: int) -> float:
+        """Kiểm tra giới hạn + chọn lỗi giả lập, trả về độ trễ của request"""
+        with self._lock:
+            self.requests += 1
+            roll = self._rng.random()
+            delay = (self.latency + payload_chars * self.latency_per_char
+                     + self._rng.uniform(0, self.jitter))
+
+            if self.max_rps:
+                now = time.monotonic()
+                if now - self._window_start >= 1.0:
+                    self._window_start = now
+                    self._window_count = 0
+                self._window_count += 1
+                if self._window_count > self.max_rps:
+                    retry_after = 1.0 - (now - self._window_start)
+                    raise HTTPStatusError(429, f"{retry_after:.3f}")
+
+        if payload_chars > self.max_payload_chars:
+            raise HTTPStatusError(413)
+        if roll < self.error_rate:
+            raise HTTPStatusError(503)
+        if roll < self.error_rate + self.timeout_rate:
+            raise TimeoutError("Offline backend: request timed out")
+        return delay
+
+    def translate(self, text: str) -> str:
+        time.sleep(self._admit(len(text)))
+        return self._fake_translate(text)
+
+    def translate_batch(self, texts: List[str]) -> List[str]:
+        if not self.supports_batch:
+            return super().translate_batch(texts)
+        time.sleep(self._admit(sum(len(t) for t in texts)))
+        return [self._fake_translate(t) for t in texts]
+
+    async def translate_async(self, text: str) -> str:
+        await asyncio.sleep(self._admit(len(text)))
+        return self._fake_translate(text)
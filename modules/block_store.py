@@ -0,0 +1,227 @@
+"""
+Lưu thông tin text block dạng cột (columnar) bằng NumPy
+- Mỗi thuộc tính là một mảng: bbox, cỡ chữ, màu (int gốc), flags, số trang...
+  thay vì hàng trăm nghìn object TextBlock với tuple bbox / màu riêng
+- Tên font được intern vào một bảng, mỗi block chỉ giữ chỉ số
+- Text gốc giữ một lần; bản dịch chỉ lưu khi khác text gốc
+- BlockView: "hàng" nhẹ có cùng thuộc tính như TextBlock, dùng được trực tiếp với
+  PDFHandler._process_page / _insert_text
+- Nhóm theo trang, sắp theo thứ tự đọc, đổi màu sang RGB: tính trên cả mảng một lần
+"""
+
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+
+class BlockView:
+    """Một hàng của BlockStore, giao diện giống TextBlock"""
+
+    __slots__ = ("_store", "_index")
+
+    def __init__(self, store: "BlockStore", index: int):
+        self._store = store
+        self._index = index
+
+    @property
+    def text(self) -> str:
+        translated = self._store.translations[self._index]
+        return self._store.texts[self._index] if translated is None else translated
+
+    @text.setter
+    def text(self, value: str):
+        self._store.set_translation(self._index, value)
+
+    @property
+    def original_text(self) -> str:
+        return self._store.texts[self._index]
+
+    @property
+    def bbox(self) -> Tuple[float, float, float, float]:
+        return tuple(self._store.bbox[self._index].tolist())
+
+    @property
+    def font_size(self) -> float:
+        return float(self._store.font_size[self._index])
+
+    @property
+    def font_name(self) -> str:
+        return self._store.font_names[self._store.font_id[self._index]]
+
+    @property
+    def color(self) -> Tuple[float, float, float]:
+        return tuple(self._store.colors_rgb()[self._index].tolist())
+
+    @property
+    def page_num(self) -> int:
+        return int(self._store.page[self._index])
+
+    @property
+    def flags(self) -> int:
+        return int(self._store.flags[self._index])
+
+    @property
+    def block_num(self) -> int:
+        return int(self._store.block_num[self._index])
+
+    @property
+    def line_num(self) -> int:
+        return int(self._store.line_num[self._index])
+
+    @property
+    def line_count(self) -> int:
+        return int(self._store.line_count[self._index])
+
+
+class BlockStore:
+    """Tập text block dạng cột, thêm dần bằng append()"""
+
+    def __init__(self, capacity: int = 1024):
+        if not NUMPY_AVAILABLE:
+            raise ImportError("BlockStore cần numpy (pip install numpy)")
+        self._size = 0
+        # MuPDF tính tọa độ bằng float 32-bit nên float32 không mất chính xác
+        self.bbox = np.zeros((capacity, 4), dtype=np.float32)
+        self.font_size = np.zeros(capacity, dtype=np.float32)
+        self.color = np.zeros(capacity, dtype=np.uint32)  # 0xRRGGBB như PyMuPDF trả về
+        self.page = np.zeros(capacity, dtype=np.int32)
+        self.flags = np.zeros(capacity, dtype=np.int32)
+        self.block_num = np.zeros(capacity, dtype=np.int32)
+        self.line_num = np.zeros(capacity, dtype=np.int32)
+        self.line_count = np.zeros(capacity, dtype=np.int32)
+        self.font_id = np.zeros(capacity, dtype=np.int32)
+        self.font_names: List[str] = []
+        self._font_ids: Dict[str, int] = {}
+        self.texts: List[str] = []
+        self.translations: List[Optional[str]] = []  # None: giữ text gốc
+        self._rgb = None  # Cache của colors_rgb()
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, index: int) -> BlockView:
+        if not -self._size <= index < self._size:
+            raise IndexError(index)
+        return BlockView(self, index % self._size)
+
+    def __iter__(self) -> Iterator[BlockView]:
+        return (BlockView(self, i) for i in range(self._size))
+
+    # ------------------------------------------------------------------ #
+    # Thêm dữ liệu
+    # ------------------------------------------------------------------ #
+    def append(self, text: str, bbox: Sequence[float], font_size: float, font_name: str,
+               color: int, page_num: int, flags: int = 0, block_num: int = -1,
+               line_num: int = 0, line_count: int = 1) -> int:
+        """Thêm một block (color là int 0xRRGGBB), trả về chỉ số"""
+        if self._size == len(self.page):
+            self._grow()
+        i = self._size
+        self.bbox[i] = bbox
+        self.font_size[i] = font_size
+        self.color[i] = color
+        self.page[i] = page_num
+        self.flags[i] = flags
+        self.block_num[i] = block_num
+        self.line_num[i] = line_num
+        self.line_count[i] = line_count
+        self.font_id[i] = self._intern_font(font_name)
+        self.texts.append(text)
+        self.translations.append(None)
+        self._size += 1
+        self._rgb = None
+        return i
+
+    def _intern_font(self, font_name: str) -> int:
+        font_id = self._font_ids.get(font_name)
+        if font_id is None:
+            font_id = self._font_ids[font_name] = len(self.font_names)
+            self.font_names.append(font_name)
+        return font_id
+
+    def _grow(self):
+        capacity = max(1024, len(self.page) * 2)
+        for name in ("bbox", "font_size", "color", "page", "flags", "block_num",
+                     "line_num", "line_count", "font_id"):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def set_translation(self, index: int, text: str):
+        """Ghi bản dịch (trùng text gốc thì không lưu thêm bản sao)"""
+        self.translations[index] = None if text == self.texts[index] else text
+
+    def set_translations(self, translations: Sequence[str]):
+        """Ghi bản dịch cho tất cả block theo thứ tự"""
+        for index, text in enumerate(translations):
+            self.set_translation(index, text)
+
+    # ------------------------------------------------------------------ #
+    # Chuyển đổi với TextBlock
+    # ------------------------------------------------------------------ #
+    @classmethod
+    def from_blocks(cls, blocks) -> "BlockStore":
+        """Tạo từ danh sách TextBlock (màu RGB 0-1 được đổi lại về int)"""
+        store = cls(capacity=max(len(blocks), 1))
+        for block in blocks:
+            r, g, b = (int(round(c * 255)) for c in block.color)
+            index = store.append(block.original_text or block.text, block.bbox, block.font_size,
+                                 block.font_name, (r << 16) | (g << 8) | b, block.page_num,
+                                 block.flags, block.block_num, block.line_num, block.line_count)
+            if block.original_text:
+                store.set_translation(index, block.text)
+        return store
+
+    def to_blocks(self, block_cls, views: Optional[Sequence[BlockView]] = None) -> list:
+        """
+        Tạo lại danh sách block_cls (TextBlock) - dùng cho code cũ cần object thật
+        hoặc khi cần gửi sang process khác
+        
+        views: Chỉ chuyển các hàng này (mặc định tất cả)
+        """
+        return [block_cls(text=view.text, original_text=view.original_text, bbox=view.bbox,
+                          font_size=view.font_size, font_name=view.font_name, color=view.color,
+                          page_num=view.page_num, flags=view.flags, block_num=view.block_num,
+                          line_num=view.line_num, line_count=view.line_count)
+                for view in (self if views is None else views)]
+
+    # ------------------------------------------------------------------ #
+    # Thao tác trên cả mảng
+    # ------------------------------------------------------------------ #
+    def colors_rgb(self):
+        """Màu RGB float (0-1) của mọi block, mảng (n, 3)"""
+        if self._rgb is None:
+            color = self.color[:self._size, None]
+            shifts = np.array([16, 8, 0], dtype=np.uint32)
+            self._rgb = ((color >> shifts) & 0xFF) / 255.0
+        return self._rgb
+
+    def reading_order(self):
+        """Chỉ số block theo thứ tự đọc: trang, rồi từ trên xuống, rồi trái sang phải"""
+        n = self._size
+        return np.lexsort((self.bbox[:n, 0], self.bbox[:n, 1], self.page[:n]))
+
+    def group_by_page(self) -> Dict[int, List[BlockView]]:
+        """{số trang: [BlockView theo thứ tự đọc]}"""
+        if not self._size:
+            return {}
+        order = self.reading_order()
+        pages = self.page[order]
+        starts = np.flatnonzero(np.diff(pages)) + 1
+        groups = {}
+        for chunk in np.split(order, starts):
+            groups[int(self.page[chunk[0]])] = [BlockView(self, int(i)) for i in chunk]
+        return groups
+
+    @property
+    def nbytes(self) -> int:
+        """Bộ nhớ của các mảng số (không tính text)"""
+        n = self._size
+        return sum(getattr(self, name)[:n].nbytes for name in (
+            "bbox", "font_size", "color", "page", "flags", "block_num",
+            "line_num", "line_count", "font_id"))
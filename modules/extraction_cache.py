@@ -0,0 +1,151 @@
+"""
+Cache kết quả trích xuất text trên đĩa (SQLite)
+- Khóa tài liệu: hash nội dung cả file -> chạy lại cùng file không cần mở / đọc trang nào
+- Khóa trang: hash content stream + font + XObject của trang -> file sửa vài trang
+  chỉ phải đọc lại các trang đã đổi (trang giống hệt ở tài liệu khác cũng dùng lại được)
+- Dữ liệu trang: danh sách dict của TextBlock (không có page_num), nén zlib
+- Giới hạn số trang lưu, tự xóa trang lâu không dùng
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional
+
+from modules.app_paths import get_app_data_dir
+
+# Tăng khi đổi cách trích xuất (_iter_page_lines) để bỏ cache cũ
+EXTRACTOR_VERSION = 1
+
+
+class ExtractionCache:
+    """Cache trang đã trích xuất, khóa theo hash nội dung"""
+
+    def __init__(self, db_path: Optional[str] = None, max_pages: int = 200_000):
+        """
+        Args:
+            db_path: File SQLite (mặc định nằm trong thư mục dữ liệu ứng dụng)
+            max_pages: Số trang tối đa, vượt quá sẽ xóa trang ít dùng nhất
+        """
+        self.db_path = db_path or os.path.join(get_app_data_dir(), "extraction_cache.db")
+        self.max_pages = max_pages
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS docs (
+                doc_hash    TEXT PRIMARY KEY,
+                page_hashes TEXT NOT NULL,
+                last_used   REAL NOT NULL
+            ) WITHOUT ROWID
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS pages (
+                page_hash TEXT PRIMARY KEY,
+                blocks    BLOB NOT NULL,
+                last_used REAL NOT NULL
+            ) WITHOUT ROWID
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_pages_last_used ON pages(last_used)")
+        self._conn.commit()
+
+    # ------------------------------------------------------------------ #
+    # Hash
+    # ------------------------------------------------------------------ #
+    @staticmethod
+    def file_hash(path: str) -> str:
+        """Hash nội dung cả file (blake2b, đọc từng khối 1 MB)"""
+        h = hashlib.blake2b(digest_size=16)
+        h.update(f"v{EXTRACTOR_VERSION}".encode("ascii"))
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        return h.hexdigest()
+
+    @staticmethod
+    def page_hash(doc, page) -> str:
+        """
+        Hash những gì quyết định text của trang: kích thước, góc xoay, content stream,
+        font và nội dung các XObject (text có thể nằm trong form XObject)
+        """
+        h = hashlib.blake2b(digest_size=16)
+        h.update(f"v{EXTRACTOR_VERSION}|{tuple(page.rect)}|{page.rotation}|".encode("ascii"))
+        h.update(page.read_contents())
+        for font in page.get_fonts():
+            h.update(repr(font[1:6]).encode("utf-8"))  # Bỏ xref (đổi khi file được lưu lại)
+        for xobject in page.get_xobjects():
+            h.update(doc.xref_stream(xobject[0]) or b"")
+        return h.hexdigest()
+
+    # ------------------------------------------------------------------ #
+    # Đọc / ghi
+    # ------------------------------------------------------------------ #
+    def get_document(self, doc_hash: str) -> Optional[List[str]]:
+        """Danh sách hash trang của tài liệu đã trích xuất trước đó, None nếu chưa có"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT page_hashes FROM docs WHERE doc_hash=?", (doc_hash,)).fetchone()
+            if row:
+                self._conn.execute("UPDATE docs SET last_used=? WHERE doc_hash=?",
+                                   (time.time(), doc_hash))
+                self._conn.commit()
+        return json.loads(row[0]) if row else None
+
+    def get_pages(self, page_hashes: List[str]) -> Dict[str, List[Dict]]:
+        """{hash trang: [dict block, ...]} cho các trang có trong cache"""
+        unique = list(dict.fromkeys(page_hashes))
+        found: Dict[str, List[Dict]] = {}
+        with self._lock:
+            # SQLite giới hạn số tham số mỗi câu lệnh
+            for i in range(0, len(unique), 500):
+                chunk = unique[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                for page_hash, blob in self._conn.execute(
+                        f"SELECT page_hash, blocks FROM pages WHERE page_hash IN ({placeholders})",
+                        chunk):
+                    found[page_hash] = json.loads(zlib.decompress(blob))
+                if found:
+                    self._conn.executemany("UPDATE pages SET last_used=? WHERE page_hash=?",
+                                           [(time.time(), h) for h in chunk if h in found])
+            self._conn.commit()
+        return found
+
+    def put(self, doc_hash: str, page_hashes: List[str], pages: Dict[str, List[Dict]]):
+        """Lưu danh sách trang của tài liệu và dữ liệu các trang mới trích xuất"""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO pages (page_hash, blocks, last_used) VALUES (?, ?, ?)",
+                [(page_hash, zlib.compress(json.dumps(blocks, ensure_ascii=False).encode("utf-8")), now)
+                 for page_hash, blocks in pages.items()])
+            self._conn.execute(
+                "INSERT OR REPLACE INTO docs (doc_hash, page_hashes, last_used) VALUES (?, ?, ?)",
+                (doc_hash, json.dumps(page_hashes), now))
+            self._conn.commit()
+        self.evict()
+
+    def evict(self):
+        """Giữ tối đa max_pages trang, xóa trang và tài liệu lâu không dùng"""
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+            excess = count - self.max_pages
+            if excess <= 0:
+                return
+            self._conn.execute(
+                "DELETE FROM pages WHERE page_hash IN "
+                "(SELECT page_hash FROM pages ORDER BY last_used LIMIT ?)", (excess,))
+            # Tài liệu không được dùng từ trước trang cũ nhất còn lại có thể đã mất trang.
+            # Không bắt buộc (tài liệu thiếu trang sẽ được đọc lại), chỉ để bảng docs không phình
+            oldest = self._conn.execute("SELECT MIN(last_used) FROM pages").fetchone()[0]
+            if oldest is not None:
+                self._conn.execute("DELETE FROM docs WHERE last_used < ?", (oldest,))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
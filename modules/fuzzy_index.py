@@ -0,0 +1,85 @@
+"""
+MinHash + LSH cho tra cứu gần đúng trong bộ nhớ dịch
+- Mỗi câu -> tập shingle (từ + cặp từ liền nhau) -> chữ ký MinHash 32 giá trị
+- Chữ ký chia thành 8 band x 4 hàng; hai câu giống nhau ~80% gần như chắc chắn
+  trùng ít nhất một band -> chỉ cần tra theo (band, bucket) có index, không quét toàn bộ
+- Ứng viên được chấm điểm lại bằng độ giống ký tự (difflib) trước khi dùng
+- word_diff: các từ khác nhau giữa hai câu - độ giống cao vẫn có thể ngược nghĩa
+  ("must start" / "must not start"), nên chỉ dùng lại bản dịch khi không có từ nào khác
+"""
+
+import random
+import re
+import zlib
+from difflib import SequenceMatcher
+from typing import List, Optional, Tuple
+
+_MAX_HASH = (1 << 32) - 1
+_WORD_RE = re.compile(r"\w+")
+_PLACEHOLDER_RE = re.compile(r"⟦\s*\d+\s*⟧")
+
+
+class MinHashLSH:
+    """Tính chữ ký MinHash và khóa band cho một đoạn text"""
+
+    def __init__(self, num_perm: int = 32, bands: int = 8, min_words: int = 4, seed: int = 1):
+        """
+        Args:
+            num_perm: Số hàm hash (độ dài chữ ký)
+            bands: Số band (num_perm phải chia hết)
+            min_words: Câu ngắn hơn không tra gần đúng (khác một từ là khác nghĩa)
+            seed: Cố định để chữ ký giống nhau giữa các lần chạy
+        """
+        if num_perm % bands:
+            raise ValueError("num_perm phải chia hết cho bands")
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.min_words = min_words
+        rng = random.Random(seed)
+        # "Hoán vị" bằng XOR với mặt nạ ngẫu nhiên: rẻ hơn (a*h + b) mod p nhiều lần,
+        # đủ tốt để lọc ứng viên vì ứng viên nào cũng được chấm điểm lại
+        self._masks = [rng.getrandbits(32) for _ in range(num_perm)]
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Chữ thường, bỏ dấu câu, placeholder -> '#'"""
+        text = _PLACEHOLDER_RE.sub(" # ", text.lower())
+        return " ".join(_WORD_RE.findall(text.replace("#", " _ph_ "))).replace("_ph_", "#")
+
+    def band_keys(self, text: str) -> Optional[List[Tuple[int, int]]]:
+        """[(band, bucket), ...] của text, None nếu text quá ngắn để tra gần đúng"""
+        words = self.normalize(text).split()
+        if len(words) < self.min_words:
+            return None
+
+        shingles = set(words)
+        shingles.update(f"{a} {b}" for a, b in zip(words, words[1:]))
+        # crc32 rồi trộn bit (crc32 của các chuỗi gần giống nhau khá tương quan)
+        hashes = [(zlib.crc32(s.encode("utf-8")) * 0x9E3779B1) & _MAX_HASH for s in shingles]
+
+        signature = [min(h ^ mask for h in hashes) for mask in self._masks]
+        keys = []
+        for band in range(self.bands):
+            chunk = signature[band * self.rows:(band + 1) * self.rows]
+            bucket = zlib.crc32(",".join(map(str, chunk)).encode("ascii"))
+            keys.append((band, bucket))
+        return keys
+
+    def similarity(self, a: str, b: str) -> float:
+        """Độ giống (0-1) của hai text sau chuẩn hóa"""
+        a, b = self.normalize(a), self.normalize(b)
+        matcher = SequenceMatcher(None, a, b, autojunk=False)
+        if matcher.real_quick_ratio() < 0.5 or matcher.quick_ratio() < 0.5:
+            return 0.0
+        return matcher.ratio()
+
+    @classmethod
+    def word_diff(cls, a: str, b: str) -> List[str]:
+        """Các từ bị thêm / bớt / thay giữa hai text sau chuẩn hóa (rỗng nếu chỉ khác dấu câu, hoa/thường)"""
+        words_a, words_b = cls.normalize(a).split(), cls.normalize(b).split()
+        diff = []
+        matcher = SequenceMatcher(None, words_a, words_b, autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag != "equal":
+                diff.extend(words_a[i1:i2] + words_b[j1:j2])
+        return diff
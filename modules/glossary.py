@@ -0,0 +1,168 @@
+"""
+Bảng thuật ngữ: giữ nguyên tên sản phẩm / mã linh kiện, dịch cố định thuật ngữ chuyên ngành
+- Automaton Aho-Corasick: quét mỗi segment MỘT lần với hàng nghìn thuật ngữ, thời gian
+  tuyến tính theo độ dài text (không phụ thuộc số thuật ngữ)
+- Automaton được dựng một lần và lưu cache (pickle) theo nội dung file thuật ngữ
+- Thuật ngữ tìm được thay bằng placeholder trước khi dịch (cùng cơ chế với masking),
+  sau khi dịch thay lại bằng bản dịch cố định hoặc chính thuật ngữ gốc
+
+File thuật ngữ: mỗi dòng "thuật ngữ<TAB>bản dịch" (UTF-8), dòng bắt đầu bằng # là chú thích.
+Không có bản dịch -> giữ nguyên (do-not-translate). Thuật ngữ có chữ hoa thì khớp đúng
+hoa/thường, thuật ngữ viết thường khớp không phân biệt hoa/thường.
+"""
+
+import hashlib
+import os
+import pickle
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from modules.app_paths import get_app_data_dir
+
+
+class AhoCorasick:
+    """Automaton Aho-Corasick trên chuỗi đã chuyển chữ thường"""
+
+    def __init__(self, patterns: List[str]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[int] = [-1]  # Pattern dài nhất kết thúc tại node (-1: không có)
+        self._dict_link: List[int] = [0]  # Node gần nhất theo fail link có output
+        self._lengths = [len(p) for p in patterns]
+
+        for index, pattern in enumerate(patterns):
+            node = 0
+            for ch in pattern:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(-1)
+                    self._dict_link.append(0)
+                node = nxt
+            self._out[node] = index
+        self._build_links()
+
+    def _build_links(self):
+        """Fail link theo BFS"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(ch, 0)
+                link = self._fail[child]
+                self._dict_link[child] = link if self._out[link] >= 0 else self._dict_link[link]
+
+    def iter_matches(self, text: str):
+        """Sinh (start, end, pattern_index) cho mọi lần xuất hiện"""
+        goto, fail, out, dict_link = self._goto, self._fail, self._out, self._dict_link
+        node = 0
+        for pos, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+
+            hit = node if out[node] >= 0 else dict_link[node]
+            while hit:
+                index = out[hit]
+                yield pos + 1 - self._lengths[index], pos + 1, index
+                hit = dict_link[hit]
+
+
+class Glossary:
+    """Danh sách thuật ngữ + automaton để tìm chúng trong text"""
+
+    def __init__(self, entries: List[Tuple[str, Optional[str]]]):
+        """
+        Args:
+            entries: [(thuật ngữ, bản dịch hoặc None nếu giữ nguyên), ...]
+        """
+        unique: Dict[str, Tuple[str, Optional[str]]] = {}
+        for term, translation in entries:
+            term = term.strip()
+            if term:
+                unique[term] = (term, translation.strip() if translation else None)
+        self.terms = list(unique.values())
+        self._case_sensitive = [term != term.lower() for term, _ in self.terms]
+        self._automaton = AhoCorasick([term.lower() for term, _ in self.terms])
+
+    def __len__(self):
+        return len(self.terms)
+
+    @classmethod
+    def load(cls, path: str, cache_dir: Optional[str] = None) -> "Glossary":
+        """Đọc file thuật ngữ; automaton được lấy từ cache nếu file không đổi"""
+        with open(path, "rb") as f:
+            raw = f.read()
+
+        cache_dir = cache_dir or os.path.join(get_app_data_dir(), "glossary_cache")
+        cache_path = os.path.join(cache_dir, hashlib.sha1(raw).hexdigest() + ".pkl")
+        try:
+            with open(cache_path, "rb") as f:
+                glossary = pickle.load(f)
+            if isinstance(glossary, cls):
+                print(f"✓ Đã nạp {len(glossary)} thuật ngữ từ {os.path.basename(path)} (cache)")
+                return glossary
+        except (OSError, pickle.PickleError, EOFError, AttributeError):
+            pass
+
+        entries = []
+        for line in raw.decode("utf-8-sig").splitlines():
+            if not line.strip() or line.lstrip().startswith("#"):
+                continue
+            term, _, translation = line.partition("\t")
+            entries.append((term, translation or None))
+
+        glossary = cls(entries)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(cache_path, "wb") as f:
+                pickle.dump(glossary, f, protocol=pickle.HIGHEST_PROTOCOL)
+        except OSError as e:
+            print(f"Không lưu được cache thuật ngữ: {e}")
+        print(f"✓ Đã nạp {len(glossary)} thuật ngữ từ {os.path.basename(path)}")
+        return glossary
+
+    def find(self, text: str) -> List[Tuple[int, int, str]]:
+        """
+        Các thuật ngữ trong text: [(start, end, giá trị thay thế), ...] không chồng nhau,
+        ưu tiên thuật ngữ bắt đầu sớm hơn rồi dài hơn, chỉ khớp trọn từ
+        """
+        lowered = text.lower()
+        if len(lowered) != len(text):
+            # Vài ký tự đổi độ dài khi chuyển chữ thường (İ) - giữ nguyên để vị trí khớp
+            lowered = "".join(c.lower() if len(c.lower()) == 1 else c for c in text)
+
+        candidates = []
+        for start, end, index in self._automaton.iter_matches(lowered):
+            term, translation = self.terms[index]
+            if self._case_sensitive[index] and text[start:end] != term:
+                continue
+            if not self._on_word_boundary(text, start, end):
+                continue
+            candidates.append((start, -end, index))
+
+        spans = []
+        last_end = 0
+        for start, neg_end, index in sorted(candidates):
+            if start < last_end:
+                continue
+            term, translation = self.terms[index]
+            spans.append((start, -neg_end, translation or text[start:-neg_end]))
+            last_end = -neg_end
+        return spans
+
+    @staticmethod
+    def _on_word_boundary(text: str, start: int, end: int) -> bool:
+        """Chỉ khớp trọn từ (thuật ngữ "pump" không khớp trong "pumping")"""
+        if start > 0 and text[start].isalnum() and text[start - 1].isalnum():
+            return False
+        if end < len(text) and text[end - 1].isalnum() and text[end].isalnum():
+            return False
+        return True
@@ -0,0 +1,172 @@
+"""
+Nhật ký job dịch (journal) để tiếp tục sau khi bị gián đoạn
+- File JSON Lines chỉ ghi nối (append-only): text blocks đã trích xuất, từng bản dịch
+  xong, từng phần PDF đã render
+- fsync theo lô (mỗi N bản ghi hoặc mỗi vài giây) để không chậm quá trình dịch
+- Dòng cuối bị cắt dở do crash được bỏ qua khi đọc lại
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from modules.app_paths import get_app_data_dir
+
+
+@dataclass
+class JournalState:
+    """Trạng thái job đọc lại từ journal"""
+    blocks: Optional[List[dict]] = None  # None nếu chưa trích xuất xong
+    translations: Dict[int, str] = field(default_factory=dict)
+    parts: List[Tuple[int, int, str]] = field(default_factory=list)  # (từ trang, đến trang, file)
+    translated: bool = False  # Đã dịch xong toàn bộ
+
+
+class JobJournal:
+    """Journal của một job (một file đầu vào -> một file đầu ra)"""
+
+    def __init__(self, path: str, sync_every: int = 200, sync_interval: float = 2.0):
+        """
+        Args:
+            path: File journal (.jsonl)
+            sync_every: fsync sau mỗi số bản ghi này
+            sync_interval: hoặc sau mỗi số giây này
+        """
+        self.path = path
+        self.parts_dir = os.path.splitext(path)[0] + "_parts"
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self._file = None
+        self._lock = threading.Lock()
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    @classmethod
+    def for_job(cls, input_path: str, output_path: str,
+                journal_dir: Optional[str] = None) -> "JobJournal":
+        """Journal cho cặp file vào/ra; file nguồn bị sửa (size/mtime khác) thì là job mới"""
+        stat = os.stat(input_path)
+        ident = "|".join([os.path.abspath(input_path), str(stat.st_size),
+                          str(int(stat.st_mtime)), os.path.abspath(output_path)])
+        job_id = hashlib.sha1(ident.encode("utf-8")).hexdigest()[:16]
+
+        journal_dir = journal_dir or os.path.join(get_app_data_dir(), "jobs")
+        os.makedirs(journal_dir, exist_ok=True)
+        return cls(os.path.join(journal_dir, f"{job_id}.jsonl"))
+
+    # ------------------------------------------------------------------ #
+    # Đọc
+    # ------------------------------------------------------------------ #
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def load(self) -> JournalState:
+        """Đọc lại journal, bỏ qua dòng hỏng (thường là dòng cuối khi crash)"""
+        state = JournalState()
+        if not self.exists():
+            return state
+
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+
+                kind = record.get("type")
+                if kind == "blocks":
+                    state.blocks = record["blocks"]
+                elif kind == "t":
+                    state.translations[record["i"]] = record["s"]
+                elif kind == "translated":
+                    state.translated = True
+                elif kind == "part" and os.path.exists(record["path"]):
+                    state.parts.append((record["from"], record["to"], record["path"]))
+        return state
+
+    # ------------------------------------------------------------------ #
+    # Ghi
+    # ------------------------------------------------------------------ #
+    def _write(self, record: dict, sync: bool = False):
+        with self._lock:
+            if self._file is None:
+                self._file = self._open_for_append()
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._unsynced += 1
+
+            now = time.monotonic()
+            if sync or self._unsynced >= self.sync_every or \
+                    now - self._last_sync >= self.sync_interval:
+                self._sync_locked()
+
+    def _open_for_append(self):
+        """
+        Mở journal để ghi nối. Dòng cuối bị cắt dở do crash được cắt bỏ trước, nếu không
+        bản ghi mới sẽ dính vào dòng hỏng đó và bị bỏ qua khi đọc lại
+        """
+        if os.path.exists(self.path):
+            with open(self.path, "r+b") as f:
+                size = f.seek(0, os.SEEK_END)
+                if size:
+                    f.seek(size - 1)
+                    if f.read(1) != b"\n":
+                        f.seek(0)
+                        f.truncate(f.read().rfind(b"\n") + 1)
+        return open(self.path, "a", encoding="utf-8")
+
+    def _sync_locked(self):
+        if self._file is not None and self._unsynced:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def start(self, input_path: str, output_path: str, blocks: List[dict]):
+        """Bắt đầu job mới: xóa journal cũ, ghi thông tin job và các block đã trích xuất"""
+        self.discard()
+        self._write({"type": "header", "input": os.path.abspath(input_path),
+                     "output": os.path.abspath(output_path), "created": time.time()})
+        self._write({"type": "blocks", "blocks": blocks}, sync=True)
+
+    def record_translation(self, index: int, translation: str):
+        """Ghi một bản dịch vừa xong"""
+        self._write({"type": "t", "i": index, "s": translation})
+
+    def mark_translated(self):
+        """Đánh dấu đã dịch xong toàn bộ"""
+        self._write({"type": "translated"}, sync=True)
+
+    def part_path(self, from_page: int, to_page: int) -> str:
+        """Đường dẫn file PDF tạm cho một đoạn trang đã render"""
+        os.makedirs(self.parts_dir, exist_ok=True)
+        return os.path.join(self.parts_dir, f"part_{from_page:06d}_{to_page:06d}.pdf")
+
+    def record_part(self, from_page: int, to_page: int, path: str):
+        """Ghi nhận một đoạn trang đã render xong"""
+        self._write({"type": "part", "from": from_page, "to": to_page, "path": path}, sync=True)
+
+    def flush(self):
+        """Đẩy mọi bản ghi còn trong buffer xuống đĩa"""
+        with self._lock:
+            self._sync_locked()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._sync_locked()
+                self._file.close()
+                self._file = None
+
+    def discard(self):
+        """Xóa journal và các file tạm (khi job xong hoặc bắt đầu lại từ đầu)"""
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        if os.path.isdir(self.parts_dir):
+            for name in os.listdir(self.parts_dir):
+                os.remove(os.path.join(self.parts_dir, name))
+            os.rmdir(self.parts_dir)
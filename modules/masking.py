@@ -0,0 +1,92 @@
+"""
+Che (mask) số, ngày, URL, email, phiên bản, mã định danh bằng placeholder trước khi dịch
+- "Page 12 of 300" và "Page 13 of 300" cùng thành "Page ⟦0⟧ of ⟦1⟧" -> một mục cache, một request
+- Sau khi dịch, placeholder được thay lại bằng giá trị gốc
+"""
+
+import re
+from typing import List, Optional, Sequence, Tuple
+
+
+PLACEHOLDER = "⟦{}⟧"
+# Cho phép Google chèn khoảng trắng trong placeholder: "⟦ 0 ⟧"
+PLACEHOLDER_RE = re.compile(r"⟦\s*(\d+)\s*⟧")
+
+# Thứ tự quan trọng: mẫu dài / cụ thể đứng trước
+MASK_PATTERNS = [
+    r"(?:https?://|www\.)[^\s<>\"']+[^\s<>\"'.,;:!?)\]]",                    # URL
+    r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+",                                        # Email
+    r"(?<![\w/.-])\d{1,4}[/.-]\d{1,2}[/.-]\d{1,4}(?![\w/.-])",             # Ngày 2024-01-31, 31/01/2024
+    r"(?<![\w.])v?\d+(?:\.\d+){2,}(?:[-+][\w.]+)?(?![\w.])",               # Phiên bản 1.2.3, v2.0.1-beta
+    r"\b[A-Z]{2,}[-_]?\d[\w-]*\b",                                          # Mã linh kiện ABC-1234, ISO9001
+    r"\b[A-Za-z_][\w.]*\(\)",                                               # Lời gọi hàm foo()
+    r"\b[A-Za-z]+\w*_\w+\b",                                                # snake_case
+    r"\b[a-z]+[A-Z][A-Za-z0-9]*\b",                                         # camelCase
+    r"(?<![\w.])[-+]?\d[\d,]*(?:\.\d+)?%?(?![\w])",                         # Số 12, 1,000, 4.2, 30%
+]
+MASK_RE = re.compile("|".join(f"(?:{p})" for p in MASK_PATTERNS))
+
+
+class PlaceholderMasker:
+    """Thay token không cần dịch bằng placeholder đánh số và khôi phục sau khi dịch"""
+
+    def mask(self, text: str, spans: Sequence[Tuple[int, int, str]] = (),
+             patterns: bool = True) -> Tuple[str, List[str]]:
+        """
+        Trả về (template, values): template chứa ⟦0⟧, ⟦1⟧... theo thứ tự xuất hiện,
+        values[k] là giá trị gốc của ⟦k⟧
+
+        Args:
+            spans: Các đoạn (start, end, giá trị khôi phục) đã biết cần che, ví dụ thuật ngữ
+                   tìm bằng glossary; sắp theo start, không chồng nhau
+            patterns: Che thêm số/URL/mã... theo MASK_PATTERNS
+        """
+        if PLACEHOLDER_RE.search(text):
+            # Text đã có sẵn ký hiệu trùng placeholder - không mask để tránh nhầm lẫn
+            return text, []
+
+        values: List[str] = []
+
+        def replace(match):
+            values.append(match.group(0))
+            return PLACEHOLDER.format(len(values) - 1)
+
+        def mask_gap(gap: str) -> str:
+            return MASK_RE.sub(replace, gap) if patterns else gap
+
+        if not spans:
+            return mask_gap(text), values
+
+        parts = []
+        pos = 0
+        for start, end, value in spans:
+            parts.append(mask_gap(text[pos:start]))
+            values.append(value)
+            parts.append(PLACEHOLDER.format(len(values) - 1))
+            pos = end
+        parts.append(mask_gap(text[pos:]))
+        return "".join(parts), values
+
+    @staticmethod
+    def is_intact(template: str, translated: str) -> bool:
+        """Bản dịch còn giữ đủ (và không thừa) các placeholder của template"""
+        expected = sorted(PLACEHOLDER_RE.findall(template))
+        return sorted(PLACEHOLDER_RE.findall(translated)) == expected
+
+    @staticmethod
+    def unmask(translated: str, values: List[str]) -> Optional[str]:
+        """Thay placeholder bằng giá trị gốc, None nếu bản dịch làm mất/sai placeholder"""
+        if not values:
+            return translated
+
+        seen = set()
+
+        def restore(match):
+            k = int(match.group(1))
+            seen.add(k)
+            return values[k] if k < len(values) else match.group(0)
+
+        restored = PLACEHOLDER_RE.sub(restore, translated)
+        if len(seen) != len(values) or any(k >= len(values) for k in seen):
+            return None
+        return restored
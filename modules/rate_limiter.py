@@ -0,0 +1,223 @@
+"""
+Giới hạn tốc độ request thích ứng
+- Token bucket: giới hạn số request/giây dùng chung cho mọi thread / coroutine
+- AIMD: tăng dần khi backend khỏe, giảm một nửa khi bị throttle (429), lỗi 5xx, timeout
+- Tôn trọng Retry-After, backoff lũy thừa có jitter cho retry
+"""
+
+import asyncio
+import random
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+
+# Loại lỗi
+THROTTLE = "throttle"   # 429 / quá nhiều request
+SERVER = "server"       # 5xx, lỗi mạng
+TIMEOUT = "timeout"
+CLIENT = "client"       # Input không hợp lệ - retry cũng vô ích
+
+
+class HTTPStatusError(Exception):
+    """Lỗi HTTP kèm status code và Retry-After (dùng cho engine async)"""
+
+    def __init__(self, status: int, retry_after: Optional[str] = None):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+        self.retry_after = parse_retry_after(retry_after)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Header Retry-After (số giây hoặc ngày giờ HTTP) -> số giây cần chờ"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def classify_error(error: Exception) -> str:
+    """Phân loại exception thành THROTTLE / SERVER / TIMEOUT / CLIENT"""
+    if isinstance(error, HTTPStatusError):
+        if error.status == 429:
+            return THROTTLE
+        if error.status >= 500:
+            return SERVER
+        return CLIENT
+
+    # Không import trực tiếp deep_translator/requests/aiohttp - so theo tên class
+    name = type(error).__name__
+    message = str(error).lower()
+    if name == "TooManyRequests" or "429" in message or "too many requests" in message:
+        return THROTTLE
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError)) or "timeout" in name.lower() \
+            or "timed out" in message:
+        return TIMEOUT
+    if name in ("NotValidPayload", "NotValidLength", "LanguageNotSupportedException",
+                "InvalidSourceOrTargetLanguage", "TranslationNotFound"):
+        return CLIENT
+    return SERVER
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket + cửa sổ đồng thời AIMD, an toàn cho cả thread lẫn asyncio
+
+    - rate: số request/giây hiện tại (token bucket)
+    - window: số request được phép bay cùng lúc
+    """
+
+    def __init__(self, rate: float = 10.0, window: float = 4.0,
+                 min_rate: float = 0.5, max_rate: float = 50.0,
+                 min_window: float = 1.0, max_window: float = 64.0,
+                 rate_step: float = 0.2, decrease_factor: float = 0.5,
+                 backoff_base: float = 0.5, backoff_cap: float = 30.0):
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.min_window = min_window
+        self.max_window = max_window
+        self.rate_step = rate_step
+        self.decrease_factor = decrease_factor
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+
+        self._lock = threading.Lock()
+        self.rate = rate
+        self.window = window
+        self._tokens = 1.0
+        self._last_refill = time.monotonic()
+        self._inflight = 0
+        self._cooldown_until = 0.0
+        self._last_decrease = 0.0
+
+        self.successes = 0
+        self.errors: Dict[str, int] = {THROTTLE: 0, SERVER: 0, TIMEOUT: 0, CLIENT: 0}
+
+    def reset(self, rate: Optional[float] = None, window: Optional[float] = None):
+        """Đặt lại tốc độ / cửa sổ ban đầu (ví dụ theo delay của translate_batch)"""
+        with self._lock:
+            if rate:
+                self.rate = min(max(rate, self.min_rate), self.max_rate)
+            if window:
+                self.window = min(max(window, self.min_window), self.max_window)
+            self._tokens = 1.0
+            self._last_refill = time.monotonic()
+
+    # ------------------------------------------------------------------ #
+    # Cấp phát slot
+    # ------------------------------------------------------------------ #
+    def _try_acquire(self) -> float:
+        """Thử lấy slot: trả về 0 nếu được, ngược lại là số giây nên chờ"""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._cooldown_until:
+                return self._cooldown_until - now
+
+            # Nạp thêm token theo thời gian trôi qua (burst tối đa = window)
+            elapsed = now - self._last_refill
+            self._last_refill = now
+            self._tokens = min(max(self.window, 1.0), self._tokens + elapsed * self.rate)
+
+            if self._inflight >= int(self.window):
+                return 0.01
+            if self._tokens < 1.0:
+                return (1.0 - self._tokens) / self.rate
+
+            self._tokens -= 1.0
+            self._inflight += 1
+            return 0.0
+
+    def _release(self):
+        with self._lock:
+            self._inflight -= 1
+
+    def try_acquire(self) -> bool:
+        """Lấy slot nếu có ngay, không chờ (cho request phụ như hedge) - phải gọi release()"""
+        return self._try_acquire() <= 0
+
+    def release(self):
+        """Trả slot lấy bằng try_acquire()"""
+        self._release()
+
+    @contextmanager
+    def slot(self):
+        """Chờ tới lượt gửi request (thread)"""
+        while True:
+            wait = self._try_acquire()
+            if wait <= 0:
+                break
+            time.sleep(wait)
+        try:
+            yield
+        finally:
+            self._release()
+
+    @asynccontextmanager
+    async def slot_async(self):
+        """Chờ tới lượt gửi request (coroutine)"""
+        while True:
+            wait = self._try_acquire()
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait)
+        try:
+            yield
+        finally:
+            self._release()
+
+    # ------------------------------------------------------------------ #
+    # Phản hồi AIMD
+    # ------------------------------------------------------------------ #
+    def on_success(self):
+        """Tăng cộng: +1 slot mỗi khi cả cửa sổ thành công, tăng rate một bước"""
+        with self._lock:
+            self.successes += 1
+            self.window = min(self.max_window, self.window + 1.0 / self.window)
+            self.rate = min(self.max_rate, self.rate + self.rate_step / max(self.rate, 1.0))
+
+    def on_error(self, kind: str, retry_after: Optional[float] = None):
+        """Giảm nhân khi backend quá tải; lỗi input (CLIENT) không ảnh hưởng tốc độ"""
+        with self._lock:
+            self.errors[kind] = self.errors.get(kind, 0) + 1
+            if kind == CLIENT:
+                return
+
+            now = time.monotonic()
+            if retry_after:
+                self._cooldown_until = max(self._cooldown_until, now + retry_after)
+
+            # Các lỗi cùng một đợt quá tải chỉ giảm một lần
+            if now - self._last_decrease < 1.0:
+                return
+            self._last_decrease = now
+            self.window = max(self.min_window, self.window * self.decrease_factor)
+            self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Thời gian chờ trước lần retry thứ attempt (full jitter, ưu tiên Retry-After)"""
+        if retry_after is not None:
+            return retry_after + random.uniform(0, self.backoff_base)
+        cap = min(self.backoff_cap, self.backoff_base * (2 ** attempt))
+        return random.uniform(0, cap)
+
+    # ------------------------------------------------------------------ #
+    # Quan sát
+    # ------------------------------------------------------------------ #
+    def stats(self) -> Dict[str, float]:
+        """Tốc độ, cửa sổ hiện tại và số lỗi theo loại"""
+        with self._lock:
+            return {
+                "rate": round(self.rate, 2),
+                "window": round(self.window, 2),
+                "inflight": self._inflight,
+                "successes": self.successes,
+                **{f"errors_{k}": v for k, v in self.errors.items()},
+            }
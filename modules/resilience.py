@@ -0,0 +1,377 @@
+"""
+Chống request treo / backend lỗi hàng loạt
+- LatencyTracker: độ trễ gần đây, p50 / p95 / p99
+- CircuitBreaker: backend lỗi liên tục thì ngừng gửi một thời gian (cool-down) rồi thử lại
+  bằng một request thăm dò, thay vì để mọi worker đốt hết lượt retry
+- ResilientCaller: deadline cho từng request + hedged request (request chậm hơn p95 thì
+  gửi thêm một bản, lấy kết quả nào về trước). Bản hedge cũng đi qua rate limiter:
+  không có slot ngay thì bỏ hedge
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Awaitable, Callable, Dict, Optional
+
+from modules.rate_limiter import SERVER, TIMEOUT, AdaptiveRateLimiter, classify_error
+
+
+class LatencyTracker:
+    """Cửa sổ trượt các độ trễ gần nhất, tính percentile"""
+
+    def __init__(self, size: int = 1000):
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=size)
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Percentile p (0-100), None nếu chưa có mẫu"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        k = min(len(samples) - 1, max(0, int(round(p / 100 * (len(samples) - 1)))))
+        return samples[k]
+
+    def snapshot(self) -> Dict[str, float]:
+        """p50 / p95 / p99 tính bằng giây"""
+        return {f"p{p}": round(self.percentile(p) or 0.0, 3) for p in (50, 95, 99)}
+
+
+class CircuitBreaker:
+    """
+    CLOSED: gửi bình thường
+    OPEN: backend đang lỗi - không gửi gì trong thời gian cool-down
+    HALF_OPEN: hết cool-down - cho đúng một request thăm dò, thành công thì CLOSED,
+               thất bại thì OPEN lại với cool-down gấp đôi
+    Chỉ lỗi server / timeout được tính (429 do rate limiter xử lý, lỗi input không phải do backend)
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, window: int = 20, min_calls: int = 10, failure_ratio: float = 0.5,
+                 consecutive_failures: int = 5, cooldown: float = 15.0, max_cooldown: float = 300.0):
+        """
+        Args:
+            window: Số kết quả gần nhất dùng để tính tỉ lệ lỗi
+            min_calls: Số kết quả tối thiểu trước khi xét tỉ lệ lỗi
+            failure_ratio: Tỉ lệ lỗi trong cửa sổ để mở mạch
+            consecutive_failures: Hoặc số lỗi liên tiếp để mở mạch
+            cooldown, max_cooldown: Thời gian ngừng gửi (giây), gấp đôi mỗi lần mở lại
+        """
+        self.min_calls = min_calls
+        self.failure_ratio = failure_ratio
+        self.consecutive_failures = consecutive_failures
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+
+        self._lock = threading.Lock()
+        self._results = deque(maxlen=window)  # True = lỗi
+        self._consecutive = 0
+        self._state = self.CLOSED
+        self._cooldown = cooldown
+        self._open_until = 0.0
+        self._probe_inflight = False
+        self.trips = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def before_call(self) -> float:
+        """0 nếu được gửi request, ngược lại là số giây nên chờ"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return 0.0
+            now = time.monotonic()
+            if self._state == self.OPEN:
+                if now < self._open_until:
+                    return self._open_until - now
+                self._state = self.HALF_OPEN
+                self._probe_inflight = False
+            # HALF_OPEN: chỉ một request thăm dò
+            if self._probe_inflight:
+                return 0.5
+            self._probe_inflight = True
+            return 0.0
+
+    def on_success(self):
+        with self._lock:
+            self._results.append(False)
+            self._consecutive = 0
+            if self._state != self.CLOSED:
+                print("Circuit breaker: backend hoạt động lại, tiếp tục gửi request")
+                self._state = self.CLOSED
+                self._cooldown = self.base_cooldown
+                self._results.clear()
+            self._probe_inflight = False
+
+    def on_failure(self, kind: str):
+        if kind not in (SERVER, TIMEOUT):
+            # Backend vẫn phản hồi - không tính là lỗi, nhưng trả lại lượt thăm dò
+            with self._lock:
+                self._probe_inflight = False
+            return
+
+        with self._lock:
+            self._results.append(True)
+            self._consecutive += 1
+            if self._state == self.HALF_OPEN:
+                self._cooldown = min(self._cooldown * 2, self.max_cooldown)
+                self._open_locked()
+                return
+            if self._state == self.OPEN:
+                return
+
+            failures = sum(self._results)
+            if self._consecutive >= self.consecutive_failures or (
+                    len(self._results) >= self.min_calls and
+                    failures / len(self._results) >= self.failure_ratio):
+                self._open_locked()
+
+    def _open_locked(self):
+        self._state = self.OPEN
+        self._open_until = time.monotonic() + self._cooldown
+        self._probe_inflight = False
+        self.trips += 1
+        print(f"Circuit breaker: backend lỗi liên tục, ngừng gửi request {self._cooldown:.0f}s")
+
+    def reset(self):
+        with self._lock:
+            self._results.clear()
+            self._consecutive = 0
+            self._state = self.CLOSED
+            self._cooldown = self.base_cooldown
+            self._probe_inflight = False
+
+
+class ResilientCaller:
+    """Gọi backend với deadline, hedged request, circuit breaker và đo độ trễ"""
+
+    def __init__(self, deadline: float = 30.0, hedge_percentile: float = 95.0,
+                 hedge_min_delay: float = 0.5, hedge_budget: float = 0.1,
+                 min_samples: int = 20, max_threads: int = 64,
+                 breaker: Optional[CircuitBreaker] = None,
+                 limiter: Optional[AdaptiveRateLimiter] = None):
+        """
+        Args:
+            deadline: Thời gian tối đa cho một request (giây), quá hạn -> TimeoutError
+            hedge_percentile: Request chậm hơn percentile này thì gửi thêm bản hedge
+            hedge_min_delay: Không hedge sớm hơn số giây này
+            hedge_budget: Số hedge tối đa so với tổng số request (0.1 = 10%)
+            min_samples: Số mẫu độ trễ tối thiểu trước khi bắt đầu hedge
+            max_threads: Số thread chạy request (engine thread)
+            limiter: Rate limiter của request gốc; hedge cần một slot của nó (không chờ)
+        """
+        self.deadline = deadline
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_budget = hedge_budget
+        self.min_samples = min_samples
+        self.hedging = True
+        self.latency = LatencyTracker()
+        self.breaker = breaker or CircuitBreaker()
+        self.limiter = limiter
+
+        self._max_threads = max_threads
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0  # Bản hedge về trước bản gốc
+        self.timeouts = 0
+
+    # ------------------------------------------------------------------ #
+    # Circuit breaker
+    # ------------------------------------------------------------------ #
+    def wait_until_allowed(self, max_wait: float = 300.0) -> bool:
+        """Chờ circuit breaker cho phép gửi; False nếu chờ quá max_wait"""
+        waited = 0.0
+        while True:
+            delay = self.breaker.before_call()
+            if not delay:
+                return True
+            if waited >= max_wait:
+                return False
+            step = min(delay, 1.0)
+            time.sleep(step)
+            waited += step
+
+    async def wait_until_allowed_async(self, max_wait: float = 300.0) -> bool:
+        waited = 0.0
+        while True:
+            delay = self.breaker.before_call()
+            if not delay:
+                return True
+            if waited >= max_wait:
+                return False
+            step = min(delay, 1.0)
+            await asyncio.sleep(step)
+            waited += step
+
+    # ------------------------------------------------------------------ #
+    # Gọi request
+    # ------------------------------------------------------------------ #
+    def _hedge_delay(self) -> Optional[float]:
+        """Sau bao lâu thì gửi hedge, None nếu không hedge"""
+        if not self.hedging or len(self.latency) < self.min_samples or \
+                self.breaker.state != CircuitBreaker.CLOSED:
+            return None
+        threshold = self.latency.percentile(self.hedge_percentile)
+        return max(threshold, self.hedge_min_delay) if threshold is not None else None
+
+    def _take_hedge(self) -> bool:
+        """
+        Còn ngân sách hedge (tránh nhân đôi tải khi backend chậm toàn bộ) và rate limiter
+        còn slot ngay lúc này không - hedge không chờ slot, hết slot thì bỏ
+        """
+        with self._lock:
+            if self.hedges + 1 > self.hedge_budget * max(self.calls, 1):
+                return False
+            if self.limiter is not None and not self.limiter.try_acquire():
+                return False
+            self.hedges += 1
+            return True
+
+    def _release_hedge(self, _future):
+        """Trả slot của hedge khi request của nó kết thúc (kể cả bị bỏ kết quả / hủy)"""
+        if self.limiter is not None:
+            self.limiter.release()
+
+    def _on_result(self, start: float, error: Optional[BaseException], hedge_won: bool = False):
+        if error is None:
+            self.latency.add(time.perf_counter() - start)
+            self.breaker.on_success()
+            if hedge_won:
+                with self._lock:
+                    self.hedge_wins += 1
+            return
+
+        kind = classify_error(error)
+        if kind == TIMEOUT:
+            self.latency.add(self.deadline)
+        self.breaker.on_failure(kind)
+
+    def call(self, fn: Callable[[], str]) -> str:
+        """Chạy fn() (chặn) với deadline và hedge"""
+        with self._lock:
+            self.calls += 1
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self._max_threads,
+                                                thread_name_prefix="request")
+        start = time.perf_counter()
+        deadline_at = start + self.deadline
+        delay = self._hedge_delay()
+
+        first = self._pool.submit(fn)
+        pending = {first}
+        hedged = False
+        error: Optional[BaseException] = None
+
+        while pending:
+            remaining = deadline_at - time.perf_counter()
+            if remaining <= 0:
+                break
+            timeout = remaining
+            if not hedged and delay is not None:
+                timeout = min(remaining, max(0.0, start + delay - time.perf_counter()))
+
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    self._on_result(start, None, hedge_won=future is not first)
+                    for other in pending:
+                        other.cancel()  # Request đang chạy không hủy được, chỉ bỏ kết quả
+                    return future.result()
+                error = future.exception()
+
+            if not done and not hedged and delay is not None:
+                if self._take_hedge():
+                    hedge = self._pool.submit(fn)
+                    hedge.add_done_callback(self._release_hedge)
+                    pending.add(hedge)
+                delay = None
+                hedged = True
+
+        if pending or error is None:
+            with self._lock:
+                self.timeouts += 1
+            error = TimeoutError(f"Request quá hạn {self.deadline:.0f}s")
+        self._on_result(start, error)
+        raise error
+
+    async def call_async(self, factory: Callable[[], Awaitable[str]]) -> str:
+        """Giống call() cho coroutine; bản chậm hơn bị hủy"""
+        with self._lock:
+            self.calls += 1
+        start = time.perf_counter()
+        deadline_at = start + self.deadline
+        delay = self._hedge_delay()
+
+        first = asyncio.ensure_future(factory())
+        pending = {first}
+        hedged = False
+        error: Optional[BaseException] = None
+
+        try:
+            while pending:
+                remaining = deadline_at - time.perf_counter()
+                if remaining <= 0:
+                    break
+                timeout = remaining
+                if not hedged and delay is not None:
+                    timeout = min(remaining, max(0.0, start + delay - time.perf_counter()))
+
+                done, pending = await asyncio.wait(pending, timeout=timeout,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self._on_result(start, None, hedge_won=task is not first)
+                        return task.result()
+                    error = task.exception()
+
+                if not done and not hedged and delay is not None:
+                    if self._take_hedge():
+                        hedge = asyncio.ensure_future(factory())
+                        hedge.add_done_callback(self._release_hedge)
+                        pending.add(hedge)
+                    delay = None
+                    hedged = True
+        finally:
+            for task in pending:
+                task.cancel()
+
+        if pending or error is None:
+            with self._lock:
+                self.timeouts += 1
+            error = TimeoutError(f"Request quá hạn {self.deadline:.0f}s")
+        self._on_result(start, error)
+        raise error
+
+    # ------------------------------------------------------------------ #
+    # Thống kê
+    # ------------------------------------------------------------------ #
+    def stats(self) -> Dict[str, float]:
+        """Độ trễ p50/p95/p99 (giây), số hedge, timeout, số lần mở mạch"""
+        with self._lock:
+            counters = {"calls": self.calls, "hedges": self.hedges,
+                        "hedge_wins": self.hedge_wins, "timeouts": self.timeouts}
+        return {**self.latency.snapshot(), **counters,
+                "breaker": self.breaker.state, "breaker_trips": self.breaker.trips}
+
+    def reset_stats(self):
+        """Xóa bộ đếm của job trước (giữ mẫu độ trễ để tính ngưỡng hedge)"""
+        with self._lock:
+            self.calls = self.hedges = self.hedge_wins = self.timeouts = 0
+        self.breaker.trips = 0
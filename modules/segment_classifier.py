@@ -0,0 +1,128 @@
+"""
+Phân loại segment trước khi dịch: nhận ra text không cần gửi lên API
+- Số, số trang, ô bảng chỉ có số liệu
+- URL, email
+- Dòng code
+- Công thức hóa học / toán học
+- Text đã là tiếng Việt
+Chỉ dùng regex và thống kê ký tự nên đủ nhanh để chạy trên mọi dòng của tài liệu
+"""
+
+import re
+from collections import Counter
+from typing import Dict
+
+
+# Loại segment
+TRANSLATE = "translate"
+NUMERIC = "numeric"
+URL = "url"
+CODE = "code"
+FORMULA = "formula"
+VIETNAMESE = "vietnamese"
+
+_URL_RE = re.compile(r"^(?:(?:https?://|www\.)\S+|[\w.+-]+@[\w-]+(?:\.[\w-]+)+)$", re.IGNORECASE)
+# Số La Mã viết thường đứng một mình (số trang phần mở đầu, đánh số mục: ii, (iv), xiv.)
+# Tối đa 6 ký tự, không có m / d để không nhận nhầm từ thật ("mix", "dim", "mid")
+_ROMAN_RE = re.compile(r"^(?=[clxvi]{1,6}$)c{0,3}(?:x[cl]|l?x{0,3})(?:i[xv]|v?i{0,3})$")
+# Từ "thật": từ 3 chữ cái trở lên có chữ thường, hoặc viết hoa toàn bộ nhưng không phải mã
+# tiền tệ / chỉ số (tiêu đề "CHAPTER 1 OVERVIEW" vẫn phải dịch, "USD 1,234" thì không)
+_WORD_RE = re.compile(r"[^\W\d_]*[a-zà-ỹđ][^\W\d_]*")
+_UPPER_WORD_RE = re.compile(r"\b[^\W\d_]{3,}\b")
+_CODE_TOKENS = {
+    "USD", "EUR", "GBP", "JPY", "CNY", "VND", "AUD", "CAD", "CHF", "HKD", "SGD", "KRW", "INR",
+    "EBIT", "EBITDA", "YOY", "QOQ", "YTD", "QTD", "MTD", "CAGR", "EPS", "ROE", "ROA", "ROI",
+}
+_CODE_START_RE = re.compile(
+    r"^\s*(?:def|class|import|from\s+\S+\s+import|return|elif|#include|#define|public|private|"
+    r"protected|static|void|var|let|const|function|SELECT|INSERT|UPDATE|DELETE)\b"
+)
+_CODE_END_RE = re.compile(r"\w\(|[:;{]\s*$| = ")
+_CODE_CHARS = set("{}[]();=<>_/\\*&|#$@~`^")
+_CHEM_TOKEN_RE = re.compile(r"^(?:\(?(?:[A-Z][a-z]?\d*)+\)?\d*)+(?:[+-]|\d[+-])?$")
+_MATH_OPERATORS = set("=+−-×÷*/^<>≤≥≈∑∫√→⇌±")
+# Tên hàm / ký hiệu toán không tính là từ của câu văn
+_MATH_WORDS = {"sin", "cos", "tan", "cot", "log", "ln", "exp", "lim", "max", "min", "det", "mod"}
+# Chỉ các chữ cái riêng của tiếng Việt: ă, ơ, ư, đ, dấu nặng / hỏi / ngã và mũ kèm dấu thanh.
+# Không tính à, é, ê, ô... vì tiếng Pháp và nhiều ngôn ngữ khác cũng có ("Café crème brûlée")
+_VIETNAMESE_CHARS = set(
+    "ăằắẳẵặạảẩẫậấầẹẻẽểễệếềỉịĩọỏộổỗốồơờớởỡợụủũưừứửữựỳỵỷỹđ"
+)
+
+
+class SegmentClassifier:
+    """Phân loại text: TRANSLATE hoặc một loại không cần dịch (giữ nguyên)"""
+
+    def __init__(self, vietnamese_ratio: float = 0.1):
+        """
+        Args:
+            vietnamese_ratio: Tỉ lệ chữ cái riêng của tiếng Việt tối thiểu để coi là tiếng Việt
+        """
+        self.vietnamese_ratio = vietnamese_ratio
+        self.counts: Counter = Counter()
+
+    def classify(self, text: str) -> str:
+        """Trả về loại của segment"""
+        stripped = text.strip()
+        letters = [c for c in stripped if c.isalpha()]
+
+        if len(letters) < 2 or _ROMAN_RE.match(stripped.strip("().-–— ")):
+            return NUMERIC
+        if _URL_RE.match(stripped):
+            return URL
+
+        words = [w for w in _WORD_RE.findall(stripped) if len(w) >= 3]
+        words += [w for w in _UPPER_WORD_RE.findall(stripped)
+                  if w.isupper() and w not in _CODE_TOKENS]
+        if self._is_code(stripped, words):
+            return CODE
+        if self._is_formula(stripped):
+            return FORMULA
+        if not words and any(c.isdigit() for c in stripped):
+            return NUMERIC  # "USD 1,234", "Q3 2024", "12.5 %"
+        if self._is_vietnamese(letters):
+            return VIETNAMESE
+        return TRANSLATE
+
+    def should_translate(self, text: str) -> bool:
+        """True nếu cần dịch; ghi nhận thống kê theo loại"""
+        kind = self.classify(text)
+        self.counts[kind] += 1
+        return kind == TRANSLATE
+
+    def stats(self) -> Dict[str, int]:
+        """Số segment bỏ qua theo từng loại"""
+        return {kind: n for kind, n in self.counts.items() if kind != TRANSLATE}
+
+    def reset_stats(self):
+        self.counts.clear()
+
+    def _is_vietnamese(self, letters) -> bool:
+        marked = sum(1 for c in letters if c.lower() in _VIETNAMESE_CHARS)
+        return marked >= 2 and marked / len(letters) >= self.vietnamese_ratio
+
+    @staticmethod
+    def _is_code(text: str, words) -> bool:
+        if _CODE_START_RE.match(text):
+            return bool(_CODE_END_RE.search(text))
+        # Kết thúc như câu lệnh, nhưng câu văn dài có dấu ";" vẫn là văn bản
+        if text.endswith((";", "{", "}")) and any(c in text for c in "(=") and len(words) < 4:
+            return True
+        symbols = sum(1 for c in text if c in _CODE_CHARS)
+        return symbols / len(text) >= 0.25
+
+    @staticmethod
+    def _is_formula(text: str) -> bool:
+        tokens = text.split()
+        # Công thức hóa học: H2SO4, C6H12O6, CO2 + H2O → H2CO3
+        chem = [t for t in tokens if t not in _MATH_OPERATORS]
+        if chem and all(_CHEM_TOKEN_RE.match(t) for t in chem) and \
+                any(c.isdigit() for c in text) and any(c.isupper() for c in text):
+            return True
+        # Công thức toán (E = mc^2, a + b = c, y = sin x): có dấu "=" và gần như không có từ,
+        # hoặc toán tử chiếm từ nửa số token trở lên. "Set A = B" là câu văn, vẫn dịch
+        if "=" not in text:
+            return False
+        words = [t for t in tokens if t.isalpha() and len(t) >= 2 and t.lower() not in _MATH_WORDS]
+        operators = sum(1 for t in tokens if all(c in _MATH_OPERATORS for c in t))
+        return not words or operators * 2 >= len(tokens)
@@ -0,0 +1,67 @@
+"""
+Single-flight: nhiều thread cùng cần dịch một key thì chỉ một thread gửi request,
+các thread còn lại chờ và dùng chung kết quả
+"""
+
+import threading
+from typing import Callable, Dict, Optional, Tuple
+
+
+class _Call:
+    """Một request đang bay"""
+
+    __slots__ = ("event", "result")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Optional[str] = None
+
+
+class SingleFlight:
+    """Gộp các yêu cầu trùng key đang chạy đồng thời"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self.coalesced = 0  # Số lần dùng chung request của thread khác
+
+    def acquire(self, key: str) -> Tuple[bool, _Call]:
+        """
+        Nhận key: trả về (True, call) nếu thread này phải tự gửi request (leader),
+        (False, call) nếu đã có thread khác đang gửi - khi đó gọi wait(call)
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                return False, call
+            call = _Call()
+            self._calls[key] = call
+            return True, call
+
+    def resolve(self, key: str, result: Optional[str]):
+        """Leader báo kết quả (None nếu thất bại) và đánh thức các thread đang chờ"""
+        with self._lock:
+            call = self._calls.pop(key, None)
+        if call is not None:
+            call.result = result
+            call.event.set()
+
+    @staticmethod
+    def wait(call: _Call, timeout: Optional[float] = None) -> Optional[str]:
+        """Chờ leader xong, trả về kết quả (None nếu leader thất bại hoặc quá timeout)"""
+        call.event.wait(timeout)
+        return call.result
+
+    def do(self, key: str, fn: Callable[[], str], timeout: Optional[float] = None) -> Optional[str]:
+        """Chạy fn() cho key, hoặc chờ kết quả nếu key đang được thread khác chạy"""
+        leader, call = self.acquire(key)
+        if not leader:
+            return self.wait(call, timeout)
+
+        result = None
+        try:
+            result = fn()
+            return result
+        finally:
+            self.resolve(key, result)
@@ -0,0 +1,77 @@
+"""
+Tiện ích cho kết quả dịch dạng stream (index, bản dịch)
+- PageAssembler: gom kết quả theo trang, nhả trang khi tất cả segment của trang đã xong
+- iter_completed_pages: bọc stream thành các trang hoàn chỉnh để render song song với dịch
+"""
+
+from collections import defaultdict
+from typing import Dict, Iterable, Iterator, List, Sequence, Tuple
+
+
+class PageAssembler:
+    """
+    Theo dõi segment nào thuộc trang nào, báo trang đã đủ bản dịch
+
+    in_order=True: chỉ nhả trang theo thứ tự tăng dần (trang 5 chờ trang 4 xong),
+    phù hợp khi ghi PDF tuần tự. in_order=False: nhả ngay khi trang đủ.
+    """
+
+    def __init__(self, page_of: Sequence[int], in_order: bool = True):
+        """
+        Args:
+            page_of: page_of[i] là số trang của segment thứ i
+            in_order: Nhả trang theo thứ tự hay không
+        """
+        self.in_order = in_order
+        self._remaining: Dict[int, int] = defaultdict(int)
+        for page in page_of:
+            self._remaining[page] += 1
+        self._page_of = page_of
+        self._pages = sorted(self._remaining)
+        self._next_pos = 0  # Vị trí trang kế tiếp cần nhả (khi in_order)
+        self._ready: Dict[int, bool] = {}
+        self._translations: Dict[int, List[Tuple[int, str]]] = defaultdict(list)
+
+    def add(self, index: int, translation: str) -> List[int]:
+        """Ghi nhận một segment xong, trả về các trang vừa được nhả"""
+        page = self._page_of[index]
+        self._translations[page].append((index, translation))
+        self._remaining[page] -= 1
+        if self._remaining[page] > 0:
+            return []
+
+        if not self.in_order:
+            return [page]
+
+        self._ready[page] = True
+        released = []
+        while self._next_pos < len(self._pages) and self._ready.pop(self._pages[self._next_pos], False):
+            released.append(self._pages[self._next_pos])
+            self._next_pos += 1
+        return released
+
+    def pop_page(self, page: int) -> List[Tuple[int, str]]:
+        """Lấy (index, bản dịch) của một trang đã nhả, sắp theo index, và giải phóng bộ nhớ"""
+        return sorted(self._translations.pop(page, []))
+
+    @property
+    def pending_pages(self) -> int:
+        """Số trang chưa được nhả"""
+        return len(self._pages) - self._next_pos if self.in_order else \
+            sum(1 for n in self._remaining.values() if n > 0)
+
+
+def iter_completed_pages(stream: Iterable[Tuple[int, str]], page_of: Sequence[int],
+                         in_order: bool = True) -> Iterator[Tuple[int, List[Tuple[int, str]]]]:
+    """
+    Chuyển stream (index, bản dịch) thành (trang, [(index, bản dịch), ...]) khi trang đủ
+
+    Ví dụ:
+        stream = translator.translate_batch_stream([b.text for b in blocks])
+        for page, items in iter_completed_pages(stream, [b.page_num for b in blocks]):
+            ...  # render trang `page` trong khi các trang sau vẫn đang dịch
+    """
+    assembler = PageAssembler(page_of, in_order=in_order)
+    for index, translation in stream:
+        for page in assembler.add(index, translation):
+            yield page, assembler.pop_page(page)
@@ -0,0 +1,126 @@
+"""
+Đo và xếp chữ vào khung bằng độ rộng glyph thật của font
+- Advance của từng ký tự lấy từ fitz.Font một lần rồi cache, đo chuỗi chỉ là cộng số
+- Độ rộng từ tính ở cỡ chữ 1 rồi nhân theo cỡ chữ -> thử cỡ chữ không cần đo lại
+- Tìm cỡ chữ lớn nhất vừa khung bằng tìm kiếm nhị phân, không phải chèn thử vào trang
+"""
+
+from typing import Dict, List, Tuple
+
+
+class TextFitter:
+    """Chia dòng và chọn cỡ chữ cho một font"""
+
+    def __init__(self, font, line_height: float = 1.15):
+        """
+        Args:
+            font: fitz.Font (cần glyph_advance, ascender, descender)
+            line_height: Khoảng cách dòng / cỡ chữ
+        """
+        self.font = font
+        self.line_height = line_height
+        self.ascender = font.ascender
+        self.descender = font.descender
+        self._advances: Dict[str, float] = {}
+
+    def width(self, text: str) -> float:
+        """Độ rộng của text ở cỡ chữ 1"""
+        advances = self._advances
+        total = 0.0
+        for ch in text:
+            advance = advances.get(ch)
+            if advance is None:
+                advance = advances[ch] = self.font.glyph_advance(ord(ch))
+            total += advance
+        return total
+
+    def text_height(self, lines: int, size: float) -> float:
+        """Chiều cao của `lines` dòng ở cỡ chữ size"""
+        return size * (self.line_height * (lines - 1) + self.ascender - self.descender)
+
+    def fit(self, text: str, width: float, height: float, max_size: float,
+            min_size: float = 6.0, precision: float = 0.1) -> Tuple[float, List[str]]:
+        """
+        Cỡ chữ lớn nhất (<= max_size) để text xuống dòng vừa khung width x height,
+        và các dòng ở cỡ chữ đó. Không vừa cả ở min_size thì trả về min_size (text tràn).
+        """
+        min_size = min(min_size, max_size)
+        paragraphs = [p.split() for p in text.split("\n")]
+        widths = [[self.width(w) for w in words] for words in paragraphs]
+        space = self.width(" ")
+
+        def line_count(size: float) -> int:
+            max_units = width / size
+            count = 0
+            for word_widths in widths:
+                count += max(1, self._count_lines(word_widths, space, max_units))
+            return count
+
+        def fits(size: float) -> bool:
+            return self.text_height(line_count(size), size) <= height
+
+        if fits(max_size):
+            size = max_size
+        elif not fits(min_size):
+            size = min_size
+        else:
+            low, high = min_size, max_size
+            while high - low > precision:
+                mid = (low + high) / 2
+                if fits(mid):
+                    low = mid
+                else:
+                    high = mid
+            size = low
+
+        lines: List[str] = []
+        for words, word_widths in zip(paragraphs, widths):
+            lines.extend(self._wrap(words, word_widths, space, width / size) or [""])
+        return size, lines
+
+    @staticmethod
+    def _count_lines(word_widths: List[float], space: float, max_units: float) -> int:
+        """Số dòng khi xếp tham lam (từ dài hơn dòng tính theo số dòng nó chiếm)"""
+        count = 0
+        current = -1.0  # Độ rộng dòng hiện tại, -1: chưa có dòng
+        for w in word_widths:
+            if current >= 0 and current + space + w <= max_units:
+                current += space + w
+            elif w <= max_units:
+                count += 1
+                current = w
+            else:
+                pieces = int(w // max_units) + 1
+                count += pieces
+                current = w - (pieces - 1) * max_units
+        return count
+
+    def _wrap(self, words: List[str], word_widths: List[float], space: float,
+              max_units: float) -> List[str]:
+        """Xếp tham lam thành các dòng (từ dài hơn dòng bị ngắt theo ký tự)"""
+        lines: List[str] = []
+        current: List[str] = []
+        current_width = 0.0
+        for word, w in zip(words, word_widths):
+            if current and current_width + space + w <= max_units:
+                current.append(word)
+                current_width += space + w
+                continue
+            if current:
+                lines.append(" ".join(current))
+            if w <= max_units:
+                current, current_width = [word], w
+                continue
+            # Từ quá dài (URL, mã...): ngắt theo ký tự
+            piece, piece_width = "", 0.0
+            for ch in word:
+                advance = self._advances[ch]
+                if piece and piece_width + advance > max_units:
+                    lines.append(piece)
+                    piece, piece_width = "", 0.0
+                piece += ch
+                piece_width += advance
+            current, current_width = [piece], piece_width
+        if current:
+            lines.append(" ".join(current))
+        return lines
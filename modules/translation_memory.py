@@ -0,0 +1,391 @@
+"""
+Bộ nhớ dịch (translation memory) lưu trên đĩa bằng SQLite
+- Chế độ WAL: nhiều thread đọc song song, không chặn nhau
+- Khóa theo cặp ngôn ngữ + hash của đoạn text đã chuẩn hóa
+- Giới hạn kích thước, tự xóa mục cũ (LRU theo last_used + theo tuổi)
+- Tra cứu gần đúng (MinHash LSH) cho câu chỉ khác vài từ / dấu câu
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from modules.app_paths import get_app_data_dir
+from modules.fuzzy_index import MinHashLSH
+
+
+class TranslationMemory:
+    """Cache bản dịch bền vững giữa các lần chạy"""
+
+    # Gom các lần cập nhật last_used lại, đủ số này thì ghi xuống đĩa một lần
+    TOUCH_FLUSH_SIZE = 256
+
+    def __init__(self, db_path: Optional[str] = None,
+                 source_lang: str = "en", target_lang: str = "vi",
+                 max_entries: int = 500_000, max_age_days: float = 365,
+                 fuzzy: bool = True):
+        """
+        Args:
+            db_path: File SQLite (mặc định nằm trong thư mục dữ liệu ứng dụng)
+            source_lang, target_lang: Cặp ngôn ngữ, là một phần của khóa
+            max_entries: Số mục tối đa, vượt quá sẽ xóa mục ít dùng nhất
+            max_age_days: Mục không được dùng lâu hơn số ngày này sẽ bị xóa
+            fuzzy: Duy trì index LSH cho fuzzy_get_many
+        """
+        self.db_path = db_path or os.path.join(get_app_data_dir(), "translation_memory.db")
+        self.source_lang = source_lang
+        self.target_lang = target_lang
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_days * 86400
+
+        self._local = threading.local()  # Mỗi thread một connection
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._write_lock = threading.Lock()  # SQLite chỉ cho 1 writer
+
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+        self._pending_touches: List[Tuple[str, str, str]] = []
+        self._writes_since_evict = 0
+
+        self.lsh = MinHashLSH() if fuzzy else None
+        self.fuzzy_hits = 0
+
+        self._init_db()
+        if self.lsh is not None:
+            self._start_fuzzy_backfill()
+
+    # ------------------------------------------------------------------ #
+    # Kết nối
+    # ------------------------------------------------------------------ #
+    def _connect(self) -> sqlite3.Connection:
+        """Lấy connection của thread hiện tại (tạo mới nếu chưa có)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def _init_db(self):
+        """Tạo bảng và xóa mục quá hạn"""
+        conn = self._connect()
+        with self._write_lock:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS tm (
+                    src_lang  TEXT NOT NULL,
+                    tgt_lang  TEXT NOT NULL,
+                    key_hash  TEXT NOT NULL,
+                    source    TEXT NOT NULL,
+                    target    TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used  REAL NOT NULL,
+                    PRIMARY KEY (src_lang, tgt_lang, key_hash)
+                ) WITHOUT ROWID
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_tm_last_used ON tm(last_used)")
+            # Index LSH: (band, bucket) -> các key có chữ ký trùng band đó
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS tm_lsh (
+                    src_lang TEXT NOT NULL,
+                    tgt_lang TEXT NOT NULL,
+                    band     INTEGER NOT NULL,
+                    bucket   INTEGER NOT NULL,
+                    key_hash TEXT NOT NULL,
+                    PRIMARY KEY (src_lang, tgt_lang, band, bucket, key_hash)
+                ) WITHOUT ROWID
+            """)
+            conn.execute("CREATE TABLE IF NOT EXISTS tm_meta (name TEXT PRIMARY KEY, value TEXT)")
+            conn.commit()
+        self.evict()
+
+    @staticmethod
+    def _hash(key: str) -> str:
+        """Hash của đoạn text đã chuẩn hóa"""
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+    # ------------------------------------------------------------------ #
+    # Đọc / ghi
+    # ------------------------------------------------------------------ #
+    def get(self, key: str) -> Optional[str]:
+        """Tra cứu một đoạn text (key đã chuẩn hóa), trả về None nếu chưa có"""
+        key_hash = self._hash(key)
+        row = self._connect().execute(
+            "SELECT target FROM tm WHERE src_lang=? AND tgt_lang=? AND key_hash=?",
+            (self.source_lang, self.target_lang, key_hash),
+        ).fetchone()
+
+        with self._stats_lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        self._touch([key_hash])
+        return row[0]
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, str]:
+        """Tra cứu nhiều key một lúc, trả về dict key -> bản dịch cho các key có trong cache"""
+        by_hash = {self._hash(k): k for k in keys}
+        found: Dict[str, str] = {}
+        hashes = list(by_hash)
+        conn = self._connect()
+
+        # SQLite giới hạn số tham số mỗi câu lệnh
+        for start in range(0, len(hashes), 500):
+            chunk = hashes[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                f"SELECT key_hash, target FROM tm WHERE src_lang=? AND tgt_lang=? "
+                f"AND key_hash IN ({placeholders})",
+                (self.source_lang, self.target_lang, *chunk),
+            ).fetchall()
+            for key_hash, target in rows:
+                found[by_hash[key_hash]] = target
+
+        with self._stats_lock:
+            self.hits += len(found)
+            self.misses += len(by_hash) - len(found)
+        self._touch(self._hash(key) for key in found)
+        return found
+
+    def put(self, key: str, translation: str):
+        """Lưu một bản dịch"""
+        self.put_many([(key, translation)])
+
+    def put_many(self, items: Iterable[Tuple[str, str]]):
+        """Lưu nhiều bản dịch trong một transaction"""
+        now = time.time()
+        rows = [
+            (self.source_lang, self.target_lang, self._hash(key), key, translation, now, now)
+            for key, translation in items
+        ]
+        if not rows:
+            return
+
+        lsh_rows = self._lsh_rows((row[2], row[3]) for row in rows)
+
+        conn = self._connect()
+        with self._write_lock:
+            conn.executemany(
+                "INSERT OR REPLACE INTO tm "
+                "(src_lang, tgt_lang, key_hash, source, target, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            if lsh_rows:
+                conn.executemany("INSERT OR IGNORE INTO tm_lsh VALUES (?, ?, ?, ?, ?)", lsh_rows)
+            self._flush_touches(conn, now)
+            conn.commit()
+
+        with self._stats_lock:
+            self.writes += len(rows)
+            self._writes_since_evict += len(rows)
+            need_evict = self._writes_since_evict >= self.TOUCH_FLUSH_SIZE * 4
+            if need_evict:
+                self._writes_since_evict = 0
+        if need_evict:
+            self.evict()
+
+    def _touch(self, key_hashes: Iterable[str]):
+        """
+        Ghi nhận các mục vừa được đọc; đủ TOUCH_FLUSH_SIZE thì ghi last_used xuống đĩa
+        (tài liệu lấy hết từ cache không gọi put_many, hit vẫn phải được lưu để không bị evict)
+        """
+        with self._stats_lock:
+            self._pending_touches.extend(
+                (self.source_lang, self.target_lang, key_hash) for key_hash in key_hashes)
+            full = len(self._pending_touches) >= self.TOUCH_FLUSH_SIZE
+        if full:
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                print(f"Không ghi được last_used của bộ nhớ dịch: {e}")
+
+    def _flush_touches(self, conn: sqlite3.Connection, now: float):
+        """Ghi last_used cho các mục vừa được đọc (gọi khi đang giữ write lock)"""
+        with self._stats_lock:
+            touches, self._pending_touches = self._pending_touches, []
+        if touches:
+            conn.executemany(
+                "UPDATE tm SET last_used=? WHERE src_lang=? AND tgt_lang=? AND key_hash=?",
+                [(now, *t) for t in touches],
+            )
+
+    def flush(self):
+        """Ghi các cập nhật last_used còn treo xuống đĩa"""
+        conn = self._connect()
+        with self._write_lock:
+            self._flush_touches(conn, time.time())
+            conn.commit()
+
+    def evict(self):
+        """Xóa mục quá hạn và cắt bớt theo LRU nếu vượt max_entries"""
+        conn = self._connect()
+        with self._write_lock:
+            self._flush_touches(conn, time.time())
+            victims = []
+            if self.max_age_seconds:
+                victims = conn.execute(
+                    "SELECT src_lang, tgt_lang, key_hash FROM tm WHERE last_used < ?",
+                    (time.time() - self.max_age_seconds,)).fetchall()
+            count = conn.execute("SELECT COUNT(*) FROM tm").fetchone()[0]
+            overflow = count - len(victims) - self.max_entries
+            if overflow > 0:
+                victims += conn.execute(
+                    "SELECT src_lang, tgt_lang, key_hash FROM tm WHERE last_used >= ? "
+                    "ORDER BY last_used ASC LIMIT ?",
+                    (time.time() - self.max_age_seconds if self.max_age_seconds else 0,
+                     overflow)).fetchall()
+            if victims:
+                conn.executemany(
+                    "DELETE FROM tm WHERE src_lang=? AND tgt_lang=? AND key_hash=?", victims)
+                conn.executemany(
+                    "DELETE FROM tm_lsh WHERE src_lang=? AND tgt_lang=? AND key_hash=?", victims)
+            conn.commit()
+
+    # ------------------------------------------------------------------ #
+    # Tra cứu gần đúng
+    # ------------------------------------------------------------------ #
+    def _lsh_rows(self, items: Iterable[Tuple[str, str]]) -> List[tuple]:
+        """(key_hash, source) -> các dòng của bảng tm_lsh"""
+        if self.lsh is None:
+            return []
+        rows = []
+        for key_hash, source in items:
+            for band, bucket in self.lsh.band_keys(source) or ():
+                rows.append((self.source_lang, self.target_lang, band, bucket, key_hash))
+        return rows
+
+    def fuzzy_get_many(self, keys: Iterable[str], threshold: float = 0.9,
+                       max_candidates: int = 20) -> Dict[str, Tuple[str, float, str]]:
+        """
+        Tra cứu gần đúng: key -> (bản dịch, độ giống, câu gốc đã lưu) cho các key có
+        câu tương tự với độ giống >= threshold (không tính câu trùng khớp hoàn toàn)
+        """
+        if self.lsh is None:
+            return {}
+        conn = self._connect()
+        found: Dict[str, Tuple[str, float, str]] = {}
+        touched: List[str] = []
+
+        for key in keys:
+            band_keys = self.lsh.band_keys(key)
+            if not band_keys:
+                continue
+            # Mỗi band một truy vấn điểm theo primary key; ứng viên trùng nhiều band nhất trước
+            lookups = " UNION ALL ".join(
+                "SELECT key_hash FROM tm_lsh WHERE src_lang=? AND tgt_lang=? "
+                "AND band=? AND bucket=?" for _ in band_keys)
+            params = [v for band, bucket in band_keys
+                      for v in (self.source_lang, self.target_lang, band, bucket)]
+            rows = conn.execute(
+                f"SELECT t.key_hash, t.source, t.target FROM ("
+                f"  SELECT key_hash, COUNT(*) AS hits FROM ({lookups}) "
+                f"  GROUP BY key_hash ORDER BY hits DESC LIMIT ?"
+                f") c JOIN tm t ON t.src_lang=? AND t.tgt_lang=? AND t.key_hash=c.key_hash",
+                (*params, max_candidates, self.source_lang, self.target_lang),
+            ).fetchall()
+
+            best = None
+            for key_hash, source, target in rows:
+                if source == key:
+                    continue
+                score = self.lsh.similarity(key, source)
+                if score >= threshold and (best is None or score > best[1]):
+                    best = (target, score, source, key_hash)
+            if best is not None:
+                found[key] = best[:3]
+                touched.append(best[3])
+
+        with self._stats_lock:
+            self.fuzzy_hits += len(found)
+        self._touch(touched)
+        return found
+
+    def _start_fuzzy_backfill(self):
+        """Tạo index LSH cho các mục có từ trước khi bật tra gần đúng (chạy nền, một lần)"""
+        row = self._connect().execute(
+            "SELECT value FROM tm_meta WHERE name='lsh_backfilled'").fetchone()
+        if row is not None:
+            return
+        threading.Thread(target=self._fuzzy_backfill, daemon=True).start()
+
+    def _fuzzy_backfill(self, chunk: int = 2000):
+        try:
+            conn = self._connect()
+            last = ("", "", "")
+            while True:
+                rows = conn.execute(
+                    "SELECT src_lang, tgt_lang, key_hash, source FROM tm "
+                    "WHERE (src_lang, tgt_lang, key_hash) > (?, ?, ?) "
+                    "ORDER BY src_lang, tgt_lang, key_hash LIMIT ?",
+                    (*last, chunk)).fetchall()
+                if not rows:
+                    break
+                lsh_rows = []
+                for src_lang, tgt_lang, key_hash, source in rows:
+                    for band, bucket in self.lsh.band_keys(source) or ():
+                        lsh_rows.append((src_lang, tgt_lang, band, bucket, key_hash))
+                with self._write_lock:
+                    conn.executemany("INSERT OR IGNORE INTO tm_lsh VALUES (?, ?, ?, ?, ?)",
+                                     lsh_rows)
+                    conn.commit()
+                last = rows[-1][:3]
+
+            with self._write_lock:
+                conn.execute("INSERT OR REPLACE INTO tm_meta VALUES ('lsh_backfilled', '1')")
+                conn.commit()
+        except sqlite3.Error as e:
+            print(f"Không tạo được index tra gần đúng: {e}")
+
+    # ------------------------------------------------------------------ #
+    # Thống kê
+    # ------------------------------------------------------------------ #
+    def __len__(self) -> int:
+        row = self._connect().execute(
+            "SELECT COUNT(*) FROM tm WHERE src_lang=? AND tgt_lang=?",
+            (self.source_lang, self.target_lang),
+        ).fetchone()
+        return row[0]
+
+    def stats(self) -> Dict[str, float]:
+        """Số lần hit/miss/ghi và tỉ lệ hit"""
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "writes": self.writes,
+                "fuzzy_hits": self.fuzzy_hits,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def reset_stats(self):
+        """Đặt lại bộ đếm (ví dụ trước mỗi tài liệu)"""
+        with self._stats_lock:
+            self.hits = self.misses = self.writes = self.fuzzy_hits = 0
+
+    def close(self):
+        """Ghi nốt dữ liệu treo và đóng tất cả connection"""
+        try:
+            self.flush()
+        except sqlite3.Error:
+            pass
+        with self._connections_lock:
+            for conn in self._connections:
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            self._connections.clear()
+        self._local = threading.local()
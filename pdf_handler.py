@@ -5,10 +5,19 @@ Giống cách onlinedoctranslator.com hoạt động
 """
 
 import fitz  # PyMuPDF
-from typing import List, Dict, Optional, Tuple
-from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator, List, Dict, Optional, Tuple
+from dataclasses import dataclass, asdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import hashlib
 import os
 import re
+import shutil
+import tempfile
+import time
+
+from modules.block_store import BlockStore
+from modules.extraction_cache import ExtractionCache
+from modules.text_fit import TextFitter
 
 
 @dataclass
@@ -22,6 +31,134 @@ class TextBlock:
     color: Tuple[float, float, float] = (0, 0, 0)  # RGB (0-1)
     page_num: int = 0
     flags: int = 0  # Font flags (bold, italic, etc.)
+    block_num: int = -1  # Số thứ tự block PyMuPDF trong trang
+    line_num: int = 0  # Số thứ tự line trong block
+    line_count: int = 1  # Số line đã gộp (> 1 nếu là đoạn văn)
+
+    def to_dict(self) -> Dict:
+        """Chuyển sang dict (để ghi JSON)"""
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "TextBlock":
+        """Tạo lại TextBlock từ dict của to_dict()"""
+        data = dict(data)
+        data["bbox"] = tuple(data.get("bbox", (0, 0, 0, 0)))
+        data["color"] = tuple(data.get("color", (0, 0, 0)))
+        return cls(**data)
+
+
+# Từ số trang này trở lên thì đọc bằng nhiều process (ít trang thì chi phí khởi động lớn hơn lợi)
+PARALLEL_MIN_PAGES = 200
+EXTRACT_CHUNK_PAGES = 50  # Số trang tối đa mỗi đoạn giao cho một process
+
+
+# Cách lưu file đầu ra: đánh đổi thời gian lưu và kích thước file
+# - fast: chỉ bỏ object không dùng và nén stream mới
+# - balanced: thêm subset font (chỉ giữ glyph đã dùng), gộp object trùng và làm sạch
+#   content stream (gộp các stream TextWriter / shape thêm vào mỗi trang - vừa nhỏ hơn
+#   vừa lưu nhanh hơn nhiều so với chỉ garbage cao)
+# - max: thêm so sánh cả stream trùng (font / ảnh), nén lại ảnh / font
+#        và object stream (PyMuPDF mới có use_objstms)
+SAVE_PROFILES = {
+    "fast": {"garbage": 1, "deflate": True},
+    "balanced": {"subset_fonts": True, "garbage": 3, "deflate": True, "clean": True},
+    "max": {"subset_fonts": True, "garbage": 4, "deflate": True, "clean": True,
+            "deflate_images": True, "deflate_fonts": True, "use_objstms": 1},
+}
+
+
+def _int_to_rgb(color_int: int) -> Tuple[float, float, float]:
+    """Chuyển màu từ integer sang RGB float (0-1)"""
+    r = ((color_int >> 16) & 0xFF) / 255.0
+    g = ((color_int >> 8) & 0xFF) / 255.0
+    b = (color_int & 0xFF) / 255.0
+    return (r, g, b)
+
+
+def _extract_page(page, page_num: int) -> List[TextBlock]:
+    """Trích xuất các line của một trang (mỗi line gộp từ các span)"""
+    return [TextBlock(text=text, original_text=text, bbox=bbox, font_size=font_size,
+                      font_name=font_name, color=_int_to_rgb(color), page_num=page_num,
+                      flags=flags, block_num=block_num, line_num=line_num)
+            for text, bbox, font_size, font_name, color, flags, block_num, line_num
+            in _iter_page_lines(page)]
+
+
+def _iter_page_lines(page):
+    """
+    Sinh (text, bbox, font_size, font_name, màu int, flags, block_num, line_num)
+    cho từng line có nội dung của trang
+    """
+    # Lấy text với đầy đủ thông tin
+    text_dict = page.get_text("dict", flags=fitz.TEXT_PRESERVE_WHITESPACE)
+    
+    for block_idx, block in enumerate(text_dict.get("blocks", [])):
+        if block.get("type") != 0:  # Chỉ xử lý text block
+            continue
+        block_num = block.get("number", block_idx)
+        
+        # GỘP CẢ LINE thay vì lấy từng span
+        for line_num, line in enumerate(block.get("lines", [])):
+            # Gộp tất cả spans trong một line
+            line_text = ""
+            line_bbox = None
+            max_font_size = 0
+            dominant_font = ""
+            dominant_color = 0
+            flags = 0
+            
+            for span in line.get("spans", []):
+                span_text = span.get("text", "")
+                line_text += span_text
+                
+                # Tính bbox bao toàn bộ line
+                span_bbox = span.get("bbox", (0, 0, 0, 0))
+                if line_bbox is None:
+                    line_bbox = list(span_bbox)
+                else:
+                    line_bbox[0] = min(line_bbox[0], span_bbox[0])  # x0
+                    line_bbox[1] = min(line_bbox[1], span_bbox[1])  # y0
+                    line_bbox[2] = max(line_bbox[2], span_bbox[2])  # x1
+                    line_bbox[3] = max(line_bbox[3], span_bbox[3])  # y1
+                
+                # Lấy font size lớn nhất
+                if span.get("size", 0) > max_font_size:
+                    max_font_size = span.get("size", 11)
+                    dominant_font = span.get("font", "")
+                    dominant_color = span.get("color", 0)
+                    flags = span.get("flags", 0)
+            
+            # Chỉ thêm nếu có nội dung
+            if line_text.strip():
+                yield (line_text, tuple(line_bbox) if line_bbox else (0, 0, 0, 0),
+                       max_font_size, dominant_font, dominant_color, flags,
+                       block_num, line_num)
+
+
+def _extract_pages(pdf_path: str, page_nums: List[int]) -> Dict[int, List[TextBlock]]:
+    """Chạy trong process con: tự mở file và đọc các trang page_nums"""
+    doc = fitz.open(pdf_path)
+    try:
+        return {page_num: _extract_page(doc[page_num], page_num) for page_num in page_nums}
+    finally:
+        doc.close()
+
+
+def _render_part(pdf_path: str, from_page: int, to_page: int,
+                 blocks_by_page: Dict[int, List[TextBlock]], part_path: str,
+                 font_path: Optional[str]) -> str:
+    """Chạy trong process con: render các trang [from_page, to_page] ra part_path"""
+    global _worker_handler
+    if _worker_handler is None or _worker_handler.viet_font_path != font_path:
+        _worker_handler = PDFHandler(font_path=font_path)
+    _worker_handler._render_part(pdf_path, from_page, to_page, blocks_by_page, part_path)
+    return part_path
+
+
+_REF_RE = re.compile(r"\b(\d+) 0 R\b")  # Tham chiếu object trong source của object PDF
+
+_worker_handler = None  # PDFHandler của process con (font / bảng glyph dùng lại giữa các đoạn)
 
 
 class PDFHandler:
@@ -34,11 +171,19 @@ class PDFHandler:
     3. Tìm và thay thế text trong PDF gốc
     """
     
-    def __init__(self):
-        """Khởi tạo PDF handler"""
-        self.viet_font_path = self._find_vietnamese_font()
-        self._font_cache = {}  # Cache font đã load
+    def __init__(self, font_path: Optional[str] = None):
+        """
+        Khởi tạo PDF handler
+        
+        font_path: Font tiếng Việt đã biết (process render con) - bỏ qua tìm font và log
+        """
+        self.viet_font_path = font_path or self._find_vietnamese_font()
+        self._font_cache: Dict[str, TextFitter] = {}  # Cache font đã load (kèm bảng độ rộng glyph)
+        self._extraction_cache: Optional[ExtractionCache] = None
+        self.save_profile = "balanced"  # Xem SAVE_PROFILES
         
+        if font_path:
+            return
         if self.viet_font_path:
             print(f"✓ Font tiếng Việt: {self.viet_font_path}")
         else:
@@ -77,81 +222,307 @@ class PDFHandler:
         return None
 
     def extract_text_with_format(self, pdf_path: str,
-                                progress_callback: Optional[callable] = None) -> List[TextBlock]:
+                                progress_callback: Optional[callable] = None,
+                                workers: Optional[int] = None,
+                                use_cache: bool = True) -> List[TextBlock]:
         """
         Trích xuất text từ PDF - GỘP CẢ LINE thay vì từng span
         Giống cách onlinedoctranslator.com xử lý
+        
+        workers: Số process đọc song song theo đoạn trang (None: tự chọn theo số trang
+                 và số core, 1: đọc tuần tự). Kết quả giống hệt đọc tuần tự.
+        use_cache: Dùng cache trích xuất - file đã đọc trước đó không phải đọc lại,
+                   file sửa vài trang chỉ đọc lại các trang đã đổi
         """
-        text_blocks = []
+        cache = self._get_extraction_cache() if use_cache else None
+        doc_hash = None
+        if cache is not None:
+            doc_hash = cache.file_hash(pdf_path)
+            text_blocks = self._load_cached_document(cache, doc_hash)
+            if text_blocks is not None:
+                if progress_callback:
+                    progress_callback(1, 1, "Đang đọc")
+                print(f"Đã trích xuất {len(text_blocks)} text lines (từ cache)")
+                return text_blocks
         
         doc = fitz.open(pdf_path)
         total_pages = len(doc)
+        page_hashes: List[str] = []
+        cached: Dict[str, List[Dict]] = {}
+        if cache is not None:
+            page_hashes = [cache.page_hash(doc, doc[i]) for i in range(total_pages)]
+            cached = cache.get_pages(page_hashes)
+        doc.close()
+        todo = [i for i in range(total_pages) if not page_hashes or page_hashes[i] not in cached]
         
+        if workers is None:
+            workers = min(os.cpu_count() or 1, 8) if len(todo) >= PARALLEL_MIN_PAGES else 1
+        workers = max(1, min(workers, len(todo)))
+        
+        # Trang lấy từ cache coi như đã đọc xong
+        offset = total_pages - len(todo)
+        report = None
+        if progress_callback:
+            report = lambda done, _total, msg: progress_callback(offset + done, total_pages, msg)
+        if workers == 1:
+            extracted = dict(self.iter_text_blocks(pdf_path, report, pages=todo))
+        else:
+            extracted = self._extract_parallel(pdf_path, todo, workers, report)
+        
+        text_blocks = []
         for page_num in range(total_pages):
-            page = doc[page_num]
-            
-            # Lấy text với đầy đủ thông tin
-            text_dict = page.get_text("dict", flags=fitz.TEXT_PRESERVE_WHITESPACE)
-            
-            for block in text_dict.get("blocks", []):
-                if block.get("type") != 0:  # Chỉ xử lý text block
-                    continue
-                    
-                # GỘP CẢ LINE thay vì lấy từng span
-                for line in block.get("lines", []):
-                    # Gộp tất cả spans trong một line
-                    line_text = ""
-                    line_bbox = None
-                    max_font_size = 0
-                    dominant_font = ""
-                    dominant_color = (0, 0, 0)
-                    flags = 0
-                    
-                    for span in line.get("spans", []):
-                        span_text = span.get("text", "")
-                        line_text += span_text
-                        
-                        # Tính bbox bao toàn bộ line
-                        span_bbox = span.get("bbox", (0, 0, 0, 0))
-                        if line_bbox is None:
-                            line_bbox = list(span_bbox)
-                        else:
-                            line_bbox[0] = min(line_bbox[0], span_bbox[0])  # x0
-                            line_bbox[1] = min(line_bbox[1], span_bbox[1])  # y0
-                            line_bbox[2] = max(line_bbox[2], span_bbox[2])  # x1
-                            line_bbox[3] = max(line_bbox[3], span_bbox[3])  # y1
-                        
-                        # Lấy font size lớn nhất
-                        if span.get("size", 0) > max_font_size:
-                            max_font_size = span.get("size", 11)
-                            dominant_font = span.get("font", "")
-                            dominant_color = self._int_to_rgb(span.get("color", 0))
-                            flags = span.get("flags", 0)
-                    
-                    # Chỉ thêm nếu có nội dung
-                    if line_text.strip():
-                        text_blocks.append(TextBlock(
-                            text=line_text,
-                            original_text=line_text,
-                            bbox=tuple(line_bbox) if line_bbox else (0, 0, 0, 0),
-                            font_size=max_font_size,
-                            font_name=dominant_font,
-                            color=dominant_color,
-                            page_num=page_num,
-                            flags=flags
-                        ))
-            
-            if progress_callback:
-                progress_callback(page_num + 1, total_pages, "Đang đọc")
+            if page_num in extracted:
+                text_blocks.extend(extracted[page_num])
+            else:
+                text_blocks.extend(self._blocks_from_cache(cached[page_hashes[page_num]], page_num))
         
-        doc.close()
-        print(f"Đã trích xuất {len(text_blocks)} text lines (gộp từ spans)")
+        if cache is not None:
+            try:
+                cache.put(doc_hash, page_hashes, {
+                    page_hashes[page_num]: [self._block_to_cache(b) for b in extracted[page_num]]
+                    for page_num in todo})
+            except Exception as e:
+                print(f"Không lưu được cache trích xuất: {e}")
+        
+        if offset:
+            print(f"Đã trích xuất {len(text_blocks)} text lines "
+                  f"({offset}/{total_pages} trang từ cache)")
+        else:
+            print(f"Đã trích xuất {len(text_blocks)} text lines (gộp từ spans)")
+        return text_blocks
+
+    def _get_extraction_cache(self) -> Optional[ExtractionCache]:
+        """Mở cache trích xuất lần đầu cần dùng (lỗi thì chạy không cache)"""
+        if self._extraction_cache is None:
+            try:
+                self._extraction_cache = ExtractionCache()
+            except Exception as e:
+                print(f"Không mở được cache trích xuất: {e}")
+                return None
+        return self._extraction_cache
+
+    def _load_cached_document(self, cache: ExtractionCache,
+                              doc_hash: str) -> Optional[List[TextBlock]]:
+        """Blocks của tài liệu nếu cache có đủ mọi trang, ngược lại None"""
+        page_hashes = cache.get_document(doc_hash)
+        if page_hashes is None:
+            return None
+        pages = cache.get_pages(page_hashes)
+        if any(h not in pages for h in page_hashes):
+            return None
+        text_blocks = []
+        for page_num, page_hash in enumerate(page_hashes):
+            text_blocks.extend(self._blocks_from_cache(pages[page_hash], page_num))
         return text_blocks
 
+    @staticmethod
+    def _block_to_cache(block: TextBlock) -> Dict:
+        """Dict lưu cache: bỏ page_num (trang giống nhau có thể ở vị trí khác) và text trùng"""
+        data = block.to_dict()
+        del data["page_num"], data["text"]
+        return data
+
+    @staticmethod
+    def _blocks_from_cache(items: List[Dict], page_num: int) -> List[TextBlock]:
+        return [TextBlock.from_dict({**item, "text": item["original_text"], "page_num": page_num})
+                for item in items]
+
+    def iter_text_blocks(self, pdf_path: str,
+                         progress_callback: Optional[callable] = None,
+                         pages: Optional[List[int]] = None
+                         ) -> Iterator[Tuple[int, List[TextBlock]]]:
+        """
+        Đọc lần lượt từng trang, trả về (số trang, [TextBlock, ...]) ngay khi đọc xong trang đó
+        
+        Mỗi trang được giải phóng trước khi đọc trang sau, nên bộ nhớ chỉ tỉ lệ với số trang
+        phía sau (dịch / render) còn giữ, không phải cả tài liệu.
+        pages: Chỉ đọc các trang này (mặc định tất cả)
+        """
+        doc = fitz.open(pdf_path)
+        try:
+            if pages is None:
+                pages = range(len(doc))
+            total_pages = len(pages)
+            for done, page_num in enumerate(pages, 1):
+                page = doc.load_page(page_num)
+                page_blocks = _extract_page(page, page_num)
+                page = None  # Giải phóng page (display list, text page) trước khi trả về
+                if progress_callback:
+                    progress_callback(done, total_pages, "Đang đọc")
+                yield page_num, page_blocks
+        finally:
+            doc.close()
+
+    def extract_block_store(self, pdf_path: str,
+                            progress_callback: Optional[callable] = None) -> BlockStore:
+        """
+        Trích xuất giống extract_text_with_format nhưng ghi thẳng vào BlockStore dạng cột
+        (không tạo object TextBlock), phù hợp tài liệu rất lớn. Cần numpy.
+        """
+        store = BlockStore()
+        doc = fitz.open(pdf_path)
+        try:
+            total_pages = len(doc)
+            for page_num in range(total_pages):
+                page = doc.load_page(page_num)
+                for text, bbox, font_size, font_name, color, flags, block_num, line_num \
+                        in _iter_page_lines(page):
+                    store.append(text, bbox, font_size, font_name, color, page_num,
+                                 flags, block_num, line_num)
+                page = None
+                if progress_callback:
+                    progress_callback(page_num + 1, total_pages, "Đang đọc")
+        finally:
+            doc.close()
+        
+        print(f"Đã trích xuất {len(store)} text lines vào block store "
+              f"({store.nbytes / 1024:.0f} KB dữ liệu số, {len(store.font_names)} font)")
+        return store
+
+    def translate_streaming(self, pdf_path: str, output_path: str,
+                            translate_fn: Callable[[List[str]], List[str]],
+                            window_pages: int = 20, paragraphs: bool = False,
+                            progress_callback: Optional[callable] = None) -> int:
+        """
+        Đọc -> dịch -> render theo từng cửa sổ window_pages trang, không giữ cả tài liệu
+        
+        translate_fn: Nhận danh sách text, trả về bản dịch cùng thứ tự
+                      (ví dụ translator.translate_batch)
+        paragraphs: Gộp các dòng thành đoạn văn trước khi dịch
+        
+        Trả về số block đã dịch.
+        """
+        out = fitz.open(pdf_path)
+        total_pages = len(out)
+        total_blocks = 0
+        window: List[TextBlock] = []
+        window_count = 0
+        
+        def flush():
+            blocks = self._merge_paragraphs(window) if paragraphs else window
+            translations = translate_fn([b.text for b in blocks])
+            for block, text in zip(blocks, translations):
+                block.text = text
+            for page_num, page_blocks in self._group_by_page(blocks).items():
+                self._process_page(out[page_num], page_blocks)
+            return len(blocks)
+        
+        for page_num, page_blocks in self.iter_text_blocks(pdf_path):
+            window.extend(page_blocks)
+            window_count += 1
+            if window_count >= window_pages or page_num == total_pages - 1:
+                total_blocks += flush()
+                window, window_count = [], 0
+                if progress_callback:
+                    progress_callback(page_num + 1, total_pages, "Đang dịch và tạo PDF")
+        
+        self._save_output(out, output_path)
+        out.close()
+        print(f"✓ Đã lưu PDF: {output_path} ({total_blocks} blocks, dịch theo từng {window_pages} trang)")
+        return total_blocks
+
+    @staticmethod
+    def _group_by_page(blocks: Iterable[TextBlock]) -> Dict[int, List[TextBlock]]:
+        """Nhóm blocks theo trang (BlockStore: nhóm và sắp thứ tự đọc trên mảng)"""
+        if isinstance(blocks, BlockStore):
+            return blocks.group_by_page()
+        blocks_by_page: Dict[int, List[TextBlock]] = {}
+        for block in blocks:
+            blocks_by_page.setdefault(block.page_num, []).append(block)
+        return blocks_by_page
+
+    def _extract_parallel(self, pdf_path: str, pages: List[int], workers: int,
+                          progress_callback: Optional[callable]) -> Dict[int, List[TextBlock]]:
+        """
+        Chia các trang cần đọc thành nhiều đoạn, mỗi process tự mở file và đọc một đoạn
+        (document PyMuPDF không dùng chung được giữa thread/process)
+        
+        Trả về {số trang: [TextBlock, ...]}, người gọi ghép lại theo thứ tự trang.
+        """
+        total_pages = len(pages)
+        # Nhiều đoạn hơn số process để chia tải đều và cập nhật tiến trình thường xuyên
+        chunk = max(1, min(EXTRACT_CHUNK_PAGES, -(-total_pages // (workers * 4))))
+        chunks = [pages[start:start + chunk] for start in range(0, total_pages, chunk)]
+        print(f"Đọc song song {total_pages} trang: {workers} process, {len(chunks)} đoạn")
+        
+        results: Dict[int, List[TextBlock]] = {}
+        done_pages = 0
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(_extract_pages, pdf_path, page_nums): len(page_nums)
+                       for page_nums in chunks}
+            for future in as_completed(futures):
+                results.update(future.result())
+                done_pages += futures[future]
+                if progress_callback:
+                    progress_callback(done_pages, total_pages, "Đang đọc")
+        return results
+
+    def merge_paragraphs(self, text_blocks: List[TextBlock]) -> List[TextBlock]:
+        """
+        Gộp các line liên tiếp của cùng một block PyMuPDF thành đoạn văn
+        - Chỉ gộp khi cùng font, cỡ chữ, kiểu chữ và cùng căn lề (trái hoặc giữa)
+        - Từ bị ngắt bằng gạch nối cuối dòng ("transla-" + "tion") được nối lại
+        - bbox của đoạn là bbox bao tất cả line, khi render text tự xuống dòng trong đó
+        """
+        paragraphs = self._merge_paragraphs(text_blocks)
+        print(f"Đã gộp {len(text_blocks)} lines thành {len(paragraphs)} đoạn văn")
+        return paragraphs
+    
+    def _merge_paragraphs(self, text_blocks: List[TextBlock]) -> List[TextBlock]:
+        paragraphs: List[TextBlock] = []
+        prev_line: Optional[TextBlock] = None  # Line cuối của đoạn đang gộp
+        
+        for block in text_blocks:
+            last = paragraphs[-1] if paragraphs else None
+            if last is not None and self._continues_paragraph(last, prev_line, block):
+                last.text = self._join_lines(last.text, block.text)
+                last.original_text = last.text
+                last.bbox = (min(last.bbox[0], block.bbox[0]), min(last.bbox[1], block.bbox[1]),
+                             max(last.bbox[2], block.bbox[2]), max(last.bbox[3], block.bbox[3]))
+                last.line_count += 1
+            else:
+                text = block.text.strip()
+                paragraphs.append(TextBlock(**{**block.to_dict(), "text": text,
+                                               "original_text": text}))
+            prev_line = block
+        return paragraphs
+    
+    @staticmethod
+    def _continues_paragraph(paragraph: TextBlock, prev: TextBlock, line: TextBlock) -> bool:
+        """Line có phải là dòng tiếp theo (sau line prev) của đoạn văn không"""
+        if line.page_num != prev.page_num or line.block_num != prev.block_num or \
+                line.block_num < 0 or line.line_num != prev.line_num + 1:
+            return False
+        if line.font_name != prev.font_name or line.flags != prev.flags or \
+                abs(line.font_size - prev.font_size) > 0.5:
+            return False
+        
+        # Dòng sau phải nằm bên dưới, không cách quá xa
+        if line.bbox[1] < prev.bbox[1] or line.bbox[1] - prev.bbox[3] > prev.font_size:
+            return False
+        
+        # Cùng căn lề trái, hoặc cùng căn giữa (cho phép thụt đầu dòng ở dòng đầu)
+        tolerance = prev.font_size * 0.5
+        same_left = abs(line.bbox[0] - prev.bbox[0]) <= tolerance
+        indented_first = paragraph.line_count == 1 and 0 < prev.bbox[0] - line.bbox[0] <= prev.font_size * 3
+        same_center = abs((line.bbox[0] + line.bbox[2]) - (prev.bbox[0] + prev.bbox[2])) / 2 <= tolerance
+        return same_left or indented_first or same_center
+    
+    @staticmethod
+    def _join_lines(text: str, next_line: str) -> str:
+        """Nối dòng, bỏ gạch nối nếu từ bị ngắt giữa hai dòng"""
+        text = text.rstrip()
+        next_line = next_line.strip()
+        if re.search(r"[^\W\d_]-$", text) and next_line[:1].islower():
+            return text[:-1] + next_line
+        return f"{text} {next_line}"
+
     def create_translated_pdf(self, original_pdf_path: str,
-                            translated_blocks: List[TextBlock],
+                            translated_blocks,
                             output_path: str,
-                            progress_callback: Optional[callable] = None):
+                            progress_callback: Optional[callable] = None,
+                            journal=None, pages_per_part: int = 50,
+                            workers: Optional[int] = None):
         """
         Tạo PDF với text đã dịch - giữ nguyên layout và format
         
@@ -159,17 +530,40 @@ class PDFHandler:
         1. Với mỗi trang, tìm tất cả text instances
         2. Xóa text gốc bằng cách vẽ rect trắng đè lên
         3. Chèn text dịch vào đúng vị trí
+        
+        translated_blocks: List[TextBlock] hoặc BlockStore
+        journal: JobJournal - nếu có, render từng đoạn pages_per_part trang ra file tạm
+                 và ghi vào journal; chạy lại sau khi bị gián đoạn sẽ bỏ qua đoạn đã xong.
+        workers: Số process render song song theo đoạn trang (None: tự chọn theo số trang
+                 và số core, 1: render tuần tự). Các đoạn được gộp lại theo thứ tự trang,
+                 giữ mục lục, nhãn trang, link và metadata của file gốc.
+        
+        File có form hoặc named destination luôn render tuần tự trên file gốc (gộp các đoạn
+        làm mất chúng): không dùng journal và workers.
         """
         doc = fitz.open(original_pdf_path)
         total_pages = len(doc)
         
+        if workers is None:
+            workers = min(os.cpu_count() or 1, 8) if total_pages >= PARALLEL_MIN_PAGES else 1
+        workers = max(1, min(workers, total_pages))
+        
+        if journal is not None or workers > 1:
+            lost = self._structures_lost_by_merge(doc)
+            if lost:
+                print(f"File có {', '.join(lost)}: render tuần tự trên file gốc để giữ lại "
+                      f"(không render theo đoạn / song song / tiếp tục được)")
+                journal, workers = None, 1
+        
+        if journal is not None or workers > 1:
+            doc.close()
+            self._create_translated_pdf_parts(original_pdf_path, translated_blocks,
+                                              output_path, progress_callback,
+                                              journal, pages_per_part, workers)
+            return
+        
         # Nhóm blocks theo trang
-        blocks_by_page: Dict[int, List[TextBlock]] = {}
-        for block in translated_blocks:
-            page_num = block.page_num
-            if page_num not in blocks_by_page:
-                blocks_by_page[page_num] = []
-            blocks_by_page[page_num].append(block)
+        blocks_by_page = self._group_by_page(translated_blocks)
         
         # Xử lý từng trang
         for page_num in range(total_pages):
@@ -182,174 +576,493 @@ class PDFHandler:
                 progress_callback(page_num + 1, total_pages, "Đang tạo PDF")
         
         # Lưu file
-        doc.save(output_path, garbage=4, deflate=True)
+        self._save_output(doc, output_path)
+        doc.close()
+        
+        print(f"✓ Đã lưu PDF: {output_path}")
+
+    def _create_translated_pdf_parts(self, original_pdf_path: str,
+                                     translated_blocks,
+                                     output_path: str,
+                                     progress_callback: Optional[callable],
+                                     journal, pages_per_part: int, workers: int):
+        """
+        Render theo từng đoạn trang ra file tạm (có checkpoint nếu có journal,
+        song song nếu workers > 1), cuối cùng gộp lại theo thứ tự thành file đầu ra
+        """
+        blocks_by_page = self._group_by_page(translated_blocks)
+        if isinstance(translated_blocks, BlockStore):
+            # BlockView không gửi sang process khác được
+            blocks_by_page = {page_num: translated_blocks.to_blocks(TextBlock, views)
+                              for page_num, views in blocks_by_page.items()}
+        
+        doc = fitz.open(original_pdf_path)
+        total_pages = len(doc)
         doc.close()
         
+        if journal is not None:
+            done = {(a, b): path for a, b, path in journal.load().parts}
+            if done:
+                print(f"Tiếp tục render: {len(done)} đoạn trang đã xong")
+            part_path = journal.part_path
+            tmp_dir = None
+        else:
+            # Không có journal: chia nhỏ hơn để các process được chia tải đều
+            done = {}
+            pages_per_part = max(1, min(pages_per_part, -(-total_pages // (workers * 4))))
+            tmp_dir = tempfile.mkdtemp(prefix="pdf_render_")
+            part_path = lambda a, b: os.path.join(tmp_dir, f"part_{a:06d}_{b:06d}.pdf")
+        
+        ranges = [(from_page, min(from_page + pages_per_part, total_pages) - 1)
+                  for from_page in range(0, total_pages, pages_per_part)]
+        paths = dict(done)
+        pending = [r for r in ranges if r not in done]
+        done_pages = sum(b - a + 1 for a, b in ranges if (a, b) in done)
+        if progress_callback and done_pages:
+            progress_callback(done_pages, total_pages, "Đang tạo PDF")
+        
+        try:
+            if workers == 1:
+                for from_page, to_page in pending:
+                    path = part_path(from_page, to_page)
+                    self._render_part(original_pdf_path, from_page, to_page, blocks_by_page, path,
+                                      progress_callback, done_pages, total_pages)
+                    done_pages += to_page - from_page + 1
+                    paths[(from_page, to_page)] = path
+                    if journal is not None:
+                        journal.record_part(from_page, to_page, path)
+            else:
+                print(f"Render song song {total_pages} trang: {workers} process, "
+                      f"{len(pending)} đoạn")
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    futures = {}
+                    for from_page, to_page in pending:
+                        part_blocks = {p: blocks_by_page[p] for p in range(from_page, to_page + 1)
+                                       if p in blocks_by_page}
+                        future = executor.submit(_render_part, original_pdf_path, from_page, to_page,
+                                                 part_blocks, part_path(from_page, to_page),
+                                                 self.viet_font_path)
+                        futures[future] = (from_page, to_page)
+                    for future in as_completed(futures):
+                        from_page, to_page = futures[future]
+                        path = future.result()
+                        paths[(from_page, to_page)] = path
+                        if journal is not None:
+                            journal.record_part(from_page, to_page, path)
+                        done_pages += to_page - from_page + 1
+                        if progress_callback:
+                            progress_callback(done_pages, total_pages, "Đang tạo PDF")
+            
+            self._merge_parts(original_pdf_path, [paths[r] for r in ranges], output_path)
+        finally:
+            if tmp_dir:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
         print(f"✓ Đã lưu PDF: {output_path}")
+    
+    def _render_part(self, original_pdf_path: str, from_page: int, to_page: int,
+                     blocks_by_page: Dict[int, List[TextBlock]], part_path: str,
+                     progress_callback: Optional[callable] = None,
+                     done_pages: int = 0, total_pages: int = 0):
+        """Render các trang [from_page, to_page] của file gốc ra một file PDF tạm"""
+        doc = fitz.open(original_pdf_path)
+        doc.select(list(range(from_page, to_page + 1)))
+        for page_num in range(from_page, to_page + 1):
+            if page_num in blocks_by_page:
+                self._process_page(doc[page_num - from_page], blocks_by_page[page_num])
+            if progress_callback:
+                progress_callback(done_pages + page_num - from_page + 1, total_pages, "Đang tạo PDF")
+        
+        # File tạm không nén cho nhanh, nén một lần khi gộp
+        doc.save(part_path)
+        doc.close()
+
+    def diff_pages(self, previous_pdf_path: str, new_pdf_path: str) -> List[Optional[int]]:
+        """
+        So sánh hai phiên bản theo hash nội dung trang
+        
+        Trả về danh sách theo trang của bản mới: chỉ số trang giống hệt ở bản trước,
+        hoặc None nếu trang mới / đã thay đổi. Trang bị chèn / xóa không làm lệch các trang sau.
+        """
+        previous = self._page_hashes(previous_pdf_path)
+        positions: Dict[str, List[int]] = {}
+        for index, page_hash in enumerate(previous):
+            positions.setdefault(page_hash, []).append(index)
+        
+        mapping: List[Optional[int]] = []
+        used = set()
+        for index, page_hash in enumerate(self._page_hashes(new_pdf_path)):
+            candidates = [j for j in positions.get(page_hash, []) if j not in used]
+            if not candidates:
+                mapping.append(None)
+                continue
+            # Ưu tiên cùng vị trí, sau đó trang gần nhất
+            match = min(candidates, key=lambda j: abs(j - index))
+            used.add(match)
+            mapping.append(match)
+        return mapping
+
+    @staticmethod
+    def _page_hashes(pdf_path: str) -> List[str]:
+        doc = fitz.open(pdf_path)
+        try:
+            return [ExtractionCache.page_hash(doc, doc[i]) for i in range(len(doc))]
+        finally:
+            doc.close()
+
+    def create_incremental_pdf(self, previous_pdf_path: str, previous_output_path: str,
+                               new_pdf_path: str, output_path: str,
+                               translate_fn: Callable[[List[str]], List[str]],
+                               paragraphs: bool = False,
+                               progress_callback: Optional[callable] = None) -> Dict:
+        """
+        Dịch bản sửa đổi của tài liệu đã dịch: chỉ đọc, dịch và render các trang thay đổi,
+        trang không đổi lấy nguyên từ bản dịch trước
+        
+        previous_pdf_path: Bản gốc trước đó
+        previous_output_path: Bản dịch của previous_pdf_path
+        translate_fn: Nhận danh sách text, trả về bản dịch cùng thứ tự
+        
+        Khi số trang không đổi và trang giữ nguyên vị trí, bản dịch trước được chép sang
+        output_path rồi thay các trang đổi và lưu incremental (chỉ nối thêm phần thay đổi).
+        Trả về {"pages", "reused", "changed", "incremental"}.
+        """
+        previous_output = fitz.open(previous_output_path)
+        previous_output_pages = len(previous_output)
+        previous_output.close()
+        
+        mapping = self.diff_pages(previous_pdf_path, new_pdf_path)
+        doc = fitz.open(previous_pdf_path)
+        previous_pages = len(doc)
+        doc.close()
+        if previous_output_pages != previous_pages:
+            raise ValueError(f"Bản dịch trước có {previous_output_pages} trang, "
+                             f"bản gốc trước có {previous_pages} trang - không khớp")
+        
+        total_pages = len(mapping)
+        changed = [i for i, j in enumerate(mapping) if j is None]
+        print(f"♻ Dùng lại {total_pages - len(changed)}/{total_pages} trang từ bản dịch trước, "
+              f"dịch lại {len(changed)} trang")
+        
+        # Đọc + dịch + render các trang thay đổi (thành tài liệu tạm chỉ gồm các trang đó)
+        rendered = fitz.open(new_pdf_path)
+        if changed:
+            blocks = []
+            for _, page_blocks in self.iter_text_blocks(new_pdf_path, pages=changed):
+                blocks.extend(page_blocks)
+            if paragraphs:
+                blocks = self._merge_paragraphs(blocks)
+            if blocks:
+                for block, text in zip(blocks, translate_fn([b.text for b in blocks])):
+                    block.text = text
+            blocks_by_page = self._group_by_page(blocks)
+            rendered.select(changed)
+            for k, page_num in enumerate(changed):
+                if page_num in blocks_by_page:
+                    self._process_page(rendered[k], blocks_by_page[page_num])
+                if progress_callback:
+                    progress_callback(k + 1, len(changed), "Đang tạo PDF")
+        
+        in_place = total_pages == previous_pages and \
+            all(j is None or j == i for i, j in enumerate(mapping))
+        if in_place:
+            incremental = self._splice_in_place(previous_output_path, rendered, changed,
+                                                new_pdf_path, output_path)
+        else:
+            incremental = False
+            self._splice_rebuild(previous_output_path, rendered, mapping, new_pdf_path, output_path)
+        rendered.close()
+        
+        print(f"✓ Đã lưu PDF: {output_path}" + (" (lưu incremental)" if incremental else ""))
+        return {"pages": total_pages, "reused": total_pages - len(changed),
+                "changed": len(changed), "incremental": incremental}
+
+    def _splice_in_place(self, previous_output_path: str, rendered, changed: List[int],
+                         new_pdf_path: str, output_path: str) -> bool:
+        """Thay các trang đổi ngay trong bản sao của bản dịch trước, trả về True nếu lưu incremental"""
+        if os.path.abspath(previous_output_path) != os.path.abspath(output_path):
+            shutil.copyfile(previous_output_path, output_path)
+        out = fitz.open(output_path)
+        for k, page_num in enumerate(changed):
+            out.delete_page(page_num)
+            out.insert_pdf(rendered, from_page=k, to_page=k, start_at=page_num)
+        # Xóa trang cũng xóa các link trỏ tới nó -> tạo lại link của trang đổi và trang trỏ tới chúng
+        changed_set = set(changed)
+        src = fitz.open(new_pdf_path)
+        link_pages = [i for i in range(len(src)) if i in changed_set or
+                      any(link.get("page") in changed_set for link in src[i].get_links())]
+        src.close()
+        self._copy_outline(new_pdf_path, out, link_pages=link_pages)
+        
+        incremental = out.can_save_incrementally()
+        if incremental:
+            out.saveIncr()
+            out.close()
+        else:
+            tmp_path = output_path + ".tmp"
+            self._save_output(out, tmp_path)
+            out.close()
+            os.replace(tmp_path, output_path)
+        return incremental
+
+    def _splice_rebuild(self, previous_output_path: str, rendered, mapping: List[Optional[int]],
+                        new_pdf_path: str, output_path: str):
+        """Ghép tài liệu mới theo thứ tự trang: đoạn liên tiếp từ bản dịch trước hoặc trang vừa render"""
+        previous_output = fitz.open(previous_output_path)
+        out = fitz.open()
+        
+        # Gom thành các đoạn liên tiếp để insert_pdf ít lần
+        runs = []  # [nguồn, trang đầu, trang cuối]
+        k = 0
+        for j in mapping:
+            source, page = (previous_output, j) if j is not None else (rendered, k)
+            if j is None:
+                k += 1
+            if runs and runs[-1][0] is source and runs[-1][2] == page - 1:
+                runs[-1][2] = page
+            else:
+                runs.append([source, page, page])
+        for source, from_page, to_page in runs:
+            out.insert_pdf(source, from_page=from_page, to_page=to_page)
+        previous_output.close()
+        
+        self._copy_outline(new_pdf_path, out)
+        self._save_output(out, output_path)
+        out.close()
+
+    @staticmethod
+    def _copy_outline(original_pdf_path: str, out, link_pages: Optional[List[int]] = None):
+        """
+        Chép mục lục (TOC), nhãn trang, link và metadata của file gốc sang tài liệu đầu ra
+        (cùng số trang, cùng thứ tự). Trang ghép bằng insert_pdf mất các link trỏ ra ngoài
+        đoạn được chép, nên link được tạo lại từ file gốc.
+        
+        link_pages: Chỉ tạo lại link của các trang này (mặc định tất cả)
+        """
+        src = fitz.open(original_pdf_path)
+        try:
+            out.set_toc(src.get_toc(simple=False))
+        except Exception as e:
+            print(f"Không giữ được mục lục: {e}")
+        
+        if len(src) == len(out):
+            labels = src.get_page_labels()
+            if labels:
+                out.set_page_labels(labels)
+            for page_num in (range(len(src)) if link_pages is None else link_pages):
+                links = src[page_num].get_links()
+                page = out[page_num]
+                for link in page.get_links():
+                    page.delete_link(link)
+                for link in links:
+                    try:
+                        page.insert_link(link)
+                    except Exception:
+                        pass
+        
+        out.set_metadata(src.metadata)
+        src.close()
+
+    @staticmethod
+    def _structures_lost_by_merge(doc) -> List[str]:
+        """
+        Cấu trúc cấp tài liệu mà gộp các đoạn render (insert_pdf) làm mất: form (AcroForm
+        và widget) và named destination (link theo tên). Nhãn trang được _copy_outline chép lại
+        """
+        lost = []
+        if doc.is_form_pdf:
+            lost.append("form")
+        catalog = doc.pdf_catalog()
+        if doc.xref_get_key(catalog, "Dests")[0] != "null" or \
+                doc.xref_get_key(catalog, "Names/Dests")[0] != "null":
+            lost.append("named destination")
+        return lost
+
+    def _save_output(self, doc, output_path: str, profile: Optional[str] = None):
+        """Lưu tài liệu đầu ra theo profile (mặc định self.save_profile), in thời gian / kích thước"""
+        profile = profile or self.save_profile
+        options = dict(SAVE_PROFILES.get(profile, SAVE_PROFILES["balanced"]))
+        start = time.perf_counter()
+        
+        subset_time = 0.0
+        if options.pop("subset_fonts", False):
+            try:
+                doc.subset_fonts()
+            except ImportError:
+                print("⚠ Chưa cài fonttools - bỏ qua subset font")
+            except Exception as e:
+                print(f"Không subset được font: {e}")
+            subset_time = time.perf_counter() - start
+        
+        try:
+            doc.save(output_path, **options)
+        except TypeError:
+            # PyMuPDF cũ (1.23.x) chưa có use_objstms
+            if "use_objstms" not in options:
+                raise
+            options.pop("use_objstms")
+            doc.save(output_path, **options)
+        
+        elapsed = time.perf_counter() - start
+        size_mb = os.path.getsize(output_path) / (1024 * 1024)
+        print(f"Lưu ({profile}): {size_mb:.2f} MB trong {elapsed:.1f} s"
+              + (f" (subset font {subset_time:.1f} s)" if subset_time else ""))
+
+    def _merge_parts(self, original_pdf_path: str, part_paths: List[str], output_path: str):
+        """
+        Gộp các file PDF tạm theo thứ tự, giữ mục lục (TOC) và metadata của file gốc.
+        Mỗi đoạn nhúng bản sao font riêng -> gộp về một bản trước khi lưu (profile nào cũng vậy)
+        """
+        out = fitz.open()
+        
+        for path in part_paths:
+            part = fitz.open(path)
+            out.insert_pdf(part)
+            part.close()
+        
+        self._copy_outline(original_pdf_path, out)
+        self._dedupe_fonts(out)
+        
+        self._save_output(out, output_path)
+        out.close()
+    
+    @staticmethod
+    def _dedupe_fonts(doc) -> int:
+        """
+        Gộp các bản sao font giống hệt nhau (mỗi đoạn render nhúng font riêng), trả về số
+        object bị bỏ - garbage khi lưu sẽ xóa chúng. Không dựa vào garbage=3/4 của profile
+        vì so sánh mọi object / stream của tài liệu chậm hơn nhiều.
+        1. Object font trỏ tới (file font, ToUnicode, mảng độ rộng W...) giống nhau -> dùng chung
+        2. Font descriptor, CIDFont, font Type0 thành giống nhau -> gộp dần từ dưới lên
+        """
+        font_types = (("name", "/Font"), ("name", "/FontDescriptor"))
+        fonts = [xref for xref in range(1, doc.xref_length())
+                 if doc.xref_get_key(xref, "Type") in font_types]
+        font_set = set(fonts)
+        
+        mapping: Dict[int, int] = {}
+        first_leaf: Dict[bytes, int] = {}
+        for xref in fonts:
+            for key in doc.xref_get_keys(xref):
+                kind, value = doc.xref_get_key(xref, key)
+                leaf = int(value.split()[0]) if kind == "xref" else 0
+                if not leaf or leaf in font_set or leaf in mapping:
+                    continue
+                content = doc.xref_object(leaf, compressed=True).encode("utf-8")
+                if doc.xref_is_stream(leaf):
+                    content += doc.xref_stream_raw(leaf) or b""
+                digest = hashlib.blake2b(content, digest_size=16).digest()
+                target = first_leaf.setdefault(digest, leaf)
+                if target != leaf:
+                    mapping[leaf] = target
+        
+        removed: set = set()
+        while mapping:
+            # Đổi tham chiếu tới bản sao trong mọi object (trang, resources, font...)
+            ref = lambda m: f"{mapping.get(int(m.group(1)), int(m.group(1)))} 0 R"
+            for xref in range(1, doc.xref_length()):
+                if xref in removed or doc.xref_is_stream(xref):
+                    continue
+                text = doc.xref_object(xref, compressed=True)
+                if " 0 R" in text:
+                    new_text = _REF_RE.sub(ref, text)
+                    if new_text != text:
+                        doc.update_object(xref, new_text)
+            removed.update(mapping)
+            
+            # Font / descriptor vừa trở thành giống hệt nhau -> vòng sau gộp tiếp
+            mapping = {}
+            first_object: Dict[str, int] = {}
+            for xref in fonts:
+                if xref not in removed:
+                    target = first_object.setdefault(doc.xref_object(xref, compressed=True), xref)
+                    if target != xref:
+                        mapping[xref] = target
+        
+        if removed:
+            print(f"Gộp font trùng giữa các đoạn: bỏ {len(removed)} object")
+        return len(removed)
 
     def _process_page(self, page, blocks: List[TextBlock]):
         """
         Xử lý một trang PDF:
-        1. Che text gốc bằng rectangle trắng
-        2. Chèn text dịch vào đúng vị trí
+        1. Che text gốc bằng rectangle trắng - tất cả trong MỘT shape
+        2. Chèn text dịch - gom vào TextWriter (mỗi màu chữ một writer), ghi một lần
+        
+        Mỗi trang chỉ thêm vài lệnh vẽ vào content stream thay vì một lệnh cho mỗi block,
+        font được nhúng một lần cho cả tài liệu (cùng một fitz.Font).
         """
         # Sắp xếp blocks theo vị trí (top-to-bottom, left-to-right)
         blocks = sorted(blocks, key=lambda b: (b.bbox[1], b.bbox[0]))
         
         # Bước 1: Che tất cả text gốc
+        shape = page.new_shape()
         for block in blocks:
-            try:
-                rect = fitz.Rect(block.bbox)
-                # Mở rộng rect một chút để che hết text
-                rect = rect + (-1, -1, 1, 1)
-                
-                # Vẽ rectangle trắng đè lên text gốc
-                page.draw_rect(rect, color=(1, 1, 1), fill=(1, 1, 1))
-            except Exception as e:
-                pass
+            rect = fitz.Rect(block.bbox)
+            if rect.is_empty:
+                continue
+            # Mở rộng rect một chút để che hết text
+            shape.draw_rect(rect + (-1, -1, 1, 1))
+        shape.finish(color=(1, 1, 1), fill=(1, 1, 1))
+        shape.commit()
         
         # Bước 2: Chèn text dịch
+        writers: Dict[Tuple[float, float, float], "fitz.TextWriter"] = {}
         for block in blocks:
-            self._insert_text(page, block)
+            self._insert_text(page, block, writers)
+        for color, writer in writers.items():
+            writer.write_text(page, color=color)
 
-    def _insert_text(self, page, block: TextBlock):
+    def _insert_text(self, page, block: TextBlock, writers: Dict):
         """
-        Chèn text vào trang PDF với font tiếng Việt
-        Hỗ trợ text wrapping và tự động điều chỉnh kích thước
+        Thêm text của block vào TextWriter theo màu chữ (writers: màu -> TextWriter)
+        Cỡ chữ và chỗ xuống dòng được tính trước bằng độ rộng glyph thật (TextFitter)
         """
         text = block.text
         if not text or not text.strip():
             return
         
         rect = fitz.Rect(block.bbox)
-        font_size = block.font_size
-        color = block.color
+        # Mở rộng rect một chút để chứa text dịch
+        box = rect + (0, 0, rect.width * 0.05, rect.height * 0.1)
+        if box.width <= 0 or box.height <= 0:
+            return
         
-        # Điều chỉnh font size thông minh hơn
-        if block.original_text:
-            original_len = len(block.original_text)
-            translated_len = len(text)
-            
-            # Nếu text dịch dài hơn 30%, giảm font
-            if translated_len > original_len * 1.3 and original_len > 0:
-                len_ratio = translated_len / original_len
-                font_size = font_size / (len_ratio * 0.8)
-                font_size = max(font_size, 6)  # Minimum 6pt
+        fitter = self._get_text_fitter()
+        font_size, lines = fitter.fit(text, box.width, box.height, block.font_size)
         
-        # Mở rộng rect một chút để chứa text dịch
-        rect_expanded = rect + (0, 0, rect.width * 0.05, rect.height * 0.1)
+        # Nhỏ nhất vẫn không vừa: cho tràn xuống tối đa thêm một lần chiều cao khung
+        while len(lines) > 1 and fitter.text_height(len(lines), font_size) > box.height * 2:
+            lines.pop()
         
-        try:
+        color = tuple(block.color)
+        writer = writers.get(color)
+        if writer is None:
+            writer = writers[color] = fitz.TextWriter(page.rect)
+        
+        baseline = box.y0 + fitter.ascender * font_size
+        for line in lines:
+            try:
+                writer.append((box.x0, baseline), line, font=fitter.font, fontsize=font_size)
+            except Exception as e:
+                # Bỏ dòng lỗi, các dòng còn lại vẫn được chèn
+                print(f"Không chèn được dòng '{line[:40]}': {e}")
+            baseline += font_size * fitter.line_height
+
+    def _get_text_fitter(self) -> TextFitter:
+        """TextFitter (kèm fitz.Font) của font dùng để chèn text - tạo một lần, dùng cho mọi trang"""
+        key = self.viet_font_path or "helv"
+        if key not in self._font_cache:
             if self.viet_font_path:
-                # Thử các font size giảm dần
-                font_sizes = [font_size, font_size * 0.9, font_size * 0.8, 
-                             font_size * 0.7, font_size * 0.6, max(6, font_size * 0.5)]
-                
-                success = False
-                for fs in font_sizes:
-                    try:
-                        rc = page.insert_textbox(
-                            rect_expanded,
-                            text,
-                            fontsize=fs,
-                            fontfile=self.viet_font_path,
-                            fontname="VNFont",
-                            color=color,
-                            align=fitz.TEXT_ALIGN_LEFT,
-                        )
-                        
-                        if rc >= 0:  # Thành công
-                            success = True
-                            break
-                    except:
-                        continue
-                
-                # Nếu insert_textbox thất bại, dùng insert_text
-                if not success:
-                    # Chia text thành nhiều dòng nếu quá dài
-                    max_width = rect.width
-                    avg_char_width = font_size * 0.5
-                    max_chars = int(max_width / avg_char_width)
-                    
-                    if len(text) > max_chars:
-                        # Word wrap
-                        words = text.split()
-                        lines = []
-                        current_line = ""
-                        
-                        for word in words:
-                            test_line = f"{current_line} {word}".strip()
-                            if len(test_line) <= max_chars:
-                                current_line = test_line
-                            else:
-                                if current_line:
-                                    lines.append(current_line)
-                                current_line = word
-                        
-                        if current_line:
-                            lines.append(current_line)
-                        
-                        # Insert từng dòng
-                        line_height = font_size * 1.15
-                        y_pos = rect.y0 + font_size
-                        
-                        for line_text in lines:
-                            if y_pos > rect.y1 + rect.height:
-                                break
-                            
-                            point = fitz.Point(rect.x0, y_pos)
-                            page.insert_text(
-                                point,
-                                line_text,
-                                fontsize=font_size * 0.85,
-                                fontfile=self.viet_font_path,
-                                fontname="VNFont",
-                                color=color,
-                            )
-                            y_pos += line_height
-                    else:
-                        # Text ngắn, insert một lần
-                        point = fitz.Point(rect.x0, rect.y0 + font_size)
-                        page.insert_text(
-                            point,
-                            text,
-                            fontsize=font_size * 0.9,
-                            fontfile=self.viet_font_path,
-                            fontname="VNFont",
-                            color=color,
-                        )
-                        
+                font = fitz.Font(fontfile=self.viet_font_path)
             else:
                 # Fallback: không có font tiếng Việt (sẽ mất dấu)
-                page.insert_textbox(
-                    rect_expanded,
-                    text, 
-                    fontsize=font_size * 0.9,
-                    fontname="helv",
-                    color=color,
-                    align=fitz.TEXT_ALIGN_LEFT,
-                )
-                
-        except Exception as e:
-            # Silent fallback
-            try:
-                point = fitz.Point(rect.x0, rect.y0 + font_size * 0.8)
-                page.insert_text(
-                    point,
-                    text,
-                    fontsize=max(font_size * 0.6, 6),
-                    fontname="helv",
-                    color=color,
-                )
-            except:
-                pass
+                font = fitz.Font("helv")
+            self._font_cache[key] = TextFitter(font)
+        return self._font_cache[key]
 
     def _int_to_rgb(self, color_int: int) -> Tuple[float, float, float]:
         """Chuyển màu từ integer sang RGB float (0-1)"""
-        r = ((color_int >> 16) & 0xFF) / 255.0
-        g = ((color_int >> 8) & 0xFF) / 255.0
-        b = (color_int & 0xFF) / 255.0
-        return (r, g, b)
+        return _int_to_rgb(color_int)
 
     def get_pdf_info(self, pdf_path: str) -> Dict:
         """Lấy thông tin PDF"""
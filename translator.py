@@ -1,292 +1,846 @@
-"""
-Module dịch thuật sử dụng deep-translator
-Hỗ trợ dịch từ English sang Vietnamese
-TỐI ƯU: Batch processing, Multi-threading, Caching, Timeout handling
-"""
-
-from deep_translator import GoogleTranslator
-import time
-from typing import List, Optional, Dict
-from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError
-import threading
-import re
-
-
-class TextTranslator:
-    """Class xử lý dịch văn bản từ English sang Vietnamese - TỐI ƯU HIỆU SUẤT"""
-    
-    def __init__(self):
-        """Khởi tạo translator với tối ưu theo CPU"""
-        import os
-        
-        self.max_chunk_size = 4500  # Giới hạn ký tự mỗi lần dịch Google
-        self.cache: Dict[str, str] = {}  # Cache để không dịch lại text giống nhau
-        self.cache_lock = threading.Lock()
-        self.request_delay = 0.08  # Giảm delay xuống 80ms để dịch nhanh hơn
-        
-        # Tối ưu workers dựa trên CPU cores - TĂNG WORKERS
-        cpu_count = os.cpu_count() or 4
-        self.max_workers = min(cpu_count * 2, 12)  # Tăng lên x2, tối đa 12 workers
-        print(f"⚡ CPU: {cpu_count} cores -> Sử dụng {self.max_workers} workers (tối ưu tốc độ)")
-        
-        self.request_timeout = 30  # Timeout 30 giây cho mỗi request
-    
-    def _get_translator(self):
-        """Tạo translator mới cho mỗi thread"""
-        return GoogleTranslator(source='en', target='vi')
-    
-    def _normalize_text(self, text: str) -> str:
-        """Chuẩn hóa text để cache hiệu quả hơn"""
-        return text.strip().lower()
-    
-    def _safe_translate(self, translator, text: str, max_retries: int = 3) -> str:
-        """Dịch với retry và xử lý lỗi"""
-        if not text or not text.strip():
-            return text
-            
-        for attempt in range(max_retries):
-            try:
-                result = translator.translate(text)
-                if result:
-                    return result
-            except Exception as e:
-                error_msg = str(e)
-                # Chỉ in lỗi đầu tiên để tránh spam log
-                if attempt == 0:
-                    print(f"Lỗi dịch (sẽ retry): {error_msg[:100]}")
-                if attempt < max_retries - 1:
-                    # Tăng thời gian chờ dần lên cho các lần retry
-                    wait_time = (attempt + 1) * 2  # 2s, 4s
-                    time.sleep(wait_time)
-        
-        return text  # Trả về text gốc nếu thất bại
-    
-    def translate_text(self, text: str) -> str:
-        """Dịch văn bản từ English sang Vietnamese"""
-        if not text or not text.strip():
-            return text
-        
-        # Kiểm tra cache
-        cache_key = self._normalize_text(text)
-        with self.cache_lock:
-            if cache_key in self.cache:
-                return self.cache[cache_key]
-        
-        try:
-            translator = self._get_translator()
-            
-            if len(text) <= self.max_chunk_size:
-                result = self._safe_translate(translator, text)
-            else:
-                result = self._translate_long_text(text, translator)
-            
-            # Lưu vào cache
-            with self.cache_lock:
-                self.cache[cache_key] = result
-            
-            return result
-            
-        except Exception as e:
-            print(f"Lỗi khi dịch: {e}")
-            return text
-    
-    def _translate_long_text(self, text: str, translator) -> str:
-        """Dịch văn bản dài bằng cách chia nhỏ"""
-        sentences = self._split_into_sentences(text)
-        translated_parts = []
-        current_chunk = ""
-        
-        for sentence in sentences:
-            if len(current_chunk) + len(sentence) > self.max_chunk_size:
-                if current_chunk:
-                    translated_parts.append(self._safe_translate(translator, current_chunk))
-                current_chunk = sentence
-            else:
-                current_chunk += sentence
-        
-        if current_chunk:
-            translated_parts.append(self._safe_translate(translator, current_chunk))
-        
-        return " ".join(translated_parts)
-    
-    def _split_into_sentences(self, text: str) -> List[str]:
-        """Chia văn bản thành các câu"""
-        sentences = re.split(r'([.!?\n]+\s*)', text)
-        result = []
-        for i in range(0, len(sentences) - 1, 2):
-            if i + 1 < len(sentences):
-                result.append(sentences[i] + sentences[i + 1])
-            else:
-                result.append(sentences[i])
-        if len(sentences) % 2 == 1:
-            result.append(sentences[-1])
-        return [s for s in result if s.strip()]
-    
-    def _create_batches(self, texts: List[str], batch_char_limit: int = 3000) -> List[List[tuple]]:
-        """Gộp nhiều text ngắn vào 1 batch để giảm số lần gọi API"""
-        batches = []
-        current_batch = []
-        current_length = 0
-        
-        for i, text in enumerate(texts):
-            text_len = len(text) if text else 0
-            
-            if text_len > batch_char_limit:
-                if current_batch:
-                    batches.append(current_batch)
-                    current_batch = []
-                    current_length = 0
-                batches.append([(i, text)])
-            elif current_length + text_len + 10 > batch_char_limit:
-                if current_batch:
-                    batches.append(current_batch)
-                current_batch = [(i, text)]
-                current_length = text_len
-            else:
-                current_batch.append((i, text))
-                current_length += text_len + 10
-        
-        if current_batch:
-            batches.append(current_batch)
-        
-        return batches
-    
-    def _translate_batch_texts(self, batch: List[tuple], batch_id: int) -> List[tuple]:
-        """Dịch một batch các text với xử lý lỗi tốt hơn"""
-        results = []
-        
-        try:
-            translator = self._get_translator()
-            SEPARATOR = " ||| "
-            
-            # Kiểm tra cache trước
-            texts_to_translate = []
-            
-            for idx, text in batch:
-                if not text or not text.strip():
-                    results.append((idx, text))
-                else:
-                    cache_key = self._normalize_text(text)
-                    with self.cache_lock:
-                        if cache_key in self.cache:
-                            results.append((idx, self.cache[cache_key]))
-                        else:
-                            texts_to_translate.append((idx, text))
-            
-            if not texts_to_translate:
-                return results
-            
-            # Dịch từng text một (an toàn hơn batch)
-            for idx, text in texts_to_translate:
-                try:
-                    translated = self._safe_translate(translator, text)
-                    results.append((idx, translated))
-                    
-                    # Cache kết quả
-                    cache_key = self._normalize_text(text)
-                    with self.cache_lock:
-                        self.cache[cache_key] = translated
-                    
-                    time.sleep(self.request_delay)
-                except Exception as e:
-                    print(f"Lỗi dịch text {idx}: {e}")
-                    results.append((idx, text))
-            
-        except Exception as e:
-            print(f"Lỗi batch {batch_id}: {e}")
-            # Trả về text gốc nếu lỗi
-            for idx, text in batch:
-                if idx not in [r[0] for r in results]:
-                    results.append((idx, text))
-        
-        return results
-    
-    def translate_batch(self, texts: List[str], delay: float = 0.1, 
-                       progress_callback: Optional[callable] = None) -> List[str]:
-        """
-        Dịch nhiều đoạn văn bản với TỐI ƯU HIỆU SUẤT
-        """
-        self.request_delay = delay
-        total = len(texts)
-        translated_texts = [""] * total
-        completed_count = [0]  # Dùng list để có thể modify trong closure
-        completed_lock = threading.Lock()
-        
-        # Tạo các batch
-        batches = self._create_batches(texts)
-        total_batches = len(batches)
-        
-        print(f"Tối ưu: {total} text -> {total_batches} batches")
-        
-        def process_batch(batch_data):
-            batch_id, batch = batch_data
-            try:
-                results = self._translate_batch_texts(batch, batch_id)
-                
-                # Cập nhật kết quả
-                for idx, translated in results:
-                    translated_texts[idx] = translated
-                
-                # Cập nhật progress
-                with completed_lock:
-                    completed_count[0] += len(batch)
-                    if progress_callback:
-                        progress_callback(completed_count[0], total)
-                
-                return True
-            except Exception as e:
-                print(f"Lỗi xử lý batch {batch_id}: {e}")
-                # Đánh dấu đã xử lý để không bị treo
-                with completed_lock:
-                    completed_count[0] += len(batch)
-                    if progress_callback:
-                        progress_callback(completed_count[0], total)
-                return False
-        
-        # Chạy song song với timeout
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            future_to_batch = {
-                executor.submit(process_batch, (i, batch)): (i, batch) 
-                for i, batch in enumerate(batches)
-            }
-            
-            # Đợi với timeout và xử lý lỗi
-            try:
-                for future in as_completed(future_to_batch, timeout=7200):  # Timeout 2 giờ
-                    batch_id, batch = future_to_batch[future]
-                    try:
-                        future.result(timeout=600)  # Timeout 10 phút mỗi batch
-                    except TimeoutError:
-                        print(f"Batch {batch_id} timeout, giữ text gốc...")
-                        # Giữ text gốc cho các item trong batch bị timeout
-                        for idx, text in batch:
-                            if not translated_texts[idx]:
-                                translated_texts[idx] = text
-                    except Exception as e:
-                        print(f"Lỗi batch {batch_id}: {e}")
-                        # Giữ text gốc nếu lỗi
-                        for idx, text in batch:
-                            if not translated_texts[idx]:
-                                translated_texts[idx] = text
-            except TimeoutError:
-                print(f"\nCảnh báo: Đã timeout tổng thể, xử lý các batch còn lại...")
-                # Xử lý các batch chưa hoàn thành
-                for future, (batch_id, batch) in future_to_batch.items():
-                    if not future.done():
-                        print(f"Batch {batch_id} chưa xong, giữ text gốc")
-                        for idx, text in batch:
-                            if not translated_texts[idx]:
-                                translated_texts[idx] = text
-        
-        # Đảm bảo không có text rỗng
-        for i in range(total):
-            if not translated_texts[i]:
-                translated_texts[i] = texts[i]
-        
-        # Gọi callback lần cuối để đảm bảo 100%
-        if progress_callback:
-            progress_callback(total, total)
-        
-        print(f"Hoàn thành! Cache: {len(self.cache)} unique texts")
-        
-        return translated_texts
+"""
+Module dịch thuật sử dụng deep-translator
+Hỗ trợ dịch từ English sang Vietnamese
+TỐI ƯU: Batch processing, Multi-threading, Caching, Timeout handling
+Cache: bộ nhớ dịch SQLite lưu trên đĩa (modules/translation_memory.py)
+Backend: Google hoặc backend offline giả lập (modules/backends.py)
+"""
+
+import time
+from typing import List, Optional, Dict, Iterator, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError
+import threading
+import re
+import sqlite3
+import tempfile
+import os
+from dataclasses import dataclass, field
+
+from modules.translation_memory import TranslationMemory
+from modules.fuzzy_index import MinHashLSH
+from modules.backends import TranslationBackend, GoogleBackend
+from modules.rate_limiter import AdaptiveRateLimiter, classify_error, CLIENT
+from modules.single_flight import SingleFlight
+from modules.masking import PlaceholderMasker
+from modules.glossary import Glossary
+from modules.segment_classifier import SegmentClassifier
+from modules.autotuner import Autotuner
+from modules.resilience import ResilientCaller
+
+
+# Đánh dấu từng đoạn khi gộp nhiều text vào một request: "[[0]] text\n[[1]] text"
+# Google giữ nguyên số và dấu ngoặc vuông, nên tách lại được theo index
+PACK_MARKER = "[[{}]]"
+PACK_MARKER_RE = re.compile(r'\[\[\s*(\d+)\s*\]\]')
+
+
+@dataclass
+class _BatchPlan:
+    """Kế hoạch dịch một tài liệu: phần có sẵn, các batch cần gửi và cách khôi phục"""
+    texts: List[str]  # Text gốc
+    ready: List[Tuple[int, str]] = field(default_factory=list)  # (index, kết quả) có sẵn
+    batches: List[List[tuple]] = field(default_factory=list)  # (index, template cần dịch)
+    duplicates: Dict[int, List[int]] = field(default_factory=dict)  # index -> các index trùng
+    values: Dict[int, List[str]] = field(default_factory=dict)  # index -> giá trị bị mask
+    # Text dài được chia thành các câu (đơn vị ảo, index >= len(texts)) dịch song song
+    parts: Dict[int, List[int]] = field(default_factory=dict)  # text dài -> các đơn vị câu
+    owner: Dict[int, int] = field(default_factory=dict)  # đơn vị câu -> text dài
+    # Khoảng trắng / xuống dòng theo sau mỗi câu trong text gốc, dùng khi ghép lại
+    separators: Dict[int, str] = field(default_factory=dict)
+    partial: Dict[int, Dict[int, str]] = field(default_factory=dict)  # kết quả câu đang gom
+
+
+class TextTranslator:
+    """Class xử lý dịch văn bản từ English sang Vietnamese - TỐI ƯU HIỆU SUẤT"""
+    
+    def __init__(self, memory: Optional[TranslationMemory] = None,
+                 engine: str = "thread", async_concurrency: int = 64,
+                 backend: Optional[TranslationBackend] = None):
+        """
+        Khởi tạo translator với tối ưu theo CPU
+        
+        Args:
+            backend: Backend dịch (mặc định GoogleBackend en -> vi)
+            memory: Bộ nhớ dịch dùng chung (mặc định mở file trong thư mục dữ liệu)
+            engine: "thread" hoặc "async" - xem set_engine()
+            async_concurrency: Số request đồng thời khi dùng engine async
+        """
+        self.backend = backend or GoogleBackend(source='en', target='vi')
+        self.max_chunk_size = self.backend.max_payload_chars  # Giới hạn ký tự mỗi request
+        # Bộ nhớ dịch trên đĩa - giữ bản dịch giữa các lần chạy, đọc song song không cần lock
+        self.memory = memory if memory is not None else self._open_memory()
+        self.request_delay = 0.08  # Khoảng cách ban đầu giữa các request (80ms)
+        
+        # Batch size / workers học từ độ trễ thực tế của các lần chạy trước
+        self.autotuner = Autotuner(self.backend.name, max_chars=self.backend.max_payload_chars)
+        
+        # Tối ưu workers dựa trên CPU cores - TĂNG WORKERS (khi chưa học được gì)
+        cpu_count = os.cpu_count() or 4
+        self.max_workers = self.autotuner.workers(
+            default=min(cpu_count * 2, self.backend.max_concurrency),  # x2, tối đa theo backend
+            limit=self.backend.max_concurrency)
+        print(f"⚡ CPU: {cpu_count} cores -> Sử dụng {self.max_workers} workers (tối ưu tốc độ)")
+        
+        # Gộp cả batch vào một request thay vì dịch từng dòng
+        self.packed_requests = True
+        self._stats_lock = threading.Lock()
+        self.api_calls = 0  # Số request thực sự gửi đi
+        self.failed_requests = 0  # Số request thất bại (đoạn liên quan giữ text gốc)
+        
+        # Token bucket + AIMD dùng chung cho mọi worker (cả engine async)
+        self.limiter = AdaptiveRateLimiter(rate=1.0 / self.request_delay,
+                                           window=self.max_workers,
+                                           max_window=max(self.max_workers, async_concurrency))
+        
+        self.request_timeout = 30  # Timeout 30 giây cho mỗi request
+        # Deadline từng request, hedge request chậm hơn p95 (phải có slot của limiter),
+        # circuit breaker khi backend lỗi liên tục
+        self.resilience = ResilientCaller(deadline=self.request_timeout,
+                                          max_threads=2 * max(self.max_workers,
+                                                              self.backend.max_concurrency),
+                                          limiter=self.limiter)
+        
+        # Che số, URL, mã... bằng placeholder để tăng tỉ lệ trúng cache
+        self.masking = True
+        self.masker = PlaceholderMasker()
+        # Bảng thuật ngữ (giữ nguyên / dịch cố định), None nếu không dùng
+        self.glossary: Optional[Glossary] = None
+        
+        # Bỏ qua segment không cần dịch (số, URL, code, công thức, đã là tiếng Việt)
+        self.classify_segments = True
+        self.classifier = SegmentClassifier()
+        
+        # Tra gần đúng trong bộ nhớ dịch: câu giống >= fuzzy_flag_threshold được ghi vào
+        # fuzzy_matches để xem lại, vẫn dịch mới. Chỉ dùng lại bản dịch khi bật fuzzy_reuse,
+        # giống >= fuzzy_threshold và không khác từ nào (chỉ khác dấu câu, hoa/thường) -
+        # khác một từ có thể ngược nghĩa ("must start" / "must not start")
+        self.fuzzy_lookup = True
+        self.fuzzy_reuse = False
+        self.fuzzy_threshold = 0.95
+        self.fuzzy_flag_threshold = 0.85
+        self.fuzzy_matches: List[Tuple[str, str, float, bool]] = []  # (câu, câu đã lưu, độ giống, dùng lại)
+        
+        # Các thread cùng cần một key thì chỉ một thread gửi request
+        self.inflight = SingleFlight()
+        # Thống kê của lần translate_batch gần nhất (cho GUI / log)
+        self.job_stats: Dict[str, int] = {}
+        self._coalesced_before = 0
+        self._failed_before = 0
+        
+        # Engine dịch: "thread" (mặc định) hoặc "async" (modules/async_engine.py)
+        self.engine = "thread"
+        self.async_concurrency = async_concurrency
+        self._async_engine = None
+        self.set_engine(engine)
+    
+    def _open_memory(self) -> TranslationMemory:
+        """Mở bộ nhớ dịch mặc định, lỗi thì dùng file tạm"""
+        try:
+            return TranslationMemory()
+        except (sqlite3.Error, OSError) as e:
+            print(f"⚠ Không mở được bộ nhớ dịch ({e}), dùng file tạm")
+            fallback = os.path.join(tempfile.gettempdir(), "pdf_translator_tm.db")
+            return TranslationMemory(db_path=fallback)
+    
+    def _get_translator(self) -> TranslationBackend:
+        """Backend dùng để dịch (an toàn khi gọi từ nhiều thread)"""
+        return self.backend
+    
+    def _normalize_text(self, text: str) -> str:
+        """Chuẩn hóa text để cache hiệu quả hơn (gộp khoảng trắng, GIỮ chữ hoa/thường)"""
+        return " ".join(text.split())
+    
+    def _mask(self, text: str) -> Tuple[str, List[str]]:
+        """Text -> (template có placeholder, giá trị gốc / bản dịch cố định của thuật ngữ)"""
+        spans = self.glossary.find(text) if self.glossary else []
+        if not self.masking and not spans:
+            return text, []
+        return self.masker.mask(text, spans, patterns=self.masking)
+    
+    def set_glossary(self, path: Optional[str]):
+        """Nạp bảng thuật ngữ từ file (None để bỏ)"""
+        self.glossary = Glossary.load(path) if path else None
+    
+    def _lookup_many(self, keys) -> Dict[str, str]:
+        """Tra bộ nhớ dịch: khớp hoàn toàn trước, sau đó tra gần đúng cho key còn thiếu"""
+        keys = set(keys)
+        found = self.memory.get_many(keys)
+        missing = keys - found.keys()
+        if not missing or not self.fuzzy_lookup:
+            return found
+        
+        matches = self.memory.fuzzy_get_many(
+            missing, threshold=min(self.fuzzy_threshold, self.fuzzy_flag_threshold))
+        for key, (target, score, source) in matches.items():
+            reuse = (self.fuzzy_reuse and score >= self.fuzzy_threshold and
+                     not MinHashLSH.word_diff(key, source) and self.masker.is_intact(key, target))
+            self.fuzzy_matches.append((key, source, round(score, 3), reuse))
+            if reuse:
+                found[key] = target
+        return found
+    
+    def _safe_translate(self, translator, text: str, max_retries: int = 3) -> str:
+        """Dịch với retry và xử lý lỗi"""
+        if not text or not text.strip():
+            return text
+        return self._call_with_retry(lambda: translator.translate(text), text, max_retries,
+                                     size=len(text))
+    
+    def _call_with_retry(self, call, fallback, max_retries: int = 3, size: int = 0):
+        """
+        Gọi backend qua rate limiter, retry theo loại lỗi; thất bại thì trả về fallback
+        size: số ký tự gửi đi (cho autotuner)
+        """
+        permanent = False
+        for attempt in range(max_retries):
+            if not self.resilience.wait_until_allowed():
+                print("Backend lỗi liên tục (circuit breaker đang mở), giữ text gốc")
+                break
+            try:
+                with self.limiter.slot():
+                    with self._stats_lock:
+                        self.api_calls += 1
+                    start = time.perf_counter()
+                    result = self.resilience.call(call)
+                if result:
+                    self.autotuner.record(size, time.perf_counter() - start, ok=True)
+                    self.limiter.on_success()
+                    return result
+            except Exception as e:
+                kind = classify_error(e)
+                retry_after = getattr(e, "retry_after", None)
+                self.autotuner.record(size, 0.0, ok=False, kind=kind)
+                self.limiter.on_error(kind, retry_after)
+                
+                # Chỉ in lỗi đầu tiên để tránh spam log
+                if attempt == 0:
+                    print(f"Lỗi dịch [{kind}] (sẽ retry): {str(e)[:100]}")
+                if kind == CLIENT:
+                    permanent = True
+                    break  # Input không hợp lệ, retry cũng vậy
+                if attempt < max_retries - 1:
+                    # Backoff lũy thừa có jitter (hoặc theo Retry-After)
+                    time.sleep(self.limiter.backoff(attempt, retry_after))
+        
+        if not permanent:
+            self._record_failure()
+        return fallback  # Trả về text gốc nếu thất bại
+    
+    def _record_failure(self, count: int = 1):
+        """
+        Đếm request / batch thất bại tạm thời (mạng, hết lượt retry, circuit breaker mở):
+        đoạn liên quan giữ text gốc và có thể dịch lại khi chạy tiếp job
+        """
+        with self._stats_lock:
+            self.failed_requests += count
+    
+    def translate_text(self, text: str) -> str:
+        """Dịch văn bản từ English sang Vietnamese"""
+        if not text or not text.strip():
+            return text
+        if self.classify_segments and not self.classifier.should_translate(text):
+            return text
+        
+        # Kiểm tra cache (theo template đã mask)
+        template, values = self._mask(text)
+        if values and not any(c.isalpha() for c in template):
+            # Chỉ còn placeholder (ví dụ cả dòng là một thuật ngữ) - không cần gọi API
+            return self.masker.unmask(template, values) or text
+        cache_key = self._normalize_text(template)
+        cached = self._lookup_many([cache_key]).get(cache_key)
+        if cached is not None:
+            restored = self.masker.unmask(cached, values)
+            if restored is not None:
+                return restored
+        
+        def translate():
+            translator = self._get_translator()
+            
+            if len(template) <= self.max_chunk_size:
+                result = self._safe_translate(translator, template)
+            else:
+                result = self._translate_long_text(template, translator)
+            
+            # Lưu vào cache (không lưu khi dịch lỗi hoặc làm hỏng placeholder)
+            if result != template and self.masker.is_intact(template, result):
+                self.memory.put(cache_key, result)
+                return result
+            return None
+        
+        try:
+            # Nếu thread khác đang dịch đúng text này thì chờ dùng chung kết quả
+            result = self.inflight.do(cache_key, translate)
+            restored = self.masker.unmask(result, values) if result is not None else None
+            return restored if restored is not None else text
+            
+        except Exception as e:
+            print(f"Lỗi khi dịch: {e}")
+            return text
+    
+    def _translate_long_text(self, text: str, translator) -> str:
+        """Dịch văn bản dài bằng cách chia nhỏ"""
+        sentences = self._split_into_sentences(text)
+        translated_parts = []
+        current_chunk = ""
+        
+        for sentence in sentences:
+            if len(current_chunk) + len(sentence) > self.max_chunk_size:
+                if current_chunk:
+                    translated_parts.append(self._safe_translate(translator, current_chunk))
+                current_chunk = sentence
+            else:
+                current_chunk += sentence
+        
+        if current_chunk:
+            translated_parts.append(self._safe_translate(translator, current_chunk))
+        
+        return " ".join(translated_parts)
+    
+    def _split_into_sentences(self, text: str) -> List[str]:
+        """Chia văn bản thành các câu"""
+        sentences = re.split(r'([.!?\n]+\s*)', text)
+        result = []
+        for i in range(0, len(sentences) - 1, 2):
+            if i + 1 < len(sentences):
+                result.append(sentences[i] + sentences[i + 1])
+            else:
+                result.append(sentences[i])
+        if len(sentences) % 2 == 1:
+            result.append(sentences[-1])
+        return [s for s in result if s.strip()]
+    
+    def _create_batches(self, texts: List[str], batch_char_limit: int = 3000) -> List[List[tuple]]:
+        """Gộp nhiều text ngắn vào 1 batch để giảm số lần gọi API"""
+        batches = []
+        current_batch = []
+        current_length = 0
+        
+        for i, text in enumerate(texts):
+            text_len = len(text) if text else 0
+            
+            if text_len > batch_char_limit:
+                if current_batch:
+                    batches.append(current_batch)
+                    current_batch = []
+                    current_length = 0
+                batches.append([(i, text)])
+            elif current_length + text_len + 10 > batch_char_limit:
+                if current_batch:
+                    batches.append(current_batch)
+                current_batch = [(i, text)]
+                current_length = text_len
+            else:
+                current_batch.append((i, text))
+                current_length += text_len + 10
+        
+        if current_batch:
+            batches.append(current_batch)
+        
+        return batches
+    
+    def _pack_segments(self, items: List[tuple]) -> str:
+        """Gộp nhiều (idx, text) thành một chuỗi có đánh dấu theo vị trí trong batch"""
+        return "\n".join(
+            f"{PACK_MARKER.format(pos)} {text.strip()}" for pos, (_, text) in enumerate(items)
+        )
+    
+    def _unpack_segments(self, translated: str, count: int) -> List[Optional[str]]:
+        """
+        Tách kết quả dịch theo đánh dấu
+        
+        Trả về list dài `count`, phần tử None là đoạn bị hỏng (mất/gộp/lặp đánh dấu).
+        Một đoạn chỉ được nhận khi đánh dấu của nó và đánh dấu kế tiếp đều đúng thứ tự,
+        vì khi Google gộp 2 đoạn thì nội dung đoạn sau nằm lẫn trong đoạn trước.
+        """
+        parts: List[Optional[str]] = [None] * count
+        matches = list(PACK_MARKER_RE.finditer(translated))
+        positions = [int(m.group(1)) for m in matches]
+        
+        for k, m in enumerate(matches):
+            pos = positions[k]
+            if pos >= count or positions.count(pos) != 1:
+                continue
+            
+            if k + 1 < len(matches):
+                if positions[k + 1] != pos + 1:
+                    continue
+                end = matches[k + 1].start()
+            else:
+                if pos != count - 1:
+                    continue
+                end = len(translated)
+            
+            segment = translated[m.end():end].strip()
+            if segment:
+                parts[pos] = segment
+        
+        # Text trước đánh dấu đầu tiên nghĩa là đoạn 0 đã bị xáo trộn
+        if matches and translated[:matches[0].start()].strip() and parts[0] is not None:
+            parts[0] = None
+        
+        return parts
+    
+    def _translate_packed(self, translator, items: List[tuple]) -> List[tuple]:
+        """
+        Dịch nhiều text trong MỘT request, tách lại theo index gốc
+        Đoạn nào bị hỏng đánh dấu thì chia đôi phần hỏng và dịch lại (bisect)
+        """
+        if len(items) == 1:
+            idx, text = items[0]
+            return [(idx, self._translate_single(translator, text))]
+        
+        if translator.supports_batch:
+            # Backend tự dịch cả batch trong một request, không cần đánh dấu
+            texts = [text for _, text in items]
+            translated = self._call_with_retry(lambda: translator.translate_batch(texts), texts,
+                                               size=sum(len(t) for t in texts))
+            return list(zip((idx for idx, _ in items), translated))
+        
+        packed = self._pack_segments(items)
+        translated = self._safe_translate(translator, packed)
+        
+        if translated == packed:
+            # Request thất bại hoàn toàn - chia nhỏ chỉ làm tăng số request lỗi
+            return list(items)
+        
+        parts = self._unpack_segments(translated, len(items))
+        results = []
+        broken = []
+        for (idx, text), part in zip(items, parts):
+            if part is None:
+                broken.append((idx, text))
+            else:
+                results.append((idx, part))
+        self.autotuner.record_packing(len(packed), len(items), len(broken))
+        
+        if broken:
+            mid = len(broken) // 2
+            for half in (broken[:mid], broken[mid:]):
+                if half:
+                    results.extend(self._translate_packed(translator, half))
+        
+        return results
+    
+    def _translate_single(self, translator, text: str) -> str:
+        """Dịch một text (dài thì chia câu)"""
+        if len(text) > self.max_chunk_size:
+            return self._translate_long_text(text, translator)
+        return self._safe_translate(translator, text)
+    
+    def _translate_batch_texts(self, batch: List[tuple], batch_id: int,
+                               check_cache: bool = True) -> List[tuple]:
+        """Dịch một batch các text với xử lý lỗi tốt hơn
+        
+        check_cache=False khi translate_batch đã tra bộ nhớ dịch cho cả tài liệu
+        """
+        results = []
+        
+        try:
+            translator = self._get_translator()
+            
+            # Kiểm tra cache trước (một truy vấn cho cả batch)
+            texts_to_translate = []
+            non_empty = [(idx, text) for idx, text in batch if text and text.strip()]
+            cached = {}
+            if check_cache and non_empty:
+                cached = self._lookup_many(
+                    self._normalize_text(text) for _, text in non_empty)
+            
+            for idx, text in batch:
+                if not text or not text.strip():
+                    results.append((idx, text))
+                else:
+                    cache_key = self._normalize_text(text)
+                    if cache_key in cached:
+                        results.append((idx, cached[cache_key]))
+                    else:
+                        texts_to_translate.append((idx, text))
+            
+            if not texts_to_translate:
+                return results
+            
+            # Single-flight: key nào thread khác đang dịch thì chờ thay vì gửi trùng
+            leaders = []
+            followers = []
+            for idx, text in texts_to_translate:
+                is_leader, call = self.inflight.acquire(self._normalize_text(text))
+                if is_leader:
+                    leaders.append((idx, text))
+                else:
+                    followers.append((idx, text, call))
+            
+            originals = dict(leaders)
+            translated_items = []
+            
+            try:
+                if self.packed_requests and len(leaders) > 1:
+                    # Gộp cả batch vào một request
+                    translated_items = self._translate_packed(translator, leaders)
+                else:
+                    # Dịch từng text một
+                    for idx, text in leaders:
+                        try:
+                            translated_items.append((idx, self._translate_single(translator, text)))
+                        except Exception as e:
+                            print(f"Lỗi dịch text {idx}: {e}")
+                            self._record_failure()
+                            translated_items.append((idx, text))
+                
+                # Placeholder bị mất/gộp khi dịch cả batch -> dịch riêng đoạn đó một lần nữa
+                for pos, (idx, translated) in enumerate(translated_items):
+                    if translated != originals[idx] and \
+                            not self.masker.is_intact(originals[idx], translated):
+                        translated_items[pos] = (
+                            idx, self._translate_single(translator, originals[idx]))
+                
+                # Cache kết quả (chỉ khi còn nguyên placeholder). Bản dịch vẫn hỏng placeholder
+                # được trả về nguyên trạng, _restore sẽ dịch lại text gốc không mask
+                self.memory.put_many(
+                    (self._normalize_text(originals[idx]), translated)
+                    for idx, translated in translated_items
+                    if translated != originals[idx]
+                    and self.masker.is_intact(originals[idx], translated)
+                )
+            finally:
+                # Luôn đánh thức các thread đang chờ (None = thất bại)
+                done = dict(translated_items)
+                for idx, text in leaders:
+                    translated = done.get(idx)
+                    self.inflight.resolve(self._normalize_text(text),
+                                          translated if translated != text else None)
+            
+            results.extend(translated_items)
+            for idx, text, call in followers:
+                shared = self.inflight.wait(call, timeout=600)
+                results.append((idx, shared if shared is not None else text))
+            
+        except Exception as e:
+            print(f"Lỗi batch {batch_id}: {e}")
+            self._record_failure()
+            # Trả về text gốc nếu lỗi
+            for idx, text in batch:
+                if idx not in [r[0] for r in results]:
+                    results.append((idx, text))
+        
+        return results
+    
+    def translate_batch(self, texts: List[str], delay: float = 0.1, 
+                       progress_callback: Optional[callable] = None) -> List[str]:
+        """
+        Dịch nhiều đoạn văn bản với TỐI ƯU HIỆU SUẤT
+        """
+        total = len(texts)
+        translated_texts = list(texts)  # Mặc định giữ text gốc
+        
+        for idx, translated in self.translate_batch_stream(texts, delay, progress_callback):
+            translated_texts[idx] = translated
+        
+        # Gọi callback lần cuối để đảm bảo 100%
+        if progress_callback:
+            progress_callback(total, total)
+        
+        return translated_texts
+    
+    def translate_batch_stream(self, texts: List[str], delay: float = 0.1,
+                               progress_callback: Optional[callable] = None
+                               ) -> Iterator[Tuple[int, str]]:
+        """
+        Dịch nhiều đoạn, trả về (index, bản dịch) NGAY khi từng đoạn xong
+        
+        Thứ tự không theo index: text có sẵn trong bộ nhớ dịch ra trước, sau đó theo
+        batch nào xong trước. Mỗi index được trả về đúng một lần (lỗi thì là text gốc).
+        Dùng modules.streaming.iter_completed_pages để nhận theo từng trang.
+        """
+        # delay chỉ là tốc độ khởi đầu, limiter sẽ tự tăng/giảm theo phản hồi backend
+        self.request_delay = delay
+        # Nếu đã học được tốc độ / cửa sổ phù hợp từ lần chạy trước thì bắt đầu từ đó
+        default_rate = 1.0 / delay if delay > 0 else self.limiter.max_rate
+        default_window = self.max_workers if self.engine == "thread" else self.limiter.window
+        self.limiter.reset(rate=self.autotuner.start_rate(default_rate, self.engine),
+                           window=self.autotuner.start_window(default_window, self.engine))
+        self.autotuner.reset()
+        self.resilience.reset_stats()
+        
+        if self.engine == "async":
+            yield from self._get_async_engine().translate_stream(texts, progress_callback)
+            return
+        
+        calls_before = self.api_calls
+        total = len(texts)
+        completed_count = 0
+        
+        plan = self._plan_batches(texts)
+        batches = plan.batches
+        
+        # Text đã có trong bộ nhớ dịch (hoặc rỗng) trả về ngay
+        for item in plan.ready:
+            completed_count += 1
+            yield item
+        if progress_callback and completed_count:
+            progress_callback(completed_count, total)
+        
+        def process_batch(batch_data):
+            batch_id, batch = batch_data
+            try:
+                return self._translate_batch_texts(batch, batch_id, check_cache=False)
+            except Exception as e:
+                print(f"Lỗi xử lý batch {batch_id}: {e}")
+                self._record_failure()
+                return list(batch)  # Giữ text gốc
+        
+        # Chạy song song với timeout
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        future_to_batch = {
+            executor.submit(process_batch, (i, batch)): (i, batch) 
+            for i, batch in enumerate(batches)
+        }
+        
+        try:
+            # Đợi với timeout và xử lý lỗi
+            try:
+                for future in as_completed(future_to_batch, timeout=7200):  # Timeout 2 giờ
+                    batch_id, batch = future_to_batch.pop(future)
+                    try:
+                        results = future.result(timeout=600)  # Timeout 10 phút mỗi batch
+                    except Exception as e:
+                        print(f"Lỗi batch {batch_id}: {e}")
+                        self._record_failure()
+                        results = []
+                    
+                    for item in self._finish_batch(plan, batch, results):
+                        completed_count += 1
+                        yield item
+                    
+                    # Cập nhật progress
+                    if progress_callback:
+                        progress_callback(completed_count, total)
+            except TimeoutError:
+                print(f"\nCảnh báo: Đã timeout tổng thể, xử lý các batch còn lại...")
+                # Giữ text gốc cho các batch chưa hoàn thành
+                for future, (batch_id, batch) in list(future_to_batch.items()):
+                    print(f"Batch {batch_id} chưa xong, giữ text gốc")
+                    self._record_failure()
+                    future_to_batch.pop(future)
+                    yield from self._finish_batch(plan, batch, [])
+        finally:
+            # Người dùng dừng sớm (đóng generator) -> hủy các batch chưa chạy
+            for future in future_to_batch:
+                future.cancel()
+            executor.shutdown(wait=False)
+            self._report_stats(total, calls_before)
+    
+    def _plan_batches(self, texts: List[str]) -> _BatchPlan:
+        """
+        Lập kế hoạch dịch cả tài liệu:
+        1. Text dài hơn max_chunk_size -> chia câu, mỗi câu là một đơn vị dịch riêng
+        2. Mask số/URL/mã -> template, khóa cache theo template
+        3. Tra bộ nhớ dịch một lần cho cả tài liệu (câu nào có sẵn thì khỏi dịch lại)
+        4. Gộp các template trùng nhau thành một đơn vị dịch
+        5. Gộp phần chưa có thành các batch giữ index gốc
+        """
+        self.memory.reset_stats()
+        self.classifier.reset_stats()
+        self.fuzzy_matches = []
+        total = len(texts)
+        units = list(texts)
+        plan = _BatchPlan(texts=units)
+        
+        # Đơn vị câu của text dài được thêm vào cuối danh sách, dùng chung scheduler
+        for i, text in enumerate(texts):
+            if text and len(text) > self.max_chunk_size:
+                sentences = self._split_into_sentences(text)
+                plan.parts[i] = list(range(len(units), len(units) + len(sentences)))
+                for unit, sentence in zip(plan.parts[i], sentences):
+                    plan.owner[unit] = i
+                    plan.separators[unit] = sentence[len(sentence.rstrip()):]
+                plan.partial[i] = {}
+                units.extend(sentences)
+        
+        templates: Dict[int, str] = {}
+        keys: Dict[int, str] = {}
+        direct: Dict[int, str] = {}  # Kết quả có ngay không cần dịch
+        for i, text in enumerate(units):
+            if i not in plan.parts and text and text.strip():
+                if self.classify_segments and not self.classifier.should_translate(text):
+                    continue  # Giữ nguyên như text rỗng
+                template, values = self._mask(text)
+                if values and not any(c.isalpha() for c in template):
+                    # Chỉ còn placeholder (ví dụ cả dòng là một thuật ngữ)
+                    direct[i] = self.masker.unmask(template, values) or text
+                    continue
+                templates[i] = template
+                keys[i] = self._normalize_text(template)
+                if values:
+                    plan.values[i] = values
+        
+        cached = self._lookup_many(keys.values())
+        ready = []
+        pending = []
+        first_index: Dict[str, int] = {}
+        cached_count = 0
+        for i, text in enumerate(units):
+            if i in plan.parts:
+                continue
+            key = keys.get(i)
+            if key is None:
+                ready.append((i, direct.get(i, text)))  # Text rỗng / không cần dịch giữ nguyên
+                continue
+            
+            if key in cached:
+                restored = self.masker.unmask(cached[key], plan.values.get(i, []))
+                if restored is not None:
+                    ready.append((i, restored))
+                    cached_count += 1
+                    continue
+            
+            if key in first_index:
+                plan.duplicates.setdefault(first_index[key], []).append(i)
+            else:
+                first_index[key] = i
+                pending.append((i, templates[i]))
+        
+        plan.ready = list(self._route(plan, ready))
+        plan.batches = [
+            [(pending[j][0], t) for j, t in batch]
+            for batch in self._create_batches([t for _, t in pending],
+                                              batch_char_limit=self.autotuner.batch_char_limit)
+        ]
+        
+        duplicate_count = sum(len(d) for d in plan.duplicates.values())
+        skipped = self.classifier.stats()
+        self.job_stats = {
+            "texts": total,
+            "skipped": sum(skipped.values()),
+            "cached": cached_count,
+            "duplicates": duplicate_count,
+            "masked": len(plan.values),
+            "long_texts": len(plan.parts),
+            "sentence_units": len(plan.owner),
+            "coalesced": 0,
+            "api_calls": 0,
+            "failed": 0,
+        }
+        self._coalesced_before = self.inflight.coalesced
+        self._failed_before = self.failed_requests
+        
+        if skipped:
+            detail = ", ".join(f"{kind}: {n}" for kind, n in sorted(skipped.items()))
+            print(f"Không cần dịch: {sum(skipped.values())} đoạn ({detail})")
+        print(f"Tối ưu: {total} text -> {cached_count} có sẵn, "
+              f"{duplicate_count} trùng lặp ({len(plan.values)} text có mask), "
+              f"{len(plan.parts)} text dài chia thành {len(plan.owner)} câu, "
+              f"{len(plan.batches)} batches")
+        return plan
+    
+    def _restore(self, plan: _BatchPlan, idx: int, translated: Optional[str]) -> str:
+        """Bản dịch của template -> kết quả cuối cho text idx (lỗi thì trả về text gốc)"""
+        if translated is None:
+            return plan.texts[idx]
+        restored = self.masker.unmask(translated, plan.values.get(idx, []))
+        if restored is not None:
+            return restored
+        return self._translate_unmasked(plan.texts[idx])
+    
+    def _translate_unmasked(self, text: str) -> str:
+        """
+        Backend làm hỏng placeholder cả sau lần dịch lại: dịch text gốc không mask
+        (không lưu bộ nhớ dịch vì khóa cache là template). Thất bại thì giữ text gốc
+        và tính là request lỗi để job có thể tiếp tục sau
+        """
+        try:
+            return self._translate_single(self._get_translator(), text)
+        except Exception as e:
+            print(f"Lỗi dịch text không mask: {e}")
+            self._record_failure()
+            return text
+    
+    def _route(self, plan: _BatchPlan, items) -> Iterator[Tuple[int, str]]:
+        """
+        Chuyển kết quả đơn vị dịch thành kết quả cho người gọi:
+        đơn vị câu được gom lại, text dài chỉ được trả về khi đủ mọi câu (đúng thứ tự)
+        """
+        for idx, translated in items:
+            owner = plan.owner.get(idx)
+            if owner is None:
+                yield idx, translated
+                continue
+            
+            collected = plan.partial[owner]
+            collected[idx] = translated.strip()
+            if len(collected) == len(plan.parts[owner]):
+                del plan.partial[owner]
+                # Ghép lại bằng đúng khoảng trắng / xuống dòng của text gốc
+                parts = plan.parts[owner]
+                yield owner, "".join(collected[u] + plan.separators[u] for u in parts[:-1]) \
+                    + collected[parts[-1]]
+    
+    def _finish_batch(self, plan: _BatchPlan, batch: List[tuple],
+                      results: List[tuple]) -> Iterator[Tuple[int, str]]:
+        """Trả kết quả của một batch, kèm các index trùng; index thiếu/lỗi dùng text gốc"""
+        done = dict(results)
+        
+        def restored():
+            for idx, template in batch:
+                translated = done.get(idx)
+                if not translated or translated == template:
+                    translated = None
+                for i in [idx] + plan.duplicates.get(idx, []):
+                    yield i, self._restore(plan, i, translated)
+        
+        return self._route(plan, restored())
+    
+    def _report_stats(self, total: int, calls_before: int):
+        """In số request đã gửi và hiệu quả của bộ nhớ dịch / khử trùng lặp"""
+        self.job_stats["api_calls"] = self.api_calls - calls_before
+        self.job_stats["coalesced"] = self.inflight.coalesced - self._coalesced_before
+        self.job_stats["failed"] = self.failed_requests - self._failed_before
+        print(f"Số request đã gửi: {self.api_calls - calls_before} cho {total} text")
+        if self.job_stats["failed"]:
+            print(f"⚠ {self.job_stats['failed']} request thất bại, các đoạn liên quan giữ text gốc")
+        print(f"Khử trùng lặp: {self.job_stats.get('duplicates', 0)} đoạn trùng dùng chung bản dịch, "
+              f"{self.job_stats['coalesced']} đoạn chờ request đang chạy")
+        limiter = self.limiter.stats()
+        print(f"Rate limiter: {limiter['rate']} req/s, cửa sổ {limiter['window']}, "
+              f"throttle {limiter['errors_throttle']}, timeout {limiter['errors_timeout']}, "
+              f"lỗi server {limiter['errors_server']}")
+        resilience = self.resilience.stats()
+        for name in ("p50", "p95", "p99", "hedges", "hedge_wins", "timeouts", "breaker_trips"):
+            self.job_stats[name] = resilience[name]
+        print(f"Độ trễ request: p50 {resilience['p50']}s, p95 {resilience['p95']}s, "
+              f"p99 {resilience['p99']}s; hedge {resilience['hedges']} "
+              f"(về trước {resilience['hedge_wins']}), quá hạn {resilience['timeouts']}, "
+              f"circuit breaker mở {resilience['breaker_trips']} lần")
+        if self.job_stats["api_calls"]:
+            self.autotuner.finish(limiter, self.engine)
+        reused = sum(1 for m in self.fuzzy_matches if m[3])
+        self.job_stats["fuzzy_reused"] = reused
+        self.job_stats["fuzzy_flagged"] = len(self.fuzzy_matches) - reused
+        if self.fuzzy_matches:
+            print(f"Tra gần đúng: dùng lại {reused} bản dịch, "
+                  f"{len(self.fuzzy_matches) - reused} câu tương tự cần xem lại")
+        stats = self.memory.stats()
+        print(f"Hoàn thành! Bộ nhớ dịch: {stats['hits']} hit / {stats['misses']} miss "
+              f"({stats['hit_rate']:.0%}), đã lưu thêm {stats['writes']} bản dịch")
+    
+    def _get_async_engine(self):
+        """Tạo (một lần) engine asyncio"""
+        if self._async_engine is None:
+            from modules.async_engine import AsyncTranslationEngine
+            self._async_engine = AsyncTranslationEngine(
+                self, concurrency=self.async_concurrency)
+        return self._async_engine
+    
+    def set_engine(self, engine: str, concurrency: Optional[int] = None):
+        """
+        Chọn engine dịch cho translate_batch
+        
+        Args:
+            engine: "thread" (ThreadPoolExecutor) hoặc "async" (asyncio + kết nối keep-alive)
+            concurrency: Số request đồng thời của engine async (không phụ thuộc số core)
+        """
+        if engine not in ("thread", "async"):
+            raise ValueError(f"Engine không hợp lệ: {engine}")
+        self.engine = engine
+        if concurrency:
+            self.async_concurrency = concurrency
+            self._async_engine = None